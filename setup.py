@@ -32,7 +32,17 @@ setup(
     package_dir={'': 'src'},
     package_data={'g4s.cbgrn': ['templates/*.xml']},
     keywords='calendar synchronization',
-    classifiers=[],
+    classifiers=[
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+    ],
+    python_requires='>=3.7',
+    extras_require={'vectorized': ['numpy']},
     tests_require=['pytest'],
     cmdclass={'test': PyTest},
 )
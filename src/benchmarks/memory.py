@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures peak and retained memory of event retrieval and mapping.
+
+Run from ``src`` directory::
+
+    python -m benchmarks.memory                              # compares with the baseline
+    python -m benchmarks.memory --sizes 100000 --save report.json
+    python -m benchmarks.memory --sizes 10000 --top 5        # shows top allocation sites
+
+The stages follow :py:meth:`g4s.cbgrn.api.CybozuGaroonApi.get_events` of the whole calendar,
+which receives a streamed ``ScheduleGetEvents`` response from
+:py:class:`tests.garoon_server.GaroonServer`:
+
+* ``response``: the response body is received and decoded in chunks, and dropped
+* ``elements``: ``schedule_event`` elements are parsed incrementally and dropped, so that the
+  stage shows how many elements and buffers of the parser are resident at once
+* ``events``: the elements are converted into :py:class:`g4s.core.model.Event` objects, which
+  share participants of the request and are retained
+* ``mapping``: the result of :py:func:`g4s.core.sync.perform_event_mapping` of the retrieved
+  events, which compares every pair of events, so that it is measured with at most
+  ``--mapping-size`` events in each calendar
+
+Nothing of a streamed response is kept, so each retrieval stage sends its own request and also
+includes the stages before it; a regression belongs to the first stage which grows. The server
+runs in a child process, so that rendering and sending the response are not counted.
+
+Memory allocated by Python is measured with :py:mod:`tracemalloc`. Elements being parsed are
+allocated by libxml2, which is invisible to tracemalloc, so resident set size is also reported
+where ``/proc`` is available. Only tracemalloc figures are compared with the baseline, since they
+do not depend on the allocator and the operating system. Tracing slows the stages down several
+times; elapsed time is measured by ``benchmarks.suite``. Python 3.9 or later is required.
+"""
+
+import argparse
+import collections
+import contextlib
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tracemalloc
+import g4s.cbgrn.api
+from g4s.cbgrn.api import CybozuGaroonApi
+from g4s.core.sync import perform_event_mapping
+from tests.dataset import CalendarDataset
+from tests.garoon_server import GaroonServer
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'memory_baseline.json')
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_MAPPING_SIZE = 1000
+
+# size of reads from the response, which is the size lxml reads while parsing
+_CHUNK_SIZE = 32 * 1024
+
+# stages which allocate little are not regressed by growth smaller than this
+_MIN_REGRESSION_BYTES = 64 * 1024
+
+Measurement = collections.namedtuple('Measurement', ('peak', 'retained', 'rss', 'top'))
+"""
+Memory used by a stage in bytes. ``peak`` and ``retained`` are measured with tracemalloc relative
+to the memory traced before the stage, ``rss`` is growth of resident set size (:py:const:`None`
+if unknown), and ``top`` is a list of the largest allocation sites of retained memory.
+"""
+
+
+def get_rss():
+    """
+    Returns resident set size of this process in bytes, or :py:const:`None` if it is unknown.
+    """
+
+    try:
+        with open('/proc/self/statm') as fin:
+            return int(fin.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def measure(function, top=0):
+    """
+    Calls the function while tracemalloc is tracing, and returns its result and
+    :py:class:`Measurement`.
+    """
+
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot() if top else None
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    rss_before = get_rss()
+
+    result = function()
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    rss_after = get_rss()
+
+    sites = []
+    if top:
+        statistics = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+        sites = [str(s) for s in statistics[:top]]
+
+    rss = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return result, Measurement(peak - before, current - before, rss, sites)
+
+
+def serve(size, connection):
+    """
+    Serves the dataset of the specified size until anything is received from the connection.
+    The URL of the server is sent to the connection first.
+    """
+
+    with GaroonServer(CalendarDataset(size, seed=1).iter_event_infos()) as server:
+        connection.send(server.url)
+        connection.recv()
+
+
+@contextlib.contextmanager
+def start_server(size):
+    """
+    Starts :py:func:`serve` in a child process, and returns the URL of the server.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    connection, child_connection = context.Pipe()
+    process = context.Process(target=serve, args=(size, child_connection), daemon=True)
+    process.start()
+    try:
+        yield connection.recv()
+    finally:
+        connection.send(None)
+        process.join()
+
+
+def receive_response(api, start, end):
+    """
+    Receives a ``ScheduleGetEvents`` response in the same way as
+    :py:meth:`g4s.cbgrn.api.CybozuGaroonApi.execute_streaming_soap_request`, without parsing it,
+    and returns the number of decoded bytes.
+    """
+
+    request_text = api._render_request_body(
+        'ScheduleService', 'ScheduleGetEvents', dict(start=start, end=end))
+    response = api._send_soap_request(
+        'ScheduleService', 'ScheduleGetEvents', request_text, stream=True)
+    try:
+        stream = response.raw
+        stream.decode_content = True
+
+        size = 0
+        while True:
+            data = stream.read(_CHUNK_SIZE)
+            if not data:
+                return size
+            size += len(data)
+
+    finally:
+        response.close()
+        api._throttle.release()
+
+
+def parse_elements(api, start, end):
+    """
+    Parses ``schedule_event`` elements of a streamed response without converting them, and
+    returns the number of the elements.
+    """
+
+    nodes = api.execute_streaming_soap_request(
+        'ScheduleService', 'ScheduleGetEvents', dict(start=start, end=end), 'schedule_event')
+    return sum(1 for node in nodes)
+
+
+def run(size, mapping_size, top):
+    """
+    Runs the stages with a dataset of the specified size, and returns their measurements keyed
+    by ``stage[size]``. The mapping stage is keyed by its own size.
+    """
+
+    dataset = CalendarDataset(size, seed=1)
+    start, end = dataset.start, dataset.end
+    results = collections.OrderedDict()
+
+    with start_server(size) as url:
+        api = CybozuGaroonApi({'url': url, 'user': 'foo', 'password': 'bar'})
+
+        # WSDL, connections and modules which are loaded lazily are not counted
+        api.get_events(start, start + datetime.timedelta(minutes=1))
+
+        # occurrences cached by earlier runs would not be counted
+        g4s.cbgrn.api._occurrence_cache.clear()
+
+        received, results['response'] = measure(lambda: receive_response(api, start, end), top)
+        elements, results['elements'] = measure(lambda: parse_elements(api, start, end), top)
+        events, results['events'] = measure(lambda: api.get_events(start, end), top)
+
+    # a half of events are common, and the others are only in either calendar
+    events1 = events[:mapping_size]
+    events2 = events[mapping_size // 2:mapping_size // 2 + mapping_size]
+    mapping, results['mapping'] = measure(lambda: perform_event_mapping(events1, events2), top)
+
+    sizes = dict(response=size, elements=size, events=size, mapping=mapping_size)
+    counts = dict(
+        response=size, elements=elements, events=len(events),
+        mapping=len(events1) + len(events2))
+    return collections.OrderedDict(
+        ('{0}[{1}]'.format(stage, sizes[stage]), dict(
+            peak=m.peak, retained=m.retained, rss=m.rss, items=counts[stage], top=m.top))
+        for stage, m in results.items())
+
+
+def format_mib(value):
+    if value is None:
+        return '{0:>12s}'.format('-')
+
+    return '{0:12.2f}'.format(value / 1024.0 / 1024.0)
+
+
+def print_results(results):
+    print('{0:24s} {1:>12s} {2:>12s} {3:>12s} {4:>10s}'.format(
+        '', 'peak MiB', 'retained MiB', 'rss MiB', 'B/item'))
+
+    for key, result in results.items():
+        print('{0:24s} {1} {2} {3} {4:10.0f}'.format(
+            key, format_mib(result['peak']), format_mib(result['retained']),
+            format_mib(result['rss']), result['retained'] / max(result['items'], 1)))
+        for site in result['top']:
+            print('    {0}'.format(site))
+
+    sys.stdout.flush()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares peak and retained memory with the baseline, and returns keys of regressed stages.
+    Stages which are not in the baseline are ignored.
+    """
+
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            print('{0:24s} no baseline'.format(key))
+            continue
+
+        names = ('peak', 'retained')
+        ratios = [result[name] / max(expected[name], 1) for name in names]
+        regressed = any(
+            ratio > 1.0 + tolerance and result[name] - expected[name] > _MIN_REGRESSION_BYTES
+            for name, ratio in zip(names, ratios))
+        if regressed:
+            regressions.append(key)
+
+        print('{0:24s} peak {1:5.2f}x  retained {2:5.2f}x baseline {3}'.format(
+            key, ratios[0], ratios[1], 'REGRESSED' if regressed else ''))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of events')
+    parser.add_argument(
+        '--mapping-size', type=int, default=DEFAULT_MAPPING_SIZE,
+        help='maximum number of events in each calendar of the mapping stage')
+    parser.add_argument(
+        '--top', type=int, default=0, help='number of allocation sites shown for each stage')
+    parser.add_argument('--save', help='file to write the report to as JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='allowed growth relative to the baseline (default: 0.1 for 10%%)')
+    args = parser.parse_args()
+
+    if not hasattr(tracemalloc, 'reset_peak'):
+        parser.error('Python 3.9 or later is required to measure peaks of stages')
+
+    # frames are kept only as many as needed, since they cost memory and time
+    tracemalloc.start(1)
+    results = collections.OrderedDict()
+    try:
+        for size in args.sizes:
+            results.update(run(size, min(size, args.mapping_size), args.top))
+    finally:
+        tracemalloc.stop()
+
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as fout:
+            document = dict(
+                python=platform.python_version(), machine=platform.machine(),
+                mapping_size=args.mapping_size, results=results)
+            json.dump(document, fout, indent=2, sort_keys=True)
+            fout.write('\n')
+
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('baseline is not found: {0}'.format(args.baseline))
+        return 0
+
+    with open(args.baseline) as fin:
+        baseline = json.load(fin)['results']
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('{0} stage(s) regressed: {1}'.format(len(regressions), ', '.join(regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures throughput of the Garoon ScheduleGetEvents response parser.
+
+Run from ``src`` directory::
+
+    python -m benchmarks.parse_events --events 50000
+"""
+
+import argparse
+import datetime
+import io
+import time
+import lxml.etree
+from g4s.cbgrn.api import CybozuGaroonApi
+
+
+_RESPONSE_HEAD = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"'
+    ' xmlns:schedule="http://wsdl.cybozu.co.jp/schedule/2008">'
+    '<soap:Header><vendor>Cybozu</vendor><product>Garoon</product></soap:Header>'
+    '<soap:Body><schedule:ScheduleGetEventsResponse><returns>')
+
+_RESPONSE_TAIL = '</returns></schedule:ScheduleGetEventsResponse></soap:Body></soap:Envelope>'
+
+_EVENT = (
+    '<schedule_event id="{id}" event_type="normal" public_type="public" detail="event {id}"'
+    ' description="description of event {id}" version="{version}" timezone="Asia/Tokyo"'
+    ' end_timezone="Asia/Tokyo" allday="false" start_only="false">'
+    '<members xmlns="http://schemas.cybozu.co.jp/schedule/2008">{members}</members>'
+    '<when xmlns="http://schemas.cybozu.co.jp/schedule/2008">'
+    '<datetime start="{start}" end="{end}"/></when>'
+    '</schedule_event>')
+
+_MEMBER = '<member><user id="{id}" name="user {id}" order="{order}"/></member>'
+
+
+def generate_response(event_count, member_count=3, shared_members=False):
+    """
+    Generates a synthetic ScheduleGetEvents response.
+
+    :param event_count:    number of events
+    :param member_count:   number of members of each event
+    :param shared_members: :py:const:`True` if all events have the same members (e.g. a weekly
+                           all-hands meeting), otherwise members are rotated among 500 users
+    :type  event_count:    int
+    :type  member_count:   int
+    :type  shared_members: bool
+
+    :rtype:  bytes
+    :return: SOAP response
+    """
+
+    origin = datetime.datetime(2014, 1, 1)
+    parts = [_RESPONSE_HEAD]
+    for x in range(event_count):
+        start = origin + datetime.timedelta(minutes=30 * x)
+        end = start + datetime.timedelta(hours=1)
+        offset = 0 if shared_members else x
+        members = ''.join(
+            _MEMBER.format(id=(offset + y) % 500 + 1, order=y) for y in range(member_count))
+
+        parts.append(_EVENT.format(
+            id=x + 1, version=1388534400 + x, members=members,
+            start=start.strftime('%Y-%m-%dT%H:%M:%SZ'), end=end.strftime('%Y-%m-%dT%H:%M:%SZ')))
+
+    parts.append(_RESPONSE_TAIL)
+    return ''.join(parts).encode('utf-8')
+
+
+def parse_in_memory(api, data):
+    response = api._parse_soap_response(data)
+    return tuple(api._create_event_parser(response.iter('schedule_event')))
+
+
+def parse_incrementally(api, data):
+    def iterate_nodes():
+        for event, node in lxml.etree.iterparse(io.BytesIO(data), tag='schedule_event'):
+            while node.getprevious() is not None:
+                del node.getparent()[0]
+
+            yield node
+            node.clear()
+
+    return tuple(api._create_event_parser(iterate_nodes()))
+
+
+def parse_in_processes(api, data):
+    nodes = lxml.etree.fromstring(data).iter('schedule_event')
+    return api._parse_events_in_processes(nodes, None, None)
+
+
+def look_up_children(api, nodes):
+    # node lookups which are performed by the parser, excluding date and model construction
+    return tuple(api._parse_members(node) for node in nodes)
+
+
+def measure(function, repeat):
+    """
+    Calls the function ``repeat`` times, and returns the best elapsed time and the result.
+    """
+
+    best = None
+    for x in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=50000, help='number of events')
+    parser.add_argument('--members', type=int, default=3, help='number of members per event')
+    parser.add_argument('--repeat', type=int, default=3, help='number of measurements')
+    parser.add_argument('--processes', type=int, default=4, help='number of worker processes')
+    parser.add_argument('--shard-size', type=int, default=2000, help='events per shard')
+    args = parser.parse_args()
+
+    api = CybozuGaroonApi({
+        'url': 'http://localhost/grn.cgi', 'user': 'foo', 'password': 'bar',
+        'parse_processes': args.processes, 'parse_shard_size': args.shard_size})
+    data = generate_response(args.events, args.members)
+    print('response: {0} events, {1:.1f} MiB'.format(args.events, len(data) / 1024.0 / 1024.0))
+
+    nodes = list(lxml.etree.fromstring(data).iter('schedule_event'))
+    benchmarks = (
+        ('in-memory', lambda: parse_in_memory(api, data)),
+        ('incremental', lambda: parse_incrementally(api, data)),
+        ('processes', lambda: parse_in_processes(api, data)),
+        ('members', lambda: look_up_children(api, nodes)),
+    )
+
+    for name, function in benchmarks:
+        elapsed, events = measure(function, args.repeat)
+        if len(events) != args.events:
+            raise RuntimeError('{0}: parsed {1} events.'.format(name, len(events)))
+
+        print('{0:12s} {1:8.3f} s {2:10.0f} events/s'.format(name, elapsed, len(events) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures memory retained by events parsed with and without participant interning.
+
+Run from ``src`` directory::
+
+    python -m benchmarks.participant_memory --events 200 --members 300
+"""
+
+import argparse
+import gc
+import tracemalloc
+import lxml.etree
+from g4s.cbgrn.api import CybozuGaroonApi
+from g4s.core.model import ParticipantPool
+from .parse_events import generate_response
+
+
+def parse(nodes, participant_pool):
+    return tuple(CybozuGaroonApi._create_event_parser(nodes, None, None, None, participant_pool))
+
+
+def measure_retained_memory(function):
+    """
+    Calls the function, and returns memory allocated by it and still retained, with the result.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return retained, peak, result
+
+
+def count_distinct(events):
+    participants = set(id(p) for e in events for p in e.participants)
+    member_tuples = set(id(e.participants) for e in events)
+    return len(participants), len(member_tuples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=200, help='number of events')
+    parser.add_argument('--members', type=int, default=300, help='number of members per event')
+    parser.add_argument(
+        '--rotate-members', action='store_true',
+        help='rotate members among 500 users instead of sharing them among all events')
+    args = parser.parse_args()
+
+    data = generate_response(args.events, args.members, not args.rotate_members)
+    nodes = list(lxml.etree.fromstring(data).iter('schedule_event'))
+    print('response: {0} events, {1} members per event'.format(args.events, args.members))
+
+    benchmarks = (
+        ('no pool', lambda: parse(nodes, None)),
+        ('pool', lambda: parse(nodes, ParticipantPool())),
+    )
+
+    for name, function in benchmarks:
+        retained, peak, events = measure_retained_memory(function)
+        participants, member_tuples = count_distinct(events)
+        print('{0:8s} retained {1:8.2f} MiB  peak {2:8.2f} MiB  {3:7d} participants  '
+              '{4:6d} member tuples'.format(
+                  name, retained / 1024.0 / 1024.0, peak / 1024.0 / 1024.0,
+                  participants, member_tuples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures the hot paths of date parsing, event parsing, event construction and synchronization,
+and compares the results with a stored baseline.
+
+Run from ``src`` directory::
+
+    python -m benchmarks.suite                          # compares with benchmarks/baseline.json
+    python -m benchmarks.suite --save results.json      # records results
+    python -m benchmarks.suite --filter date. --repeat 10
+
+The process exits with status 1 if any benchmark is slower than its baseline by more than the
+tolerance, so that the suite can be used as a regression gate. Elapsed times are compared
+relative to a pure Python calibration loop, which is measured alternately with the benchmark so
+that both are affected by the same machine speed and load. Each sample runs the operation enough
+times to take at least ``--min-time`` seconds, garbage collection is disabled while measuring,
+and the best of the samples is compared. Benchmarks which look regressed are measured again up
+to ``--confirm`` times, and only regressions which are confirmed by every measurement fail the
+suite. Still, record the baseline with ``--save benchmarks/baseline.json`` on the machine which
+runs the comparison if possible.
+"""
+
+import argparse
+import collections
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import g4s.cbgrn.api
+from g4s.cbgrn.api import CybozuGaroonApi
+from g4s.core.date import DateTime
+from g4s.core.date import TimeZone
+from g4s.core.model import Event
+from g4s.core.sync import perform_event_mapping
+from tests.dataset import CalendarDataset
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+Benchmark = collections.namedtuple('Benchmark', ('name', 'sizes', 'setup'))
+"""
+A benchmark. ``setup(size)`` prepares data and returns a function which performs the measured
+operation once.
+"""
+
+
+def setup_datetime_parse(size):
+    texts = [
+        '2014-{0:02d}-{1:02d}T{2:02d}:30:00'.format(x % 12 + 1, x % 28 + 1, x % 24)
+        for x in range(size)]
+
+    return lambda: [DateTime.parse(text, 'Asia/Tokyo') for text in texts]
+
+
+def setup_timezone_get(size):
+    names = ['Asia/Tokyo', 'UTC', 'America/New_York', 'Europe/London'] * (size // 4)
+    return lambda: [TimeZone.get(name) for name in names]
+
+
+def setup_event_init(size):
+    args = [
+        (e.id, e.type, e.title, e.description, e.start, e.end, e.is_allday, e.participants,
+         e.is_public, e.last_update)
+        for e in create_events(size)]
+
+    return lambda: [Event(*a) for a in args]
+
+
+def setup_parse_soap_response(size):
+    api = create_api()
+    data = CalendarDataset(size, seed=1).render_response()
+    return lambda: api._parse_soap_response(data)
+
+
+def setup_event_parser(size):
+    dataset = CalendarDataset(size, seed=1)
+    nodes = list(create_api()._parse_soap_response(dataset.render_response()).iter(
+        'schedule_event'))
+
+    def parse():
+        # occurrences of repeat events would be reused from the previous run
+        g4s.cbgrn.api._occurrence_cache.clear()
+        return tuple(CybozuGaroonApi._create_event_parser(nodes, dataset.start, dataset.end))
+
+    return parse
+
+
+def setup_event_mapping(size):
+    # a half of events are common, and the others are only in either calendar
+    events1 = create_events(size)
+    events2 = create_events(size // 2) + create_events(size - size // 2, seed=2)
+    return lambda: perform_event_mapping(events1, events2)
+
+
+def setup_get_difference(size):
+    pairs = list(zip(create_events(size), create_events(size, seed=2)))
+    return lambda: [e1.get_difference(e2) for e1, e2 in pairs]
+
+
+BENCHMARKS = (
+    Benchmark('date.DateTime.parse', (1000, 10000), setup_datetime_parse),
+    Benchmark('date.TimeZone.get', (1000, 10000), setup_timezone_get),
+    Benchmark('model.Event.__init__', (1000, 10000), setup_event_init),
+    Benchmark('model.Event.get_difference', (1000, 10000), setup_get_difference),
+    Benchmark('cbgrn.parse_soap_response', (1000, 10000), setup_parse_soap_response),
+    Benchmark('cbgrn.event_parser', (1000, 10000), setup_event_parser),
+    Benchmark('sync.perform_event_mapping', (100, 400), setup_event_mapping),
+)
+
+
+def create_api():
+    return CybozuGaroonApi({'url': 'http://localhost/grn.cgi', 'user': 'foo', 'password': 'bar'})
+
+
+def create_events(count, seed=1):
+    # repeat series are excluded, so that the number of events is exactly `count`
+    dataset = CalendarDataset(count, seed=seed, weights=dict(repeat=0))
+    return list(dataset.iter_events())
+
+
+def measure(function, repeat, number=1):
+    """
+    Calls the function ``number`` times for each of ``repeat`` samples, and returns elapsed
+    times of a call in seconds.
+    """
+
+    times = []
+    for x in range(repeat):
+        started = time.perf_counter()
+        for y in range(number):
+            function()
+        times.append((time.perf_counter() - started) / number)
+
+    return times
+
+
+def calibration_workload():
+    """
+    A fixed pure Python workload, which represents the speed of the machine.
+    """
+
+    d = {}
+    for x in range(200000):
+        d[x % 1000] = d.get(x % 1000, 0) + x
+
+
+def get_number(function, min_time):
+    """
+    Returns how many times the function must be called to take at least ``min_time`` seconds.
+    """
+
+    number = 1
+    while True:
+        elapsed = measure(function, 1, number)[0] * number
+        if elapsed >= min_time:
+            return number
+
+        number *= 10 if elapsed * 10 < min_time else 2
+
+
+def measure_relative(function, repeat, min_time):
+    """
+    Measures the function alternately with the calibration workload, and returns elapsed times
+    of both in seconds.
+    """
+
+    number = get_number(function, min_time)
+    calibration_number = get_number(calibration_workload, min_time)
+
+    times = []
+    calibrations = []
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for x in range(repeat):
+            calibrations.extend(measure(calibration_workload, 1, calibration_number))
+            times.extend(measure(function, 1, number))
+    finally:
+        if enabled:
+            gc.enable()
+
+    return times, calibrations, number
+
+
+def create_cases(benchmarks, scale):
+    """
+    Returns benchmarks of each size as a dict of setup functions and sizes keyed by
+    ``name[size]``.
+    """
+
+    cases = collections.OrderedDict()
+    for benchmark in benchmarks:
+        for size in benchmark.sizes:
+            size = max(1, int(size * scale))
+            cases['{0}[{1}]'.format(benchmark.name, size)] = (benchmark.setup, size)
+
+    return cases
+
+
+def run(cases, repeat, min_time):
+    """
+    Runs the benchmarks, and returns their results keyed by ``name[size]``.
+    """
+
+    results = collections.OrderedDict()
+    for key, (setup, size) in cases.items():
+        function = setup(size)
+        times, calibrations, number = measure_relative(function, repeat, min_time)
+        calibration = min(calibrations)
+
+        results[key] = dict(
+            best=min(times), median=statistics.median(times), size=size, repeat=repeat,
+            number=number, calibration=calibration, relative=min(times) / calibration)
+        print('{0:40s} {1:10.4f} s {2:12.2f} us/item'.format(
+            key, min(times), min(times) / size * 1e6))
+        sys.stdout.flush()
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the results with the baseline, and returns keys of regressed benchmarks.
+    Benchmarks which are not in the baseline are ignored.
+    """
+
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            print('{0:40s} no baseline'.format(key))
+            continue
+
+        ratio = result['relative'] / expected['relative']
+        regressed = ratio > 1.0 + tolerance
+        if regressed:
+            regressions.append(key)
+
+        print('{0:40s} {1:7.2f}x baseline {2}'.format(key, ratio, 'REGRESSED' if regressed else ''))
+
+    return regressions
+
+
+def confirm(cases, results, baseline, tolerance, repeat, min_time, count):
+    """
+    Measures the regressed benchmarks again at most ``count`` times, keeping the best result of
+    each benchmark, and returns keys of benchmarks which still regress.
+    """
+
+    regressions = compare(results, baseline, tolerance)
+    for x in range(count):
+        if not regressions:
+            break
+
+        print('confirming {0} regression(s)'.format(len(regressions)))
+        retried = run(
+            collections.OrderedDict((key, cases[key]) for key in regressions), repeat, min_time)
+        for key, result in retried.items():
+            if result['relative'] < results[key]['relative']:
+                results[key] = result
+
+        regressions = compare(
+            collections.OrderedDict((key, results[key]) for key in regressions), baseline,
+            tolerance)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--filter', default='', help='run benchmarks whose names contain this')
+    parser.add_argument('--repeat', type=int, default=7, help='number of samples')
+    parser.add_argument(
+        '--min-time', type=float, default=0.05, help='minimum seconds of each sample')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of data sizes')
+    parser.add_argument('--save', help='file to write results to as JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.5,
+        help='allowed slowdown relative to the baseline (default: 0.5 for 50%%)')
+    parser.add_argument(
+        '--confirm', type=int, default=2,
+        help='number of measurements which confirm regressions (default: 2)')
+    args = parser.parse_args()
+
+    benchmarks = [b for b in BENCHMARKS if args.filter in b.name]
+    cases = create_cases(benchmarks, args.scale)
+    results = run(cases, args.repeat, args.min_time)
+
+    if args.save:
+        with open(args.save, 'w') as fout:
+            document = dict(
+                python=platform.python_version(), machine=platform.machine(),
+                processor=platform.processor(), results=results)
+            json.dump(document, fout, indent=2, sort_keys=True)
+            fout.write('\n')
+
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('baseline is not found: {0}'.format(args.baseline))
+        return 0
+
+    with open(args.baseline) as fin:
+        baseline = json.load(fin)['results']
+
+    regressions = confirm(
+        cases, results, baseline, args.tolerance, args.repeat, args.min_time, args.confirm)
+    if regressions:
+        print('{0} benchmark(s) regressed: {1}'.format(len(regressions), ', '.join(regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
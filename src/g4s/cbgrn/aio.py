@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cybozu Garoon calendar API interface for :py:mod:`asyncio` applications.
+"""
+
+__all__ = (
+    'AsyncCybozuGaroonApi',
+    'AsyncHttpTransport',
+    'AsyncTransport',
+    'TransportResponse',
+)
+
+import asyncio
+import collections
+import ssl
+import urllib.parse
+import zlib
+from ..core.aio import AsyncCalendarApi
+from ..core.api import NetworkError
+from ..core.api import RequestError
+from ..core.arg import ArgumentTypeError
+from .api import CybozuGaroonApiBase
+from .api import _IDEMPOTENT_ACTIONS
+from .api import _events_fetched
+from .api import _observe_soap_request
+from .api import _tracer
+from .api import _verify_datetime_range
+
+
+# WSDL downloads in progress, keyed by event loop and Garoon CGI URL
+_endpoint_futures = {}
+
+
+TransportResponse = collections.namedtuple('TransportResponse', ('status', 'headers', 'body'))
+"""
+A response returned by :py:meth:`g4s.cbgrn.aio.AsyncTransport.request`.
+``headers`` is a :py:class:`dict` which maps lower-cased header name to its value.
+"""
+
+
+class AsyncTransport(object):
+    """
+    An interface of HTTP transport used by :py:class:`g4s.cbgrn.aio.AsyncCybozuGaroonApi`.
+    """
+
+    async def request(self, method, url, body=None, headers=None):
+        """
+        Performs a HTTP request.
+        This method must be implemented in derived class.
+
+        :param method:  HTTP method, ``GET`` or ``POST``
+        :param url:     URL
+        :param body:    request body, or :py:const:`None`
+        :param headers: request headers, or :py:const:`None`
+        :type  method:  str
+        :type  url:     str
+        :type  body:    bytes
+        :type  headers: dict[str, str]
+
+        :rtype:  :py:class:`g4s.cbgrn.aio.TransportResponse`
+        :return: the response
+        """
+
+        raise NotImplementedError  # pragma: no cover
+
+
+class AsyncHttpTransport(AsyncTransport):
+    """
+    A minimal HTTP/1.1 transport built on :py:func:`asyncio.open_connection`.
+    A new connection is opened for each request.
+
+    Response bodies compressed with ``gzip`` or ``deflate`` are decompressed while they are being
+    received, and ``content-encoding`` is removed from the returned headers.
+    """
+
+    def __init__(self, timeout=60, ssl_context=None):
+        """
+        Initializes an instance of :py:class:`AsyncHttpTransport` class.
+
+        :param timeout:     timeout of a request in seconds
+        :param ssl_context: SSL context for ``https`` URLs, or :py:const:`None` for the default
+        :type  timeout:     int or float
+        :type  ssl_context: :py:class:`ssl.SSLContext`
+        """
+
+        self._timeout = timeout
+        self._ssl_context = ssl_context
+
+    async def request(self, method, url, body=None, headers=None):
+        return await asyncio.wait_for(
+            self._perform_request(method, url, body, headers), self._timeout)
+
+    async def _perform_request(self, method, url, body, headers):
+        #
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL scheme: {0}'.format(parts.scheme))
+
+        secure = parts.scheme == 'https'
+        port = parts.port or (443 if secure else 80)
+        target = url[len(parts.scheme) + 3 + len(parts.netloc):] or '/'
+        ssl_context = (self._ssl_context or ssl.create_default_context()) if secure else None
+
+        #
+        lines = [
+            '{0} {1} HTTP/1.1'.format(method, target),
+            'Host: {0}'.format(parts.netloc),
+            'Connection: close',
+        ]
+        for name, value in (headers or {}).items():
+            lines.append('{0}: {1}'.format(name, value))
+        if body is not None:
+            lines.append('Content-Length: {0}'.format(len(body)))
+
+        #
+        reader, writer = await asyncio.open_connection(parts.hostname, port, ssl=ssl_context)
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            if body is not None:
+                writer.write(body)
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            response_headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+
+                name, value = line.split(':', 1)
+                response_headers[name.strip().lower()] = value.strip()
+
+            decoder = _ContentDecoder.create(response_headers.pop('content-encoding', None))
+            response_body = await self._read_body(reader, response_headers, decoder)
+        finally:
+            writer.close()
+
+        return TransportResponse(status, response_headers, response_body)
+
+    async def _read_body(self, reader, headers, decoder):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    chunks.append(decoder.flush())
+                    return b''.join(chunks)
+
+                chunks.append(decoder.decompress(await reader.readexactly(size)))
+                await reader.readline()
+
+        if 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        else:
+            data = await reader.read()
+
+        return decoder.decompress(data) + decoder.flush()
+
+
+class _ContentDecoder(object):
+    # decompresses a response body incrementally according to its content encoding
+
+    @classmethod
+    def create(cls, encoding):
+        encoding = (encoding or 'identity').strip().lower()
+        if encoding not in ('identity', 'gzip', 'x-gzip', 'deflate'):
+            raise ValueError('Unsupported content encoding: {0}'.format(encoding))
+
+        return cls(encoding)
+
+    def __init__(self, encoding):
+        self._encoding = encoding
+        self._decompressor = None
+        if encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        self._is_first_chunk = True
+
+    def decompress(self, data):
+        if self._decompressor is None or not data:
+            return data
+
+        try:
+            return self._decompressor.decompress(data)
+        except zlib.error:
+            # some servers send raw deflate data without zlib header for `deflate`
+            if self._encoding != 'deflate' or not self._is_first_chunk:
+                raise
+
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(data)
+        finally:
+            self._is_first_chunk = False
+
+    def flush(self):
+        if self._decompressor is None:
+            return b''
+
+        return self._decompressor.flush()
+
+
+class AsyncCybozuGaroonApi(CybozuGaroonApiBase, AsyncCalendarApi):
+    """
+    An implementation of :py:class:`g4s.core.aio.AsyncCalendarApi` which interacts with Cybozu
+    Garoon server. Request rendering, response parsing and the caches are shared with
+    :py:class:`g4s.cbgrn.api.CybozuGaroonApi` through
+    :py:class:`g4s.cbgrn.api.CybozuGaroonApiBase`.
+    """
+
+    def __init__(self, params, transport=None):
+        """
+        Initializes an instance of :py:class:`g4s.cbgrn.aio.AsyncCybozuGaroonApi` class.
+        See :py:meth:`g4s.cbgrn.api.CybozuGaroonApiBase.__init__` for ``params``.
+
+        :param params:    parameters
+        :param transport: HTTP transport, or :py:const:`None` to use
+                          :py:class:`g4s.cbgrn.aio.AsyncHttpTransport` with
+                          ``params[request_timeout]``
+        :type  params:    dict
+        :type  transport: :py:class:`g4s.cbgrn.aio.AsyncTransport`
+        """
+
+        super(AsyncCybozuGaroonApi, self).__init__(params)
+
+        if transport is not None and not isinstance(transport, AsyncTransport):
+            raise ArgumentTypeError('transport', AsyncTransport)
+
+        self._transport = transport or AsyncHttpTransport(timeout=self._request_timeout)
+
+    async def get_events(self, start, end):
+        """
+        Gets events in the specified range.
+
+        :param start: start of retrieval
+        :param end:   end of retrieval
+        :type  start: :py:class:`g4s.core.date.DateTime`
+        :type  end:   :py:class:`g4s.core.date.DateTime`
+
+        :rtype:  tuple of :py:class:`g4s.core.model.Event`
+        :return: retrieved events
+        """
+
+        _verify_datetime_range(start, end)
+
+        attributes = {'g4s.start': start.isoformat(), 'g4s.end': end.isoformat()}
+        with _tracer.start_span('g4s.get_events', attributes) as span:
+            events = self._lookup_cached_events(start, end)
+            if events is not None:
+                span.add_event('g4s.cache_hit')
+            else:
+                params = dict(start=start, end=end)
+                response = await self.execute_soap_request(
+                    'ScheduleService', 'ScheduleGetEvents', params)
+
+                events = self._parse_events(response.iter('schedule_event'), start, end)
+                self._store_cached_events(start, end, events)
+                _events_fetched.inc(len(events))
+
+            span.set_attribute('g4s.event_count', len(events))
+            return events
+
+    async def get_soap_endpoints(self):
+        """
+        Gets mapping between SOAP service name and its endpoint URL.
+
+        :rtype:  dict[str, str]
+        :return: a dict which maps SOAP service name and its endpoint URL
+        """
+
+        response = await self._request(
+            'GET', self._url + '?WSDL', 'Failed to get WSDL.', True)
+        return self._parse_wsdl(response.body)
+
+    async def execute_soap_request(self, service, action, action_params):
+        """
+        Executes SOAP request.
+        See :py:meth:`g4s.cbgrn.api.CybozuGaroonApi.execute_soap_request` for details.
+
+        :rtype:  :py:class:`lxml.etree._Element`
+        :return: SOAP response
+        """
+
+        #
+        self._verify_soap_request_arguments(service, action, action_params)
+        attributes = {'g4s.service': service, 'g4s.action': action}
+        with _tracer.start_span('g4s.execute_soap_request', attributes) as span:
+            request_text = self._render_request_body(service, action, action_params)
+            endpoint_url = (await self._get_cached_soap_endpoints()).get(service)
+            if endpoint_url is None:
+                # the cached endpoints may be stale (e.g. the server was upgraded)
+                self._invalidate_soap_endpoints()
+                msg = 'Failed to find endpoint URL of the specified service: {0}'
+                raise RequestError(msg.format(service))
+
+            data = request_text.encode('utf-8')
+
+            def encode():
+                return self._encode_request_body(endpoint_url, data)
+
+            with _observe_soap_request(action):
+                response = await self._request(
+                    'POST', endpoint_url, 'Failed to perform HTTP POST request.',
+                    action in _IDEMPOTENT_ACTIONS, encode=encode)
+
+            span.set_attribute('g4s.request_bytes', len(data))
+            span.set_attribute('g4s.response_bytes', len(response.body))
+            return self._parse_soap_response(response.body)
+
+    async def _request(self, method, url, error_message, idempotent, encode=None):
+        # same retry, circuit breaker and throttle semantics as `CybozuGaroonApi._call_remote`;
+        # `encode` returns the request body and headers
+        retry_policy = self.retry_policy
+        retry = 0
+        while True:
+            try:
+                return await self._request_once(method, url, error_message, encode)
+            except NetworkError as ex:
+                retry += 1
+                if not idempotent or not retry_policy.should_retry(ex, retry):
+                    raise
+
+            await asyncio.sleep(retry_policy.get_delay(retry))
+
+    async def _request_once(self, method, url, error_message, encode):
+        circuit_breaker = self.circuit_breaker
+        trial = circuit_breaker is not None and circuit_breaker.before_call()
+
+        try:
+            response = await self._request_throttled(method, url, error_message, encode)
+
+        except NetworkError:
+            if circuit_breaker is not None:
+                circuit_breaker.record_failure()
+            raise
+
+        except BaseException:
+            # e.g. the coroutine was cancelled, or the server rejected the request; the circuit
+            # must not stay half-open forever
+            if trial:
+                circuit_breaker.release_trial()
+            raise
+
+        if circuit_breaker is not None:
+            circuit_breaker.record_success()
+
+        return response
+
+    async def _request_throttled(self, method, url, error_message, encode):
+        throttle = self.throttle
+        await throttle.acquire_async()
+
+        try:
+            body, headers = encode() if encode is not None else (None, None)
+            try:
+                response = await self._transport.request(method, url, body, headers)
+                if response.status == 415 and 'Content-Encoding' in (headers or {}):
+                    # the server does not accept compressed request bodies
+                    self._disable_request_compression(url)
+                    body, headers = encode()
+                    response = await self._transport.request(method, url, body, headers)
+            except Exception as ex:
+                if isinstance(ex, ConnectionError):
+                    # the cached endpoint may not exist any more (e.g. the server was moved)
+                    self._invalidate_soap_endpoints()
+                raise NetworkError(error_message) from ex
+
+            if response.status >= 400:
+                self._raise_for_status(response.status, response.body, error_message)
+
+        finally:
+            throttle.release()
+
+        return response
+
+    async def _get_cached_soap_endpoints(self):
+        endpoints = self._lookup_cached_soap_endpoints()
+        if endpoints is not None:
+            return endpoints
+
+        # concurrent coroutines for the same URL share one WSDL download
+        key = (asyncio.get_event_loop(), self._url)
+        future = _endpoint_futures.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._download_soap_endpoints())
+            _endpoint_futures[key] = future
+            future.add_done_callback(lambda f: _endpoint_futures.pop(key, None))
+
+        return await asyncio.shield(future)
+
+    async def _download_soap_endpoints(self):
+        endpoints = await self.get_soap_endpoints()
+        self._store_cached_soap_endpoints(endpoints)
+        return endpoints
@@ -6,45 +6,236 @@ Cybozu Garoon calendar API interface.
 
 __all__ = (
     'CybozuGaroonApi',
+    'CybozuGaroonApiBase',
+    'EventChanges',
 )
 
+import array
+import bisect
+import calendar
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import contextlib
+import copy
 import datetime
+import functools
+import gzip
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import operator
 import os
+import threading
+import zlib
+import dateutil.parser
 import jinja2
 import lxml.etree
 import requests
+from ..core.api import BatchRequestError
 from ..core.api import CalendarApi
 from ..core.api import NetworkError
 from ..core.api import RequestError
 from ..core.api import ResponseParseError
 from ..core.arg import ArgumentNullError
 from ..core.arg import ArgumentTypeError
+from ..core.arg import verify_number
+from ..core.cache import FileCache
+from ..core.cache import MemoryCache
 from ..core.date import DateTime
 from ..core.date import TimeZone
 from ..core.debug import LogicError
+from ..core.metrics import get_registry
 from ..core.model import Event
 from ..core.model import Participant
-
-
-class CybozuGaroonApi(CalendarApi):
+from ..core.model import ParticipantPool
+from ..core.retry import CircuitBreaker
+from ..core.retry import RetryPolicy
+from ..core.throttle import Throttle
+from ..core.timing import RequestTimings
+from ..core.trace import get_tracer
+from .template import format_utc_datetime
+from .template import render_soap_request
+
+
+# process-wide cache which maps Garoon CGI URL to its SOAP endpoints, shared among instances
+_endpoint_cache = MemoryCache()
+_endpoint_cache_locks = collections.defaultdict(threading.Lock)
+_endpoint_cache_locks_lock = threading.Lock()
+
+# process-wide cache which maps ScheduleGetEvents request parameters to parsed events
+_RESPONSE_CACHE_SIZE = 256
+_response_cache = MemoryCache(max_size=_RESPONSE_CACHE_SIZE)
+
+# passwords in keys of cached events are hashed by PBKDF2 with a random salt; the salt of the
+# process-wide cache never leaves the process, and files share the salt of their directory
+_PASSWORD_DIGEST_ITERATIONS = 100000
+_response_cache_salt = os.urandom(16)
+
+# process-wide cache which maps repeat event rule to ordinals of its occurrence dates
+_OCCURRENCE_CACHE_SIZE = 1024
+_occurrence_cache = MemoryCache(max_size=_OCCURRENCE_CACHE_SIZE)
+
+# process-wide pool of participants, used if `participant_pool` is `process`
+_participant_pool = ParticipantPool()
+
+# process pools which convert event XML into events, keyed by the number of processes
+_parse_executors = {}
+_parse_executors_lock = threading.Lock()
+
+# pairs of a circuit breaker and options specified by instances, keyed by Garoon CGI URL
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+# throttles keyed by Garoon CGI URL
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+# metrics of requests, caches and parsing, which are exposed by `g4s.core.metrics`
+_events_fetched = get_registry().counter(
+    'g4s_events_fetched_total', 'Number of events retrieved from Garoon servers.')
+_event_parse_failures = get_registry().counter(
+    'g4s_event_parse_failures_total', 'Number of events skipped since they could not be parsed.')
+_cache_lookups = get_registry().counter(
+    'g4s_cache_lookups_total', 'Number of lookups of caches by cache and result (hit or miss).',
+    ('cache', 'result'))
+_soap_request_duration = get_registry().histogram(
+    'g4s_soap_request_duration_seconds',
+    'Time from sending SOAP requests to receiving response headers, including retries.',
+    ('action', ))
+_soap_request_errors = get_registry().counter(
+    'g4s_soap_request_errors_total', 'Number of SOAP requests which failed after all attempts.',
+    ('action', ))
+
+_logger = logging.getLogger(__name__)
+
+# spans of requests, parsing and writing, which are enabled by adding exporters to the tracer
+_tracer = get_tracer()
+
+# SOAP actions which can be retried safely
+_IDEMPOTENT_ACTIONS = frozenset((
+    'ScheduleGetEventVersions',
+    'ScheduleGetEvents',
+    'ScheduleGetEventsById',
+    'ScheduleGetEventsByTarget',
+))
+
+# request bodies smaller than this are sent as is, since compressing them does not pay off
+_MIN_COMPRESSED_REQUEST_SIZE = 1024
+
+# HTTP statuses which show that a cached SOAP endpoint does not exist any more
+_ENDPOINT_NOT_FOUND_STATUSES = frozenset((404, 410))
+
+# endpoint URLs which rejected compressed request bodies with "415 Unsupported Media Type"
+_uncompressed_endpoints = set()
+
+# types of targets of `ScheduleGetEventsByTarget`
+_TARGET_TYPES = ('user', 'group', 'facility')
+
+_SOAP_NSS = dict(soap='http://www.w3.org/2003/05/soap-envelope')
+_SCHEDULE_NSS = dict(s2008='http://schemas.cybozu.co.jp/schedule/2008')
+
+# XPath expressions are compiled once, and look up children directly instead of scanning
+# descendants, since they are evaluated for every event node
+_xpath_soap_fault = lxml.etree.XPath('/soap:Envelope/soap:Body/soap:Fault', namespaces=_SOAP_NSS)
+_xpath_soap_fault_reason = lxml.etree.XPath(
+    './soap:Reason/soap:Text/text()', namespaces=_SOAP_NSS)
+_xpath_soap_fault_cause = lxml.etree.XPath('./soap:Detail/cause/text()', namespaces=_SOAP_NSS)
+_xpath_soap_fault_counter_measure = lxml.etree.XPath(
+    './soap:Detail/counter_measure/text()', namespaces=_SOAP_NSS)
+
+_xpath_event_date = lxml.etree.XPath('./s2008:when/s2008:date', namespaces=_SCHEDULE_NSS)
+_xpath_event_datetime = lxml.etree.XPath('./s2008:when/s2008:datetime', namespaces=_SCHEDULE_NSS)
+_xpath_event_users = lxml.etree.XPath(
+    './s2008:members/s2008:member/s2008:user', namespaces=_SCHEDULE_NSS)
+_xpath_repeat_condition = lxml.etree.XPath(
+    './s2008:repeat_info/s2008:condition', namespaces=_SCHEDULE_NSS)
+_xpath_repeat_exclusive_datetimes = lxml.etree.XPath(
+    './s2008:repeat_info/s2008:exclusive_datetimes/s2008:exclusive_datetime',
+    namespaces=_SCHEDULE_NSS)
+
+
+class CybozuGaroonApiBase(object):
     """
-    An implementation of :py:class:`g4s.core.api.CalendarApi` which interacts with Cybozu Garoon
-    server.
+    Parameters, SOAP request rendering, response parsing and the caches of Cybozu Garoon API,
+    which do not depend on how requests are sent. It is the base of
+    :py:class:`g4s.cbgrn.api.CybozuGaroonApi` and :py:class:`g4s.cbgrn.aio.AsyncCybozuGaroonApi`,
+    and precedes :py:class:`g4s.core.api.CalendarApi` or :py:class:`g4s.core.aio.AsyncCalendarApi`
+    in their bases.
+
+    Derived classes send requests, and share the following with each other:
+
+    * ``_url``, ``retry_policy``, ``circuit_breaker`` and ``throttle`` for the server
+    * ``_verify_soap_request_arguments``, ``_render_request_body`` and ``_encode_request_body``
+      to create request bodies, and ``_disable_request_compression`` for endpoints which reject
+      compressed bodies with HTTP status 415
+    * ``_raise_for_status``, ``_parse_soap_response``, ``_parse_wsdl`` and ``_parse_events`` to
+      handle responses
+    * ``_lookup_cached_soap_endpoints``, ``_store_cached_soap_endpoints`` and
+      ``_invalidate_soap_endpoints`` for the process-wide SOAP endpoint cache
+    * ``_lookup_cached_events`` and ``_store_cached_events`` for the response cache
     """
 
     def __init__(self, params):
         """
-        Initializes an instance of :py:class:`g4s.cbgrn.api.CybozuGaroonApi` class.
+        Initializes an instance of a derived class.
         The ``params`` must contains the following values.
 
         * ``url``: URL of Cybozu Garoon CGI, usually ends with ``grn.cgi`` or ``grn.exe``
         * ``user``: login name
         * ``password``: password
         * ``language``: language of SOAP response (``en`` or ``ja``), (optional)
+        * ``endpoint_cache_ttl``: seconds for which SOAP endpoints retrieved from WSDL are reused
+          by all instances for the same ``url`` (optional, default: 3600, :py:const:`None` for no
+          expiry)
+        * ``endpoint_cache_dir``: directory to persist SOAP endpoints between processes, which
+          must be trusted (see :py:class:`g4s.core.cache.FileCache`) (optional)
+        * ``response_cache_ttl``: seconds for which events retrieved for the same time range are
+          reused by all instances for the same ``url``, ``user`` and ``password`` (optional,
+          default: :py:const:`None` to disable)
+        * ``response_cache_dir``: directory to persist retrieved events between processes,
+          which must be trusted and private to the users of the cache, since it contains their
+          events (see :py:class:`g4s.core.cache.FileCache`) (optional, used only if
+          ``response_cache_ttl`` is specified)
+        * ``retry_max_attempts``: maximum number of attempts of read-only requests which failed
+          with network errors (optional, default: 3)
+        * ``retry_base_delay``: delay before the first retry in seconds (optional, default: 0.5)
+        * ``retry_max_delay``: upper bound of delays between retries in seconds (optional,
+          default: 10)
+        * ``circuit_failure_threshold``: number of consecutive network errors to stop sending
+          requests to the server (optional, default: 5, :py:const:`None` to disable)
+        * ``circuit_reset_timeout``: seconds to wait before sending a trial request to the
+          unhealthy server (optional, default: 30)
+        * ``parse_processes``: number of worker processes which convert events in large
+          responses (optional, default: :py:const:`None` to convert in the calling thread)
+        * ``parse_shard_size``: number of events sent to a worker process at once; responses
+          which contain fewer events are converted in the calling thread (optional, default: 2000)
+        * ``repeat_expansion``: ``scalar`` or ``vectorized``, the latter expands repeat events
+          using :py:mod:`g4s.cbgrn.vectorized` which requires NumPy of ``vectorized`` extra,
+          and :py:class:`ImportError` is raised without it (optional, default: ``scalar``)
+        * ``participant_pool``: ``fetch`` or ``process``, events retrieved by a request share
+          participants and member tuples, and the latter shares them among all requests in the
+          process (optional, default: ``fetch``)
+        * ``request_compression``: ``gzip`` or ``deflate`` to compress request bodies; requests
+          are sent uncompressed to servers which reject them (optional, default:
+          :py:const:`None`). Compressed responses are always accepted.
+        * ``max_concurrent_requests``: maximum number of requests sent to the server at the same
+          time (optional, default: :py:const:`None` for no limit)
+        * ``max_requests_per_second``: maximum number of requests sent to the server per second
+          on average (optional, default: :py:const:`None` for no limit)
+        * ``request_timeout``: seconds to wait for the server to connect and to send data;
+          requests which timed out fail with :py:class:`g4s.core.api.NetworkError` and are
+          retried (optional, default: 60, :py:const:`None` to wait forever)
+
+        The circuit breaker and the throttle are shared by all instances for the same ``url``.
+        They are configured by the first instance which specifies their options, and are used as
+        configured by instances which do not specify them. :py:class:`ValueError` is raised if
+        different options are specified.
         """
 
         #
-        super(CybozuGaroonApi, self).__init__(params)
+        super(CybozuGaroonApiBase, self).__init__(params)
 
         #
         params = params.copy()
@@ -63,57 +254,137 @@ class CybozuGaroonApi(CalendarApi):
             if (key == 'language' and value not in ('en', 'ja')):
                 raise ValueError('`params[language]` must be "en" or "ja".')
 
+        #
+        endpoint_cache_ttl = _get_optional_param(params, 'endpoint_cache_ttl', (int, float), 3600)
+        endpoint_cache_dir = _get_optional_param(params, 'endpoint_cache_dir', str, None)
+        if endpoint_cache_ttl is not None and endpoint_cache_ttl < 0:
+            raise ValueError('`params[endpoint_cache_ttl]` must not be negative.')
+
+        response_cache_ttl = _get_optional_param(params, 'response_cache_ttl', (int, float), None)
+        response_cache_dir = _get_optional_param(params, 'response_cache_dir', str, None)
+        if response_cache_ttl is not None and response_cache_ttl < 0:
+            raise ValueError('`params[response_cache_ttl]` must not be negative.')
+
+        retry_policy = RetryPolicy(
+            max_attempts=_get_optional_param(params, 'retry_max_attempts', int, 3),
+            base_delay=_get_optional_param(params, 'retry_base_delay', (int, float), 0.5),
+            max_delay=_get_optional_param(params, 'retry_max_delay', (int, float), 10.0))
+
+        circuit_failure_threshold = _get_optional_param(
+            params, 'circuit_failure_threshold', int, 5)
+        circuit_reset_timeout = _get_optional_param(
+            params, 'circuit_reset_timeout', (int, float), 30.0)
+        circuit_breaker_options = None
+        if 'circuit_failure_threshold' in params or 'circuit_reset_timeout' in params:
+            circuit_breaker_options = circuit_failure_threshold, circuit_reset_timeout
+
+        parse_processes = _get_optional_param(params, 'parse_processes', int, None)
+        parse_shard_size = _get_optional_param(params, 'parse_shard_size', int, 2000)
+        if parse_processes is not None and parse_processes < 1:
+            raise ValueError('`params[parse_processes]` must be positive.')
+        if parse_shard_size is None:
+            raise ArgumentNullError('params[parse_shard_size]')
+        if parse_shard_size < 1:
+            raise ValueError('`params[parse_shard_size]` must be positive.')
+
+        repeat_expansion = _get_optional_param(params, 'repeat_expansion', str, 'scalar')
+        if repeat_expansion not in ('scalar', 'vectorized'):
+            raise ValueError('`params[repeat_expansion]` must be "scalar" or "vectorized".')
+
+        participant_pool = _get_optional_param(params, 'participant_pool', str, 'fetch')
+        if participant_pool not in ('fetch', 'process'):
+            raise ValueError('`params[participant_pool]` must be "fetch" or "process".')
+
+        request_compression = _get_optional_param(params, 'request_compression', str, None)
+        if request_compression not in (None, 'gzip', 'deflate'):
+            raise ValueError('`params[request_compression]` must be "gzip" or "deflate".')
+
+        max_concurrent_requests = _get_optional_param(
+            params, 'max_concurrent_requests', int, None)
+        max_requests_per_second = _get_optional_param(
+            params, 'max_requests_per_second', (int, float), None)
+        if max_concurrent_requests is not None and max_concurrent_requests < 1:
+            raise ValueError('`params[max_concurrent_requests]` must be positive.')
+        if max_requests_per_second is not None and max_requests_per_second <= 0:
+            raise ValueError('`params[max_requests_per_second]` must be positive.')
+
+        request_timeout = _get_optional_param(params, 'request_timeout', (int, float), 60)
+        if request_timeout is not None and request_timeout <= 0:
+            raise ValueError('`params[request_timeout]` must be positive.')
+
         #
         self._url = params['url']
         self._user = params['user']
         self._password = params['password']
+        self._password_digests = {}
         self._language = params['language']
+        self._request_compression = request_compression
+        self._request_timeout = request_timeout
 
         #
-        self._endpoint_cache = None
+        self._retry_policy = retry_policy
+        self._circuit_breaker = None
+        if circuit_failure_threshold is not None:
+            self._circuit_breaker = _get_circuit_breaker(self._url, circuit_breaker_options)
 
-    def get_events(self, start, end):
-        """
-        DOCUMENT ME
-        """
+        self._throttle = _get_throttle(self._url, max_concurrent_requests, max_requests_per_second)
 
         #
-        if start is None:
-            raise ArgumentNullError('start')
-        if end is None:
-            raise ArgumentNullError('end')
+        self._endpoint_cache_ttl = endpoint_cache_ttl
+        self._endpoint_file_cache = None
+        if endpoint_cache_dir is not None:
+            self._endpoint_file_cache = FileCache(endpoint_cache_dir, ttl=endpoint_cache_ttl)
 
-        if not isinstance(start, DateTime):
-            raise ArgumentTypeError('start', DateTime)
-        if not isinstance(end, DateTime):
-            raise ArgumentTypeError('end', DateTime)
+        #
+        self._parse_processes = parse_processes
+        self._parse_shard_size = parse_shard_size
+        self._expand_repeat_event = None
+        if repeat_expansion == 'vectorized':
+            from .vectorized import expand_repeat_event
+            self._expand_repeat_event = expand_repeat_event
 
-        if start > end:
-            raise ValueError('`start` must be same as `end`, or comes before `end`.')
+        self._shares_participant_pool = participant_pool == 'process'
 
         #
-        params = dict(start=start, end=end)
-        response = self.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+        self._response_cache_ttl = response_cache_ttl
+        self._response_file_cache = None
+        if response_cache_ttl is not None and response_cache_dir is not None:
+            self._response_file_cache = FileCache(response_cache_dir, ttl=response_cache_ttl)
 
-        return tuple(self._create_event_parser(response))
+    @property
+    def retry_policy(self):
+        """
+        Gets the retry policy of read-only requests, which exposes retry counters.
 
-    def get_soap_endpoints(self):
+        :rtype: :py:class:`g4s.core.retry.RetryPolicy`
         """
-        Gets mapping between SOAP service name and its endpoint URL.
 
-        :rtype:  dict[str, str]
-        :return: a dict which maps SOAP service name and its endpoint URL
+        return self._retry_policy
+
+    @property
+    def circuit_breaker(self):
         """
+        Gets the circuit breaker of the server, which exposes failure counters.
 
-        #
-        try:
-            response = requests.get(self._url + '?WSDL')
-            response.raise_for_status()
-        except Exception as ex:
-            raise NetworkError('Failed to get WSDL.') from ex
+        :rtype:  :py:class:`g4s.core.retry.CircuitBreaker`
+        :return: the circuit breaker, or :py:const:`None` if it is disabled
+        """
+
+        return self._circuit_breaker
+
+    @property
+    def throttle(self):
+        """
+        Gets the throttle of the server, which exposes wait time counters.
+
+        :rtype: :py:class:`g4s.core.throttle.Throttle`
+        """
 
+        return self._throttle
+
+    def _parse_wsdl(self, wsdl_data):
         try:
-            wsdl = lxml.etree.fromstring(response.text.encode('UTF-8'))
+            wsdl = lxml.etree.fromstring(wsdl_data)
         except Exception as ex:
             raise ResponseParseError('Failed to parse WSDL.') from ex
 
@@ -135,22 +406,7 @@ class CybozuGaroonApi(CalendarApi):
         #
         return result
 
-    def execute_soap_request(self, service, action, action_params):
-        """
-        Executes SOAP request.
-
-        :param service:       SOAP service name
-        :param action:        SOAP action name
-        :param action_params: SOAP action parameters
-        :type  service:       str
-        :type  action:        str
-        :type  action_params: dict[str, str]
-
-        :rtype:  :py:class:`lxml.etree._Element`
-        :return: SOAP response
-        """
-
-        #
+    def _verify_soap_request_arguments(self, service, action, action_params):
         if service is None:
             raise ArgumentNullError('service')
         if action is None:
@@ -165,113 +421,324 @@ class CybozuGaroonApi(CalendarApi):
         if not isinstance(action_params, dict):
             raise ArgumentTypeError('action_params', dict)
 
+    def _render_request_body(self, service, action, action_params):
         #
-        request_text = self._render_request_body(service, action, action_params)
-        response_text = self._send_soap_request(service, action, request_text)
-        response = self._parse_soap_response(response_text)
+        created = DateTime.get_utc_now()
+        expires = created + datetime.timedelta(days=1)
+        header_params = dict(
+            created=created, expires=expires,
+            login_name=self._user, password=self._password, language=self._language)
+
+        #
+        try:
+            return render_soap_request(service, action, header_params, action_params)
+        except jinja2.exceptions.UndefinedError as ex:  # pragma: no cover
+            msg = 'Failed to render SOAP request body. Some required values are missing.'
+            raise LogicError(msg) from ex
+        except jinja2.exceptions.TemplateNotFound as ex:
+            raise LogicError('Failed to get SOAP request template.') from ex
+        except Exception as ex:  # pragma: no cover
+            raise LogicError('Failed to render SOAP request body.') from ex
+
+    def _encode_request_body(self, endpoint_url, data):
+        headers = {'Content-Type': 'application/soap+xml', 'Accept-Encoding': 'gzip, deflate'}
+
+        encoding = self._request_compression
+        if (encoding is None or len(data) < _MIN_COMPRESSED_REQUEST_SIZE or
+                endpoint_url in _uncompressed_endpoints):
+            return data, headers
+
+        headers['Content-Encoding'] = encoding
+        if encoding == 'gzip':
+            return gzip.compress(data), headers
+
+        return zlib.compress(data), headers
+
+    def _disable_request_compression(self, endpoint_url):
+        # the server does not accept compressed request bodies, they are never sent again
+        _uncompressed_endpoints.add(endpoint_url)
+
+    def _parse_soap_response(self, response_data):
+        # parses response as XML
+        try:
+            response = lxml.etree.fromstring(response_data)
+        except Exception as ex:
+            raise ResponseParseError('Failed to parse SOAP response.') from ex
+
+        # checks SOAP errors
+        nodes = _xpath_soap_fault(response)
+        if nodes:
+            self._raise_soap_fault(nodes[0])
 
         return response
 
-    def _create_event_parser(self, response):
-        for node in response.xpath('//schedule_event'):
+    def _raise_for_status(self, status, content, error_message):
+        # Garoon returns SOAP faults with HTTP status 500; they and the other client errors (e.g.
+        # authentication failures) are neither retried nor counted by the circuit breaker, which
+        # is shared by all the users of the server; they also keep the endpoints cached for all
+        # the users, unless the endpoint itself is not found
+        if status in _ENDPOINT_NOT_FOUND_STATUSES:
+            self._invalidate_soap_endpoints()
+
+        try:
+            nodes = _xpath_soap_fault(lxml.etree.fromstring(content))
+        except Exception:
+            nodes = []
+
+        if nodes:
+            self._raise_soap_fault(nodes[0])
+
+        msg = '{0} (HTTP status: {1})'.format(error_message, status)
+        if status >= 500:
+            raise NetworkError(msg)
+
+        raise RequestError(msg)
+
+    def _raise_soap_fault(self, fault_node):
+        t = lambda ns: str(ns[0]) if ns and str(ns[0]) else 'unknown'
+
+        fault_reason = t(_xpath_soap_fault_reason(fault_node))
+        fault_cause = t(_xpath_soap_fault_cause(fault_node))
+        fault_cm = t(_xpath_soap_fault_counter_measure(fault_node))
+
+        #
+        params = fault_reason, fault_cause, fault_cm
+        msg = 'The remote server returned an error ({0} {1} {2})'.format(*params)
+        raise RequestError(msg)
+
+    def _lookup_cached_soap_endpoints(self):
+        endpoints = _endpoint_cache.get(self._url)
+        if endpoints is None and self._endpoint_file_cache is not None:
+            endpoints = self._endpoint_file_cache.get(self._url)
+            if endpoints is not None:
+                _endpoint_cache.set(self._url, endpoints, self._endpoint_cache_ttl)
+
+        _cache_lookups.inc(cache='endpoints', result='miss' if endpoints is None else 'hit')
+        return endpoints
+
+    def _store_cached_soap_endpoints(self, endpoints):
+        if self._endpoint_file_cache is not None:
+            self._endpoint_file_cache.set(self._url, endpoints)
+
+        _endpoint_cache.set(self._url, endpoints, self._endpoint_cache_ttl)
+
+    def _invalidate_soap_endpoints(self):
+        _endpoint_cache.invalidate(self._url)
+        if self._endpoint_file_cache is not None:
+            self._endpoint_file_cache.invalidate(self._url)
+
+    def _get_response_cache_key(self, start, end, salt):
+        # keyed by the values rendered into the request, so that equivalent time ranges in
+        # different timezones share an entry; the password is hashed, so that instances with a
+        # wrong password cannot read cached events
+        return (
+            'ScheduleGetEvents', self._url, self._user, self._get_password_digest(salt),
+            self._language, format_utc_datetime(start), format_utc_datetime(end))
+
+    def _get_password_digest(self, salt):
+        # derived by a slow KDF with a random salt, so that keys written to files cannot be used
+        # to find the password offline; derived once for each salt, since it takes a while
+        digest = self._password_digests.get(salt)
+        if digest is None:
+            digest = hashlib.pbkdf2_hmac(
+                'sha256', self._password.encode('utf-8'), salt,
+                _PASSWORD_DIGEST_ITERATIONS).hex()
+            self._password_digests[salt] = digest
+
+        return digest
+
+    def _lookup_cached_events(self, start, end):
+        if self._response_cache_ttl is None:
+            return None
+
+        key = self._get_response_cache_key(start, end, _response_cache_salt)
+        events = _response_cache.get(key)
+        if events is None and self._response_file_cache is not None:
+            file_key = self._get_response_cache_key(start, end, self._response_file_cache.salt)
+            events = self._response_file_cache.get(file_key)
+            if events is not None:
+                _response_cache.set(key, events, self._response_cache_ttl)
+
+        _cache_lookups.inc(cache='events', result='miss' if events is None else 'hit')
+        return _copy_events(events) if events is not None else None
+
+    def _store_cached_events(self, start, end, events):
+        if self._response_cache_ttl is None:
+            return
+
+        # the events are returned to the caller, which may modify them
+        if self._response_file_cache is not None:
+            file_key = self._get_response_cache_key(start, end, self._response_file_cache.salt)
+            self._response_file_cache.set(file_key, events)
+
+        key = self._get_response_cache_key(start, end, _response_cache_salt)
+        _response_cache.set(key, _copy_events(events), self._response_cache_ttl)
+
+    def _invalidate_cached_events(self, events):
+        # invalidates all the events retrieved by the user, and events retrieved by the other users
+        # in the ranges of the written events, since they may be participants of the events
+        ranges = [_get_event_cache_range(e) for e in events]
+
+        def is_stale(key):
+            if not isinstance(key, tuple) or key[:2] != ('ScheduleGetEvents', self._url):
+                return False
+
+            start, end = key[5:7]
+            return key[2] == self._user or any(s < end and start < e for s, e in ranges)
+
+        _response_cache.invalidate_if(is_stale)
+        if self._response_file_cache is not None:
+            self._response_file_cache.invalidate_if(is_stale)
+
+    def _parse_events(self, nodes, start, end):
+        # streamed responses are received while they are parsed, which is included in the span
+        pool = _participant_pool if self._shares_participant_pool else ParticipantPool()
+        with _tracer.start_span('g4s.parse_events') as span:
+            events = tuple(
+                self._create_event_parser(nodes, start, end, self._expand_repeat_event, pool))
+            span.set_attribute('g4s.event_count', len(events))
+            return events
+
+    def _parse_events_in_processes(self, nodes, start, end):
+        shards = _serialize_event_shards(nodes, self._parse_shard_size)
+
+        # small responses are not worth the cost of inter-process communication
+        first_shard = next(shards, None)
+        if first_shard is None:
+            return ()
+
+        second_shard = next(shards, None)
+        if second_shard is None:
+            return _parse_event_shard(first_shard, start, end, self._expand_repeat_event)
+
+        # shards are submitted while the rest of the response is being received
+        executor = _get_parse_executor(self._parse_processes)
+        futures = [
+            executor.submit(_parse_event_shard, shard, start, end, self._expand_repeat_event)
+            for shard in itertools.chain((first_shard, second_shard), shards)]
+
+        try:
+            return tuple(itertools.chain.from_iterable(f.result() for f in futures))
+        except concurrent.futures.process.BrokenProcessPool as ex:
+            with _parse_executors_lock:
+                if _parse_executors.get(self._parse_processes) is executor:
+                    del _parse_executors[self._parse_processes]
+
+            raise ResponseParseError('Failed to convert events in worker processes.') from ex
+
+    @classmethod
+    def _create_event_parser(
+            cls, nodes, start=None, end=None, expand_repeat_event=None, participant_pool=None):
+        # `start` and `end` limit occurrences of repeat events, which are expanded by
+        # `expand_repeat_event` if specified; members are interned by `participant_pool`
+        for node in nodes:
             try:
-                result = self._parse_single_event_node(node)
+                result = cls._parse_single_event_node(node, participant_pool)
             except Exception:
-                # TODO: add code to log the exception
+                # a broken event should not prevent the other events from being synchronized;
+                # failures in worker processes are counted by the workers' own registries
+                _event_parse_failures.inc()
+                _logger.warning(
+                    'Skipped an event which could not be parsed: id=%s', node.get('id'),
+                    exc_info=True)
                 continue
 
             if result is None:  # pragma: no cover
                 # when unsupported event type found
-                # TODO: add tests after adding 'repeat event' support
                 continue
 
             if isinstance(result, Event):
                 yield result
             elif isinstance(result, _RepeatEventRule):
-                for event in result.resolve():
+                if expand_repeat_event is None:
+                    occurrences = result.resolve(start, end)
+                else:
+                    occurrences = expand_repeat_event(result, start, end)
+
+                for event in occurrences:
                     yield event
             else:
                 raise LogicError  # pragma: no cover
 
-    def _parse_single_event_node(self, node):
+    @classmethod
+    def _parse_single_event_node(cls, node, participant_pool=None):
         id = int(node.attrib['id'])
         type = node.attrib['event_type'].lower()
 
         if type in ('normal', 'banner'):
             type = Event.NORMAL if type == 'normal' else Event.BANNER
-            return self._parse_normal_event(node, id, type)
+            return cls._parse_normal_event(node, id, type, participant_pool)
         elif type == 'repeat':
-            return self._parse_repeat_event(node, id)
+            return cls._parse_repeat_event(node, id, participant_pool)
         else:  # pragma: no cover
-            # unsupported event types (e.g. repeat and temporary)
-            # TODO: add tests after adding 'repeat event' support
+            # unsupported event types (e.g. temporary)
             return None
 
-    def _parse_normal_event(self, node, id, type):
+    @classmethod
+    def _parse_normal_event(cls, node, id, type, participant_pool=None):
         #
         (is_public, last_update, detail, description, start_tz_name, end_tz_name,
-            all_day, start_only, members) = self._parse_common_event_information(node)
+            all_day, start_only, members, version) = cls._parse_common_event_information(
+                node, participant_pool)
 
         #
-        start_tz_name = node.attrib['timezone']
-        is_allday = self._parse_bool(node.attrib['allday'])
-        is_start_only = self._parse_bool(node.attrib['start_only'])
-        nss = dict(s2008='http://schemas.cybozu.co.jp/schedule/2008')
-
-        #
-        if is_allday:
-            dt_node = node.xpath('.//s2008:when/s2008:date', namespaces=nss)[0]
+        if all_day:
+            dt_node = _xpath_event_date(node)[0]
             start = DateTime.parse(dt_node.attrib['start'], start_tz_name)
             end = DateTime.parse(dt_node.attrib['end'], node.attrib['end_timezone'])
 
         else:
-            dt_node = node.xpath('.//s2008:when/s2008:datetime', namespaces=nss)[0]
-            start = DateTime.parse(dt_node.attrib['start'], start_tz_name)
+            # date times are returned as UTC, and converted to the time zones of the event
+            dt_node = _xpath_event_datetime(node)[0]
+            start = _parse_datetime_with_offset(dt_node.attrib['start'], start_tz_name)
 
-            if is_start_only:
+            if start_only:
                 end = None
             else:
-                end = DateTime.parse(dt_node.attrib['end'], node.attrib['end_timezone'])
+                end = _parse_datetime_with_offset(
+                    dt_node.attrib['end'], node.attrib['end_timezone'])
 
         return Event(
-            id, type, detail, description, start, end, is_allday, members, is_public, last_update)
+            id, type, detail, description, start, end, all_day, members, is_public, last_update,
+            version)
 
-    def _parse_repeat_event(self, node, id):
+    @classmethod
+    def _parse_repeat_event(cls, node, id, participant_pool=None):
         #
         (is_public, last_update, detail, description, start_tz_name, end_tz_name,
-            all_day, start_only, members) = self._parse_common_event_information(node)
+            all_day, start_only, members, version) = cls._parse_common_event_information(
+                node, participant_pool)
 
         if not end_tz_name:
             end_tz_name = start_tz_name
 
         #
-        nss = dict(s2008='http://schemas.cybozu.co.jp/schedule/2008')
-
-        repeat_info_node = node.xpath('.//s2008:repeat_info', namespaces=nss)[0]
-        repeat_cond_node = repeat_info_node.xpath('.//s2008:condition', namespaces=nss)[0]
+        repeat_cond_node = _xpath_repeat_condition(node)[0]
+        attrib = repeat_cond_node.attrib
 
-        repeat_type = repeat_cond_node.attrib['type']
-        repeat_day = int(repeat_cond_node.attrib['day'])
-        repeat_week = int(repeat_cond_node.attrib['week'])
-        repeat_start_date = DateTime.parse(repeat_cond_node.attrib['start_date'], start_tz_name)
-        repeat_end_date = DateTime.parse(repeat_cond_node.attrib['end_date'], end_tz_name)
+        repeat_type = attrib['type']
+        repeat_day = int(attrib.get('day', 0))
+        repeat_week = int(attrib.get('week', 0))
+        repeat_start_date = _parse_date(attrib['start_date'])
+        repeat_end_date = _parse_date(attrib['end_date']) if attrib.get('end_date') else None
+        start_time = _parse_time(attrib['start_time']) if attrib.get('start_time') else None
+        end_time = _parse_time(attrib['end_time']) if attrib.get('end_time') else None
 
         #
-        exc_dt_nodes = repeat_info_node.xpath('.//s2008:exclusive_datetime', namespaces=nss)
+        start_tz = TimeZone.get(start_tz_name)
         exc_dts = []
-        if exc_dt_nodes:
-            for exc_dt_node in exc_dt_nodes:
-                start = DateTime.parse(exc_dt_node.attrib['start'], 'UTC')
-                end = DateTime.parse(exc_dt_node.attrib['end'], 'UTC')
-                exc_dts.append((start, end))
+        for exc_dt_node in _xpath_repeat_exclusive_datetimes(node):
+            start = _parse_datetime_with_offset(exc_dt_node.attrib['start'], start_tz)
+            end = _parse_datetime_with_offset(exc_dt_node.attrib['end'], start_tz)
+            exc_dts.append((start, end))
 
-            exc_dts.sort(key=lambda r: r[0])
-
-        yield _RepeatEventRule(
+        return _RepeatEventRule(
             id, detail, description, all_day, start_only, members, is_public, last_update,
-            repeat_type, repeat_day, repeat_week, repeat_start_date, repeat_end_date, exc_dts)
+            start_tz_name, end_tz_name, repeat_type, repeat_day, repeat_week,
+            repeat_start_date, repeat_end_date, start_time, end_time, exc_dts, version)
 
-    def _parse_common_event_information(self, node):
+    @classmethod
+    def _parse_common_event_information(cls, node, participant_pool=None):
         #
         public_type = node.attrib['public_type'].lower()
         version = int(node.attrib['version'])
@@ -281,10 +748,10 @@ class CybozuGaroonApi(CalendarApi):
 
         start_tz_name = node.attrib['timezone']
         end_tz_name = node.attrib.get('end_timezone')
-        all_day = self._parse_bool(node.attrib['allday'])
-        start_only = self._parse_bool(node.attrib['start_only'])
+        all_day = cls._parse_bool(node.attrib['allday'])
+        start_only = cls._parse_bool(node.attrib['start_only'])
 
-        members = tuple(self._create_member_parser(node))
+        members = cls._parse_members(node, participant_pool)
 
         #
         is_public = public_type == 'public'
@@ -298,21 +765,27 @@ class CybozuGaroonApi(CalendarApi):
         #
         return (
             is_public, last_update, detail, description,
-            start_tz_name, end_tz_name, all_day, start_only, members
+            start_tz_name, end_tz_name, all_day, start_only, members, version
         )
 
-    def _create_member_parser(self, node):
-        nss = dict(s2008='http://schemas.cybozu.co.jp/schedule/2008')
-        ordering = lambda m: int(m.get('order', 0))
+    @classmethod
+    def _parse_members(cls, node, participant_pool=None):
+        # attributes are read once, and members are sorted by `order` stably
+        items = []
+        for member_node in _xpath_event_users(node):
+            attrib = member_node.attrib
+            items.append((int(attrib.get('order', 0)), int(attrib['id']), attrib['name']))
+
+        items.sort(key=operator.itemgetter(0))
+        members = [(id, name) for order, id, name in items]
 
-        member_nodes = node.xpath('.//s2008:user', namespaces=nss)
-        for member_node in sorted(member_nodes, key=ordering):
-            id = int(member_node.attrib['id'])
-            name = member_node.attrib['name']
+        if participant_pool is None:
+            return tuple(Participant(id, name) for id, name in members)
 
-            yield Participant(id, name)
+        return participant_pool.get_members(members)
 
-    def _parse_bool(self, text):
+    @classmethod
+    def _parse_bool(cls, text):
         text = text.lower()
         if text == 'true':
             return True
@@ -325,142 +798,1327 @@ class CybozuGaroonApi(CalendarApi):
     # SOAP
     #
 
-    def _render_request_body(self, service, action, action_params):
+
+class CybozuGaroonApi(CybozuGaroonApiBase, CalendarApi):
+    """
+    An implementation of :py:class:`g4s.core.api.CalendarApi` which interacts with Cybozu Garoon
+    server.
+    """
+
+    def __init__(self, params):
+        """
+        Initializes an instance of :py:class:`g4s.cbgrn.api.CybozuGaroonApi` class.
+        See :py:meth:`g4s.cbgrn.api.CybozuGaroonApiBase.__init__` for ``params``.
+        """
+
+        super(CybozuGaroonApi, self).__init__(params)
+        self._timing_hooks = ()
+
+    def get_events(self, start, end, chunk_size=None, max_workers=4):
+        """
+        Gets events in the specified range.
+
+        When ``chunk_size`` is specified, the range is split into sub-ranges of the size, which
+        are retrieved concurrently by at most ``max_workers`` threads. Events which span the
+        boundaries of sub-ranges are returned only once.
+
+        :param start:       start of retrieval
+        :param end:         end of retrieval
+        :param chunk_size:  size of sub-ranges, or :py:const:`None` to retrieve whole range by a
+                            single request
+        :param max_workers: maximum number of concurrent requests
+        :type  start:       :py:class:`g4s.core.date.DateTime`
+        :type  end:         :py:class:`g4s.core.date.DateTime`
+        :type  chunk_size:  :py:class:`datetime.timedelta`
+        :type  max_workers: int
+
+        :rtype:  tuple of :py:class:`g4s.core.model.Event`
+        :return: retrieved events
+        """
+
         #
-        created = DateTime.get_utc_now()
-        expires = created + datetime.timedelta(days=1)
-        params = dict(
-            created=created, expires=expires,
-            login_name=self._user, password=self._password, language=self._language)
+        _verify_datetime_range(start, end)
+
+        if chunk_size is not None:
+            if not isinstance(chunk_size, datetime.timedelta):
+                raise ArgumentTypeError('chunk_size', datetime.timedelta)
+            if chunk_size <= datetime.timedelta(0):
+                raise ValueError('`chunk_size` must be positive.')
+
+        verify_number('max_workers', max_workers, int, 1)
+
+        #
+        attributes = {'g4s.start': start.isoformat(), 'g4s.end': end.isoformat()}
+        with _tracer.start_span('g4s.get_events', attributes) as span:
+            events = self._get_events_in_chunks(start, end, chunk_size, max_workers)
+            span.set_attribute('g4s.event_count', len(events))
+            return events
+
+    def _get_events_in_chunks(self, start, end, chunk_size, max_workers):
+        if chunk_size is None:
+            return self._get_events_in_range(start, end)
+
+        ranges = _split_datetime_range(start, end, chunk_size)
+        if len(ranges) == 1:
+            return self._get_events_in_range(start, end)
+
+        get = _tracer.bind(lambda r: self._get_events_in_range(*r))
+        with concurrent.futures.ThreadPoolExecutor(min(max_workers, len(ranges))) as executor:
+            results = list(executor.map(get, ranges))
+
+        # removes events which are returned for multiple sub-ranges
+        # (occurrences of a repeat event share the same ID, so start date time is also compared)
+        events = []
+        keys = set()
+        for event in itertools.chain.from_iterable(results):
+            key = (event.id, event.start)
+            if key not in keys:
+                keys.add(key)
+                events.append(event)
+
+        return tuple(events)
+
+    def get_events_by_targets(self, start, end, targets, max_workers=4):
+        """
+        Gets events of the specified users, groups or facilities in the specified range.
+
+        Events of each target are retrieved by a ``ScheduleGetEventsByTarget`` request, and at
+        most ``max_workers`` requests are sent concurrently with the credentials of this instance,
+        which must be allowed to browse events of the targets. Events shared between targets
+        (e.g. a meeting attended by several users) are returned as the same object.
+
+        .. code-block:: python
+
+            targets = [('user', 1), ('user', 2), ('facility', 10)]
+            events = api.get_events_by_targets(start, end, targets)
+            events[('user', 1)]  # => events of the user
+
+        :param start:       start of retrieval
+        :param end:         end of retrieval
+        :param targets:     pairs of target type (``user``, ``group`` or ``facility``) and ID
+        :param max_workers: maximum number of concurrent requests
+        :type  start:       :py:class:`g4s.core.date.DateTime`
+        :type  end:         :py:class:`g4s.core.date.DateTime`
+        :type  targets:     list of (str, int)
+        :type  max_workers: int
+
+        :rtype:  dict of ((str, int), tuple of :py:class:`g4s.core.model.Event`)
+        :return: a dict which maps each target to its events
+        """
+
+        #
+        _verify_datetime_range(start, end)
+        targets = _verify_targets(targets)
+        verify_number('max_workers', max_workers, int, 1)
+
+        #
+        attributes = {
+            'g4s.start': start.isoformat(), 'g4s.end': end.isoformat(),
+            'g4s.target_count': len(targets)}
+        with _tracer.start_span('g4s.get_events_by_targets', attributes):
+            get = _tracer.bind(lambda target: self._get_target_events_in_range(start, end, target))
+            if len(targets) <= 1:
+                results = [get(t) for t in targets]
+            else:
+                workers = min(max_workers, len(targets))
+                with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                    results = list(executor.map(get, targets))
+
+        # occurrences of a repeat event share the same ID, so start date time is also compared
+        shared_events = {}
+        events = {}
+        for target, target_events in zip(targets, results):
+            events[target] = tuple(
+                shared_events.setdefault((e.id, e.start), e) for e in target_events)
+
+        return events
+
+    def get_changed_events(self, start, end, known_versions):
+        """
+        Gets events which were added, modified or removed since the known versions.
+
+        The known versions are sent by a ``ScheduleGetEventVersions`` request, which returns only
+        IDs and versions of the changed events. Then only the added and modified events are
+        retrieved by a ``ScheduleGetEventsById`` request, which is skipped if nothing was added or
+        modified.
+
+        .. code-block:: python
+
+            changes = api.get_changed_events(start, end, versions)
+            versions = changes.versions  # to be stored for the next call
+
+        :param start:          start of retrieval
+        :param end:            end of retrieval
+        :param known_versions: a dict which maps ID of an event to its version, which was
+                               returned by the previous call as
+                               :py:attr:`g4s.cbgrn.api.EventChanges.versions`
+        :type  start:          :py:class:`g4s.core.date.DateTime`
+        :type  end:            :py:class:`g4s.core.date.DateTime`
+        :type  known_versions: dict of (int, int)
+
+        :rtype:  :py:class:`g4s.cbgrn.api.EventChanges`
+        :return: the changes
+        """
+
+        #
+        _verify_datetime_range(start, end)
+        if known_versions is None:
+            raise ArgumentNullError('known_versions')
+        if not isinstance(known_versions, dict):
+            raise ArgumentTypeError('known_versions', dict)
+
+        #
+        params = dict(start=start, end=end, event_items=sorted(known_versions.items()))
+        response = self.execute_soap_request('ScheduleService', 'ScheduleGetEventVersions', params)
+        items = self._parse_event_versions(response)
+
+        versions = dict(known_versions)
+        changed_ids = []
+        removed_ids = []
+        for id, version, operation in items:
+            if operation == 'remove':
+                versions.pop(id, None)
+                removed_ids.append(id)
+            else:
+                versions[id] = version
+                changed_ids.append(id)
+
+        #
+        events = ()
+        if changed_ids:
+            params = dict(event_ids=changed_ids)
+            nodes = self.execute_streaming_soap_request(
+                'ScheduleService', 'ScheduleGetEventsById', params, 'schedule_event')
+            events = self._parse_events(nodes, start, end)
+
+        return EventChanges(events, removed_ids, versions)
+
+    def add_events(self, events, batch_size=100, max_workers=4):
+        """
+        Adds the specified events.
+
+        The events are split into ``ScheduleAddEvents`` requests which contain at most
+        ``batch_size`` events, and at most ``max_workers`` requests are sent concurrently. The
+        requests are never retried, since they are not idempotent.
+
+        :param events:      a collection of events to be added
+        :param batch_size:  maximum number of events in a request
+        :param max_workers: maximum number of concurrent requests
+        :type  events:      list of :py:class:`g4s.core.model.Event`
+        :type  batch_size:  int
+        :type  max_workers: int
+
+        :rtype:  tuple of :py:class:`g4s.core.model.Event`
+        :return: added events, in the same order as ``events``
+
+        :raises g4s.core.api.BatchRequestError: if some of the requests failed, its ``results``
+                                                contains the events added by the other requests
+        """
+
+        #
+        events = _verify_events(events, False)
+        verify_number('batch_size', batch_size, int, 1)
+        verify_number('max_workers', max_workers, int, 1)
+
+        #
+        def add(batch):
+            params = dict(events=[_create_event_params(e) for e in batch])
+            response = self.execute_soap_request('ScheduleService', 'ScheduleAddEvents', params)
+            return self._parse_written_events(response, len(batch))
+
+        results, errors = self._execute_write_batches(
+            'add', add, events, batch_size, max_workers, events)
+
+        #
+        added_events = tuple(itertools.chain.from_iterable(r for b, r in results))
+        if errors:
+            raise _create_batch_request_error('add', len(events), added_events, errors)
+
+        return added_events
+
+    def modify_events(self, events, batch_size=100, max_workers=4):
+        """
+        Modifies the specified events.
+
+        The events are split into ``ScheduleModifyEvents`` requests which contain at most
+        ``batch_size`` events, and at most ``max_workers`` requests are sent concurrently. The
+        requests are never retried, since they are not idempotent.
+
+        :param events:
+            a :py:class:`dict` which maps old event to a dict which contains difference between old
+            event and new event, as returned by :py:meth:`g4s.core.model.Event.get_difference`
+            (i.e. ``{field: (old value, new value)}``). The old events must have valid ID and
+            version, as events retrieved from Garoon have.
+        :param batch_size:  maximum number of events in a request
+        :param max_workers: maximum number of concurrent requests
+        :type  events:      dict of (g4s.core.model.Event, dict)
+        :type  batch_size:  int
+        :type  max_workers: int
+
+        :rtype:  dict of (:py:class:`g4s.core.model.Event`, :py:class:`g4s.core.model.Event`)
+        :return: a :py:class:`dict` which maps old event to new event
+
+        :raises g4s.core.api.BatchRequestError: if some of the requests failed, its ``results``
+                                                contains the events modified by the other requests
+        """
+
+        #
+        if events is None:
+            raise ArgumentNullError('events')
+        if not isinstance(events, dict):
+            raise ArgumentTypeError('events', dict)
+
+        old_events = _verify_events(events.keys(), True)
+        if any(e.version is None for e in old_events):
+            raise ValueError('All of `events` must have version.')
+        if not all(isinstance(d, dict) for d in events.values()):
+            raise ArgumentTypeError('events[*]', dict)
+        verify_number('batch_size', batch_size, int, 1)
+        verify_number('max_workers', max_workers, int, 1)
+
+        pairs = [(e, _apply_event_difference(e, events[e])) for e in old_events]
+
+        #
+        def modify(batch):
+            params = dict(
+                events=[_create_event_params(new, old.id, old.version) for old, new in batch])
+            response = self.execute_soap_request('ScheduleService', 'ScheduleModifyEvents', params)
+            return self._parse_written_events(response, len(batch))
+
+        results, errors = self._execute_write_batches(
+            'modify', modify, pairs, batch_size, max_workers, list(itertools.chain(*pairs)))
+
+        #
+        modified_events = {}
+        for batch, new_events in results:
+            for (old_event, _), new_event in zip(batch, new_events):
+                modified_events[old_event] = new_event
+
+        if errors:
+            errors = [(tuple(old for old, new in b), ex) for b, ex in errors]
+            raise _create_batch_request_error('modify', len(pairs), modified_events, errors)
+
+        return modified_events
+
+    def remove_events(self, events, batch_size=100, max_workers=4):
+        """
+        Removes the specified events.
+
+        The events are split into ``ScheduleRemoveEvents`` requests which contain at most
+        ``batch_size`` events, and at most ``max_workers`` requests are sent concurrently. The
+        requests are never retried, since they are not idempotent.
+
+        :param events:      a collection of events to be removed, which must have valid ID
+        :param batch_size:  maximum number of events in a request
+        :param max_workers: maximum number of concurrent requests
+        :type  events:      list of :py:class:`g4s.core.model.Event`
+        :type  batch_size:  int
+        :type  max_workers: int
+
+        :rtype:  tuple of :py:class:`g4s.core.model.Event`
+        :return: removed events
+
+        :raises g4s.core.api.BatchRequestError: if some of the requests failed, its ``results``
+                                                contains the events removed by the other requests
+        """
+
+        #
+        events = _verify_events(events, True)
+        verify_number('batch_size', batch_size, int, 1)
+        verify_number('max_workers', max_workers, int, 1)
+
+        #
+        def remove(batch):
+            params = dict(event_ids=[e.id for e in batch])
+            self.execute_soap_request('ScheduleService', 'ScheduleRemoveEvents', params)
+            return batch
+
+        results, errors = self._execute_write_batches(
+            'remove', remove, events, batch_size, max_workers, events)
+
+        #
+        removed_events = tuple(itertools.chain.from_iterable(r for b, r in results))
+        if errors:
+            raise _create_batch_request_error('remove', len(events), removed_events, errors)
+
+        return removed_events
+
+    @property
+    def is_event_modification_supported(self):
+        """
+        Returns :py:const:`True`, since :py:meth:`modify_events` is implemented.
+
+        :rtype: bool
+        """
+
+        return True
+
+    def add_timing_hook(self, hook):
+        """
+        Registers a function which is called with a :py:class:`g4s.core.timing.RequestTimings`
+        after each SOAP request of the instance is completed or failed, e.g. requests sent by
+        :py:meth:`get_events` and :py:meth:`execute_soap_request`.
+
+        Timings of a streamed response are reported after the response is consumed, and the
+        ``convert`` phase contains time spent by the consumer. The hook is called in the thread
+        which sent the request, and must not raise exceptions.
+
+        :param hook: a function which takes an argument
+        :type  hook: callable
+        """
+
+        if hook is None:
+            raise ArgumentNullError('hook')
+        if not callable(hook):
+            raise ArgumentTypeError('hook', 'callable')
+
+        # replaced rather than modified, so that requests in progress are not affected
+        self._timing_hooks = self._timing_hooks + (hook, )
+
+    def remove_timing_hook(self, hook):
+        """
+        Unregisters the function registered by :py:meth:`add_timing_hook`.
+
+        :param hook: the registered function
+        :type  hook: callable
+        """
+
+        hooks = list(self._timing_hooks)
+        hooks.remove(hook)
+        self._timing_hooks = tuple(hooks)
 
-        if action_params:
-            params.update(action_params)
+    def get_soap_endpoints(self):
+        """
+        Gets mapping between SOAP service name and its endpoint URL.
+
+        :rtype:  dict[str, str]
+        :return: a dict which maps SOAP service name and its endpoint URL
+        """
+
+        #
+        def get():
+            try:
+                response = requests.get(self._url + '?WSDL', timeout=self._request_timeout)
+                response.raise_for_status()
+            except requests.Timeout as ex:
+                raise NetworkError('Timed out while getting WSDL.') from ex
+            except Exception as ex:
+                raise NetworkError('Failed to get WSDL.') from ex
+
+            return response
+
+        response = self._call_remote(get, True)
+        return self._parse_wsdl(response.text.encode('UTF-8'))
+
+    def execute_soap_request(self, service, action, action_params):
+        """
+        Executes SOAP request.
+
+        :param service:       SOAP service name
+        :param action:        SOAP action name
+        :param action_params: SOAP action parameters
+        :type  service:       str
+        :type  action:        str
+        :type  action_params: dict[str, str]
+
+        :rtype:  :py:class:`lxml.etree._Element`
+        :return: SOAP response
+        """
+
+        #
+        self._verify_soap_request_arguments(service, action, action_params)
+        if self._timing_hooks or _tracer.enabled:
+            return self._execute_timed_soap_request(service, action, action_params)
 
         #
+        request_text = self._render_request_body(service, action, action_params)
+        response = self._send_soap_request(service, action, request_text)
+        return self._parse_soap_response(response.content)
+
+    def execute_streaming_soap_request(self, service, action, action_params, tag):
+        """
+        Executes SOAP request, and parses its response incrementally.
+
+        The response is parsed while it is being downloaded. Each element which has the specified
+        tag is yielded as soon as it is completely parsed, and is cleared after the caller resumes
+        the generator, so that memory usage does not depend on the size of the response. The
+        caller must not keep the yielded elements.
+
+        :param service:       SOAP service name
+        :param action:        SOAP action name
+        :param action_params: SOAP action parameters
+        :param tag:           tag of the elements to be yielded, e.g. ``schedule_event``
+        :type  service:       str
+        :type  action:        str
+        :type  action_params: dict[str, str]
+        :type  tag:           str
+
+        :rtype:  generator of :py:class:`lxml.etree._Element`
+        :return: elements which have the specified tag
+        """
+
+        #
+        self._verify_soap_request_arguments(service, action, action_params)
+        if tag is None:
+            raise ArgumentNullError('tag')
+        if not isinstance(tag, str):
+            raise ArgumentTypeError('tag', str)
+
+        #
+        if not self._timing_hooks and not _tracer.enabled:
+            request_text = self._render_request_body(service, action, action_params)
+            return self._iterate_soap_response(service, action, request_text, tag)
+
+        timings = RequestTimings(service, action)
         try:
-            template = self._get_soap_request_template(service, action)
-        except Exception as ex:  # pragma: no cover
-            raise LogicError('Failed to get SOAP request template.') from ex
+            request_text = self._render_request_body(service, action, action_params)
+        except Exception as ex:
+            timings.error = ex
+            self._report_timings(timings, _start_soap_request_span(service, action))
+            raise
+
+        timings.lap('render')
+        start_span = _tracer.bind(functools.partial(_start_soap_request_span, service, action))
+        return self._iterate_timed_soap_response(
+            service, action, request_text, tag, timings, start_span)
+
+    def _execute_timed_soap_request(self, service, action, action_params):
+        # timings are also recorded for tracing, the span is ended with them
+        timings = RequestTimings(service, action)
+        span = _start_soap_request_span(service, action)
+        try:
+            request_text = self._render_request_body(service, action, action_params)
+            timings.lap('render')
+
+            response = self._send_soap_request(service, action, request_text, timings=timings)
+            data = response.content
+            timings.lap('send')
+            timings.response_bytes = len(data)
+
+            # the body is received by `requests` before it returns, its time is estimated from
+            # the time at which the headers were received
+            elapsed = getattr(response, 'elapsed', None)
+            if isinstance(elapsed, datetime.timedelta):
+                timings.move('send', 'receive', timings['send'] - elapsed.total_seconds())
 
+            result = self._parse_soap_response(data)
+            timings.lap('parse')
+            return result
+
+        except Exception as ex:
+            timings.error = ex
+            raise
+
+        finally:
+            self._report_timings(timings, span)
+
+    def _report_timings(self, timings, span):
+        # hooks are called while the result or the error of the request is being returned, which
+        # must not be replaced by errors of the hooks
+        for hook in self._timing_hooks:
+            try:
+                hook(timings)
+            except Exception:
+                _logger.warning('Timing hook %r failed.', hook, exc_info=True)
+
+        span.set_attribute('g4s.request_bytes', timings.request_bytes)
+        span.set_attribute('g4s.response_bytes', timings.response_bytes)
+        span.set_attribute('g4s.element_count', timings.elements)
+        for phase, seconds in timings.phases.items():
+            span.set_attribute('g4s.{0}_seconds'.format(phase), seconds)
+        if timings.error is not None:
+            span.record_exception(timings.error)
+
+        span.end()
+
+    def _get_events_in_range(self, start, end):
+        events = self._lookup_cached_events(start, end)
+        if events is not None:
+            _tracer.get_current_span().add_event(
+                'g4s.cache_hit', {'g4s.start': start.isoformat(), 'g4s.end': end.isoformat()})
+            return events
+
+        params = dict(start=start, end=end)
+        nodes = self.execute_streaming_soap_request(
+            'ScheduleService', 'ScheduleGetEvents', params, 'schedule_event')
+
+        if self._parse_processes is None:
+            events = self._parse_events(nodes, start, end)
+        else:
+            attributes = {'g4s.processes': self._parse_processes}
+            with _tracer.start_span('g4s.parse_events', attributes) as span:
+                events = self._parse_events_in_processes(nodes, start, end)
+                span.set_attribute('g4s.event_count', len(events))
+
+        self._store_cached_events(start, end, events)
+        _events_fetched.inc(len(events))
+
+        return events
+
+    def _get_target_events_in_range(self, start, end, target):
+        target_type, target_id = target
+        params = dict(start=start, end=end, target_type=target_type, target_id=target_id)
+        nodes = self.execute_streaming_soap_request(
+            'ScheduleService', 'ScheduleGetEventsByTarget', params, 'schedule_event')
+
+        events = self._parse_events(nodes, start, end)
+        _events_fetched.inc(len(events))
+
+        return events
+
+    def _execute_write_batches(
+            self, operation, function, items, batch_size, max_workers, written_events):
+        # returns pairs of a batch and its result, and pairs of a failed batch and the exception;
+        # a failed batch does not stop the others, since their changes cannot be rolled back.
+        # `written_events` are old and new events, whose ranges are invalidated in the cache
+        batches = [items[x:x + batch_size] for x in range(0, len(items), batch_size)]
+
+        def execute(batch):
+            try:
+                return batch, function(batch), None
+            except (NetworkError, RequestError, ResponseParseError) as ex:
+                return batch, None, ex
+
+        attributes = {'g4s.event_count': len(items), 'g4s.batch_count': len(batches)}
+        with _tracer.start_span('g4s.{0}_events'.format(operation), attributes) as span:
+            try:
+                if len(batches) <= 1:
+                    outcomes = [execute(b) for b in batches]
+                else:
+                    workers = min(max_workers, len(batches))
+                    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                        outcomes = list(executor.map(_tracer.bind(execute), batches))
+            finally:
+                # cached events are stale even if some of the requests failed
+                if batches:
+                    self._invalidate_cached_events(written_events)
+
+            results = [(b, r) for b, r, ex in outcomes if ex is None]
+            errors = [(tuple(b), ex) for b, r, ex in outcomes if ex is not None]
+            for batch, ex in errors:
+                span.record_exception(ex)
+
+        return results, errors
+
+    def _parse_event_versions(self, response):
         try:
-            return template.render(params)
-        except jinja2.exceptions.UndefinedError as ex:  # pragma: no cover
-            msg = 'Failed to render SOAP request body. Some required values are missing.'
-            raise LogicError(msg) from ex
-        except Exception as ex:  # pragma: no cover
-            raise LogicError('Failed to render SOAP request body.') from ex
+            return [
+                (int(n.attrib['id']), int(n.attrib['version']), n.attrib['operation'].lower())
+                for n in response.iter('event_item')]
+        except Exception as ex:
+            raise ResponseParseError('Failed to parse event versions.') from ex
+
+    def _parse_written_events(self, response, count):
+        # `ScheduleAddEvents` and `ScheduleModifyEvents` return events in the requested order
+        nodes = list(response.iter('schedule_event'))
+        if len(nodes) != count:
+            msg = 'The number of returned events ({0}) does not match the request ({1}).'
+            raise ResponseParseError(msg.format(len(nodes), count))
+
+        try:
+            events = [self._parse_single_event_node(node) for node in nodes]
+        except Exception as ex:
+            raise ResponseParseError('Failed to parse returned events.') from ex
+
+        if not all(isinstance(e, Event) for e in events):
+            raise ResponseParseError('Unexpected type of events are returned.')
 
-    def _get_soap_request_template(self, service, action):
-        template_dir = os.path.join(os.path.dirname(__file__), 'templates')
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
-        env.filters['utc_datetime'] = self._jinja2_filter_utc_datetime
+        return events
 
-        template = env.get_template('{0}.{1}.xml'.format(service, action))
-        return template
+    def _get_cached_soap_endpoints(self):
+        endpoints = self._lookup_cached_soap_endpoints()
+        if endpoints is not None:
+            return endpoints
 
-    def _send_soap_request(self, service, action, request_text):
-        # gets endpoint URL mapping if it is not already retrieved
-        if self._endpoint_cache is None:
-            self._endpoint_cache = self.get_soap_endpoints()
+        # only one thread per URL downloads WSDL, the others wait for and reuse its result
+        with _endpoint_cache_locks_lock:
+            lock = _endpoint_cache_locks[self._url]
 
+        with lock:
+            endpoints = self._lookup_cached_soap_endpoints()
+            if endpoints is None:
+                endpoints = self.get_soap_endpoints()
+                self._store_cached_soap_endpoints(endpoints)
+
+            return endpoints
+
+    def _send_soap_request(self, service, action, request_text, stream=False, timings=None):
         # gets URL for the specified service
-        endpoint_url = self._endpoint_cache.get(service)
+        endpoint_url = self._get_cached_soap_endpoints().get(service)
         if endpoint_url is None:
+            # the cached endpoints may be stale (e.g. the server was upgraded)
+            self._invalidate_soap_endpoints()
             msg = 'Failed to find endpoint URL of the specified service: {0}'
             raise RequestError(msg.format(service))
 
-        # performs HTTP POST
-        headers = {'Content-Type': 'application/soap+xml'}
+        # performs HTTP POST; compressed responses are decoded by urllib3, also while streaming
         data = request_text.encode('utf-8')
 
+        def post():
+            try:
+                body, headers = self._encode_request_body(endpoint_url, data)
+                if timings is not None:
+                    timings.request_bytes += len(body)
+
+                response = requests.post(
+                    endpoint_url, data=body, headers=headers, stream=stream,
+                    timeout=self._request_timeout)
+                if 'Content-Encoding' in headers and response.status_code == 415:
+                    response.close()
+                    self._disable_request_compression(endpoint_url)
+
+                    body, headers = self._encode_request_body(endpoint_url, data)
+                    response = requests.post(
+                        endpoint_url, data=body, headers=headers, stream=stream,
+                        timeout=self._request_timeout)
+
+                status = response.status_code
+                content = response.content if status >= 400 else None
+            except requests.Timeout as ex:
+                raise NetworkError('Timed out while performing HTTP POST request.') from ex
+            except requests.ConnectionError as ex:
+                # the cached endpoint may not exist any more (e.g. the server was moved)
+                self._invalidate_soap_endpoints()
+                raise NetworkError('Failed to perform HTTP POST request.') from ex
+            except Exception as ex:
+                raise NetworkError('Failed to perform HTTP POST request.') from ex
+
+            if content is not None:
+                response.close()
+                self._raise_for_status(status, content, 'Failed to perform HTTP POST request.')
+
+            return response
+
+        # a streamed response keeps its throttle slot until it is closed
+        with _observe_soap_request(action):
+            return self._call_remote(post, action in _IDEMPOTENT_ACTIONS, keeps_slot=stream)
+
+    def _call_remote(self, function, idempotent, keeps_slot=False):
+        # each attempt is throttled and guarded by the circuit breaker, so that retries stop once
+        # it is opened; requests rejected by the circuit breaker do not wait for the throttle
+        function = functools.partial(_call_throttled, self._throttle, function, keeps_slot)
+        if self._circuit_breaker is not None:
+            function = functools.partial(self._circuit_breaker.call, function)
+
+        if idempotent:
+            return self._retry_policy.call(function)
+
+        return function()
+
+    def _iterate_timed_soap_response(self, service, action, request_text, tag, timings,
+                                     start_span):
+        # the span is started by the first `next()`, since the body of a generator which is never
+        # iterated does not run and could not end it; it is ended when the generator is exhausted
+        # or closed. `start_span` is bound to the span of the caller, which is its parent even if
+        # the generator is consumed in another span. Time until the first element is requested is
+        # spent by the consumer
+        span = start_span()
+        timings.lap('convert')
+        nodes = self._iterate_soap_response(service, action, request_text, tag, timings)
         try:
-            response = requests.post(endpoint_url, data=data, headers=headers)
-            response.raise_for_status()
+            with contextlib.closing(nodes):
+                for node in nodes:
+                    timings.lap('parse')
+                    timings.elements += 1
+                    yield node
+                    timings.lap('convert')
+
         except Exception as ex:
-            raise NetworkError('Failed to perform HTTP POST request.') from ex
+            timings.error = ex
+            raise
+
+        finally:
+            self._report_timings(timings, span)
 
-        return response.text
+    def _iterate_soap_response(self, service, action, request_text, tag, timings=None):
+        response = self._send_soap_request(
+            service, action, request_text, stream=True, timings=timings)
 
-    def _parse_soap_response(self, response_text):
-        # parses response text as XML
         try:
-            response = lxml.etree.fromstring(response_text.encode('utf-8'))
-        except Exception as ex:
-            raise ResponseParseError('Failed to parse SOAP response.') from ex
+            # `raw` is read as is, the transfer encoding must be decoded by urllib3
+            stream = response.raw
+            stream.decode_content = True
+            if timings is not None:
+                timings.lap('send')
+                stream = _TimedStream(stream, timings)
+
+            fault_tag = '{{{0}}}Fault'.format(_SOAP_NSS['soap'])
+            parser = lxml.etree.iterparse(stream, events=('end', ), tag=(tag, fault_tag))
+
+            while True:
+                try:
+                    event, node = next(parser)
+                except StopIteration:
+                    break
+                except lxml.etree.XMLSyntaxError as ex:
+                    raise ResponseParseError('Failed to parse SOAP response.') from ex
+                except Exception as ex:
+                    raise NetworkError('Failed to read SOAP response.') from ex
+
+                if node.tag == fault_tag:
+                    self._raise_soap_fault(node)
+
+                # releases the elements which were already processed
+                while node.getprevious() is not None:
+                    del node.getparent()[0]
+
+                yield node
+                node.clear()
+
+        finally:
+            response.close()
+            self._throttle.release()
+
+
+class EventChanges(object):
+    """
+    Represents changes of events returned by
+    :py:meth:`g4s.cbgrn.api.CybozuGaroonApi.get_changed_events`.
+    """
 
-        # checks SOAP errors
-        nss = dict(soap='http://www.w3.org/2003/05/soap-envelope')
-        nodes = response.xpath('//soap:Fault', namespaces=nss)
-        if not nodes:
-            return response
+    def __init__(self, events, removed_ids, versions):
+        """
+        Initializes an instance of :py:class:`EventChanges` class.
+
+        :param events:      added or modified events
+        :param removed_ids: IDs of removed events
+        :param versions:    versions of all the known events after the changes
+        :type  events:      list of :py:class:`g4s.core.model.Event`
+        :type  removed_ids: list of int
+        :type  versions:    dict of (int, int)
+        """
 
-        # raises an exception for SOAP error
-        t = lambda ns: str(ns[0]) if ns and str(ns[0]) else 'unknown'
+        self._events = tuple(events)
+        self._removed_ids = tuple(removed_ids)
+        self._versions = versions
+
+    @property
+    def events(self):
+        """
+        Gets the added or modified events.
+        Occurrences of repeat events are expanded within the requested range.
 
-        fault_node = nodes[0]
+        :rtype: tuple of :py:class:`g4s.core.model.Event`
+        """
 
-        fault_reason = t(fault_node.xpath('./soap:Reason/soap:Text/text()', namespaces=nss))
-        fault_cause = t(fault_node.xpath('./soap:Detail/cause/text()', namespaces=nss))
-        fault_cm = t(fault_node.xpath('./soap:Detail/counter_measure/text()', namespaces=nss))
+        return self._events
 
-        #
-        params = fault_reason, fault_cause, fault_cm
-        msg = 'The remote server returned an error ({0} {1} {2})'.format(*params)
-        raise RequestError(msg)
+    @property
+    def removed_ids(self):
+        """
+        Gets IDs of the removed events.
+
+        :rtype: tuple of int
+        """
+
+        return self._removed_ids
+
+    @property
+    def versions(self):
+        """
+        Gets versions of all the known events after the changes, which should be passed to the
+        next call of :py:meth:`g4s.cbgrn.api.CybozuGaroonApi.get_changed_events`.
+
+        :rtype: dict of (int, int)
+        """
+
+        return self._versions
+
+
+def _get_circuit_breaker(url, options):
+    # `options` is (failure_threshold, reset_timeout) specified by the instance, or `None`
+    with _circuit_breakers_lock:
+        circuit_breaker, configured_options = _circuit_breakers.get(url, (None, None))
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker()
+
+        if options is not None:
+            if configured_options is not None and configured_options != options:
+                msg = ('The circuit breaker for "{0}" is already configured with '
+                       'circuit_failure_threshold={1} and circuit_reset_timeout={2}.')
+                raise ValueError(msg.format(url, *configured_options))
+
+            circuit_breaker.configure(*options)
+            configured_options = options
+
+        _circuit_breakers[url] = circuit_breaker, configured_options
+        return circuit_breaker
+
+
+class _TimedStream(object):
+    # a file-like object which attributes time spent in reading to `receive` phase, and time
+    # spent between reads (i.e. in the XML parser) to `parse` phase
+
+    def __init__(self, stream, timings):
+        self._stream = stream
+        self._timings = timings
+
+    def read(self, size=-1):
+        self._timings.lap('parse')
+        data = self._stream.read(size)
+        self._timings.lap('receive')
+        self._timings.response_bytes += len(data)
+        return data
+
+
+def _start_soap_request_span(service, action):
+    # the span is not made current, since streamed responses are consumed by the caller
+    return _tracer.start_span(
+        'g4s.execute_soap_request', {'g4s.service': service, 'g4s.action': action})
+
+
+def _get_throttle(url, max_concurrency, rate):
+    # requests of all the instances are throttled, even if they do not limit requests by themselves
+    with _throttles_lock:
+        throttle = _throttles.get(url)
+        if throttle is None:
+            throttle = Throttle()
+            _throttles[url] = throttle
+
+        if max_concurrency is None and rate is None:
+            return throttle
+
+        limits = throttle.max_concurrency, throttle.rate
+        if limits == (None, None):
+            throttle.configure(max_concurrency=max_concurrency, rate=rate)
+        elif limits != (max_concurrency, rate):
+            msg = ('The throttle for "{0}" is already configured with '
+                   'max_concurrent_requests={1} and max_requests_per_second={2}.')
+            raise ValueError(msg.format(url, *limits))
+
+        return throttle
+
+
+def _call_throttled(throttle, function, keeps_slot):
+    throttle.acquire()
+    try:
+        result = function()
+    except BaseException:
+        throttle.release()
+        raise
+
+    if not keeps_slot:
+        throttle.release()
+
+    return result
+
+
+@contextlib.contextmanager
+def _observe_soap_request(action):
+    # records latency and failure of a SOAP request, also used by `AsyncCybozuGaroonApi`
+    try:
+        with _soap_request_duration.time(action=action):
+            yield
+    except Exception:
+        _soap_request_errors.inc(action=action)
+        raise
+
+
+def _get_parse_executor(processes):
+    with _parse_executors_lock:
+        executor = _parse_executors.get(processes)
+        if executor is None:
+            # worker processes are spawned, since forking a multi-threaded process is unsafe
+            context = multiprocessing.get_context('spawn')
+            executor = concurrent.futures.ProcessPoolExecutor(processes, mp_context=context)
+            _parse_executors[processes] = executor
+
+        return executor
+
+
+def _serialize_event_shards(nodes, shard_size):
+    shard = []
+    for node in nodes:
+        shard.append(lxml.etree.tostring(node, with_tail=False))
+        if len(shard) == shard_size:
+            yield b''.join(shard)
+            shard = []
+
+    if shard:
+        yield b''.join(shard)
+
+
+def _parse_event_shard(data, start=None, end=None, expand_repeat_event=None):
+    # runs in worker processes, the returned events are pickled; pickling keeps participants
+    # shared within a shard
+    root = lxml.etree.fromstring(b'<shard>' + data + b'</shard>')
+    nodes = root.iterchildren('schedule_event')
+    return tuple(CybozuGaroonApi._create_event_parser(
+        nodes, start, end, expand_repeat_event, ParticipantPool()))
+
+
+def _verify_datetime_range(start, end):
+    if start is None:
+        raise ArgumentNullError('start')
+    if end is None:
+        raise ArgumentNullError('end')
+
+    if not isinstance(start, DateTime):
+        raise ArgumentTypeError('start', DateTime)
+    if not isinstance(end, DateTime):
+        raise ArgumentTypeError('end', DateTime)
+
+    if start > end:
+        raise ValueError('`start` must be same as `end`, or comes before `end`.')
+
+
+def _split_datetime_range(start, end, size):
+    ranges = []
+    current = start
+    while True:
+        boundary = current + size
+        if boundary >= end:
+            ranges.append((current, end))
+            return ranges
+
+        ranges.append((current, boundary))
+        current = boundary
+
+
+def _verify_events(events, requires_id):
+    if events is None:
+        raise ArgumentNullError('events')
+
+    try:
+        events = list(events)
+    except TypeError:
+        raise ArgumentTypeError('events', (tuple, list))
+
+    if not all(isinstance(e, Event) for e in events):
+        raise ArgumentTypeError('events[*]', Event)
+    if requires_id and any(e.id is None for e in events):
+        raise ValueError('All of `events` must have ID.')
+
+    return events
+
+
+def _verify_targets(targets):
+    if targets is None:
+        raise ArgumentNullError('targets')
+
+    try:
+        targets = list(targets)
+    except TypeError:
+        raise ArgumentTypeError('targets', (tuple, list))
+
+    if not all(isinstance(t, tuple) and len(t) == 2 for t in targets):
+        raise ArgumentTypeError('targets[*]', tuple)
+    if not all(t[0] in _TARGET_TYPES for t in targets):
+        raise ValueError('Target type must be "user", "group" or "facility".')
+
+    # removes duplicated targets, keeping the order
+    return list(collections.OrderedDict.fromkeys(targets))
+
+
+def _create_event_params(event, id='dummy', version='dummy'):
+    all_day = event.is_allday
+    start_only = not all_day and event.end is None
+    end = event.start if start_only else event.end
+
+    # new events do not have IDs and versions yet
+    return dict(
+        id=id,
+        version=version,
+        event_type='banner' if event.type == Event.BANNER else 'normal',
+        public_type='public' if event.is_public else 'private',
+        detail=event.title,
+        description=event.description,
+        timezone=event.start.tzinfo.g4s_name,
+        end_timezone=end.tzinfo.g4s_name,
+        allday='true' if all_day else 'false',
+        start_only='true' if start_only else 'false',
+        member_ids=[p.id for p in event.participants],
+        start=event.start,
+        end=None if start_only else event.end,
+        start_date=event.start.strftime('%Y-%m-%d'),
+        end_date=end.strftime('%Y-%m-%d'))
 
-    def _jinja2_filter_utc_datetime(self, dt):
-        dt = dt.astimezone(TimeZone.get('UTC'))
-        return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _copy_events(events):
+    # participants are not copied, since they are shared by events anyway
+    return tuple(copy.copy(e) for e in events)
+
+
+def _get_event_cache_range(event):
+    # returns the range in the format of response cache keys, which is widened by a day since
+    # all-day events are stored by their local dates
+    day = datetime.timedelta(days=1)
+    end = event.end if event.end is not None else event.start
+    return format_utc_datetime(event.start - day), format_utc_datetime(end + day)
+
+
+def _apply_event_difference(event, difference):
+    values = event.to_dict()
+    for key, (old_value, new_value) in difference.items():
+        if key not in values or key == 'id':
+            raise ValueError('Unsupported field is specified: {0}'.format(key))
+        values[key] = new_value
+
+    return Event(participants=event.participants, version=event.version, **values)
+
+
+def _create_batch_request_error(operation, count, results, errors):
+    failed = sum(len(b) for b, ex in errors)
+    msg = 'Failed to {0} {1} of {2} events.'.format(operation, failed, count)
+    return BatchRequestError(msg, results, errors)
+
+
+def _get_optional_param(params, key, type, default):
+    if key not in params:
+        return default
+
+    # `bool` is a subclass of `int`, however, `True` should not be accepted as a number
+    types = type if isinstance(type, tuple) else (type, )
+    value = params[key]
+    if value is not None:
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            raise ArgumentTypeError('params[{0}]'.format(key), type)
+
+    return value
 
 
 class _RepeatEventRule(object):
+    """
+    A rule of repeat event, which is expanded into occurrences by :py:meth:`resolve`.
+
+    ``repeat_type`` is one of the following Garoon repeat types.
+
+    * ``day``: every day
+    * ``weekday``: every Monday to Friday
+    * ``week``: every ``repeat_week`` (``0`` is Sunday, ``6`` is Saturday)
+    * ``1stweek``, ``2ndweek``, ``3rdweek``, ``4thweek``, ``lastweek``: the specified
+      ``repeat_week`` of every month
+    * ``month``: ``repeat_day`` of every month (``0`` is the last day), months which do not have
+      the day are skipped
+
+    Dates of occurrences are cached process-wide as ordinals, keyed by ID, last update and the
+    repeat condition, so that the same series is not expanded again for overlapping windows.
+    """
+
+    _NTH_WEEK_TYPES = {'1stweek': 0, '2ndweek': 1, '3rdweek': 2, '4thweek': 3}
+
     def __init__(
-            self, id, type, detail, description, all_day, start_only,
-            members, is_public, last_update,
-            repeat_type, repeat_day, repeat_week, repeat_start_date, repeat_end_date,
-            exclusive_datetimes):
-
-            self.id = id
-            self.type = type.lower()
-            self.detail = detail
-            self.description = description
-            self.is_all_day = all_day
-            self.is_start_only = start_only
-            self.repeat_type = repeat_type
-            self.repeat_day = repeat_day
-            self.repeat_week = repeat_week
-            self.repeat_start_date = repeat_start_date
-            self.repeat_end_date = repeat_end_date
-            self.exclusive_datetimes = exclusive_datetimes
-
-    def resolve(self):
-        if self.type == 'day':
-            return self._resolve_day_type()
-        elif self.type == 'weekday':
-            return self._resolve_weekday_type()
-        elif self.type in ('1stweek', '2ndweek', '3rdweek', '4thweek'):
-            return self._resolve_x_week_type()
-        elif self.type == 'lastweek':
-            return self._resolve_last_week_type()
-        elif self.type == 'month':
-            return self._resolve_month_type()
+            self, id, detail, description, all_day, start_only, members, is_public, last_update,
+            start_tz_name, end_tz_name, repeat_type, repeat_day, repeat_week,
+            repeat_start_date, repeat_end_date, start_time, end_time, exclusive_datetimes,
+            version=None):
+
+        repeat_type = repeat_type.lower()
+        if repeat_type not in ('day', 'weekday', 'week', 'lastweek', 'month') and \
+                repeat_type not in _RepeatEventRule._NTH_WEEK_TYPES:
+            raise ValueError('Unsupported repeat type: {0}'.format(repeat_type))
+        if not all_day and start_time is None:
+            raise ValueError('`start_time` is required for repeat events except all-day ones.')
+        if not (all_day or start_only) and end_time is None:
+            raise ValueError('`end_time` is required for repeat events which have end.')
+
+        self.id = id
+        self.detail = detail
+        self.description = description
+        self.is_all_day = all_day
+        self.is_start_only = start_only
+        self.members = members
+        self.is_public = is_public
+        self.last_update = last_update
+        self.version = version
+        # datetimes which share a tzinfo instance are compared without computing UTC offsets
+        self.start_tz = TimeZone.get(start_tz_name)
+        self.end_tz = self.start_tz if end_tz_name == start_tz_name else TimeZone.get(end_tz_name)
+        self.repeat_type = repeat_type
+        self.repeat_day = repeat_day
+        self.repeat_week = repeat_week
+        self.repeat_start_date = repeat_start_date
+        self.repeat_end_date = repeat_end_date
+        self.start_time = start_time
+        self.end_time = end_time
+
+        # overlapping exclusions are merged, so that a binary search finds the only candidate
+        self._exclusion_starts = []
+        self._exclusion_ends = []
+        for start, end in sorted(exclusive_datetimes, key=lambda r: r[0]):
+            if self._exclusion_ends and start <= self._exclusion_ends[-1]:
+                self._exclusion_ends[-1] = max(self._exclusion_ends[-1], end)
+            else:
+                self._exclusion_starts.append(start)
+                self._exclusion_ends.append(end)
+
+        self._cache_key = (
+            id, last_update, start_tz_name, end_tz_name, repeat_type, repeat_day, repeat_week,
+            repeat_start_date, repeat_end_date, start_time, end_time,
+            tuple(self._exclusion_starts), tuple(self._exclusion_ends))
+
+    def resolve(self, start=None, end=None):
+        """
+        Yields occurrences which overlap with ``[start, end)``.
+        Only dates around the range are visited, regardless of the length of the repeat.
+
+        :param start: start of the range, or :py:const:`None` for the first occurrence
+        :param end:   end of the range, or :py:const:`None` for the last occurrence
+        :type  start: :py:class:`g4s.core.date.DateTime`
+        :type  end:   :py:class:`g4s.core.date.DateTime`
+
+        :rtype:  generator of :py:class:`g4s.core.model.Event`
+        :return: occurrences
+        """
+
+        start, end, first, last = self._get_date_range(start, end)
+
+        for ordinal in self._get_occurrence_ordinals(first, last):
+            event = self._create_occurrence(datetime.date.fromordinal(ordinal))
+
+            # all-day occurrences last until the end of the day
+            occurrence_end = event.end if event.end is not None else event.start
+            if self.is_all_day:
+                occurrence_end = event.end + datetime.timedelta(1)
+            if end is not None and event.start >= end:
+                continue
+            if start is not None and occurrence_end <= start and event.start < start:
+                continue
+
+            yield event
+
+    def _get_date_range(self, start, end):
+        # the range is converted into the time zone of the event once, and one-day margins
+        # absorb the difference between start and end time zones of the event
+        if start is not None:
+            start = start.astimezone(self.start_tz)
+        if end is not None:
+            end = end.astimezone(self.start_tz)
+
+        first = self.repeat_start_date
+        if start is not None:
+            first = max(first, start.date() - datetime.timedelta(1))
+
+        last = self.repeat_end_date
+        if end is not None:
+            window_last = end.date() + datetime.timedelta(1)
+            last = window_last if last is None else min(last, window_last)
+        if last is None:
+            raise ValueError('`end` is required to resolve repeat events without end date.')
+
+        return start, end, first, last
+
+    def _get_occurrence_ordinals(self, first, last):
+        if first > last:
+            return ()
+
+        low, high = first.toordinal(), last.toordinal()
+        entry = _occurrence_cache.get(self._cache_key)
+
+        # cached ordinals are reused if the ranges overlap or adjoin, otherwise replaced
+        if entry is not None and entry[0] <= high + 1 and low - 1 <= entry[1]:
+            cached_low, cached_high, ordinals = entry
+            if low < cached_low or cached_high < high:
+                if low < cached_low:
+                    ordinals = self._expand_ordinals(low, cached_low - 1) + ordinals
+                if cached_high < high:
+                    ordinals = ordinals + self._expand_ordinals(cached_high + 1, high)
+
+                entry = (min(low, cached_low), max(high, cached_high), ordinals)
+                _occurrence_cache.set(self._cache_key, entry)
+
+        else:
+            ordinals = self._expand_ordinals(low, high)
+            _occurrence_cache.set(self._cache_key, (low, high, ordinals))
+
+        return ordinals[bisect.bisect_left(ordinals, low):bisect.bisect_right(ordinals, high)]
+
+    def _expand_ordinals(self, low, high):
+        dates = self._iterate_dates(datetime.date.fromordinal(low), datetime.date.fromordinal(high))
+        return array.array('l', (
+            d.toordinal() for d in dates if not self._is_excluded(self._get_occurrence_start(d))))
+
+    def _iterate_dates(self, first, last):
+        if first > last:
+            return
+
+        python_weekday = (self.repeat_week - 1) % 7
+        one_day = datetime.timedelta(1)
+
+        if self.repeat_type == 'day':
+            dates = _iterate_date_range(first, last, one_day)
+        elif self.repeat_type == 'weekday':
+            dates = (d for d in _iterate_date_range(first, last, one_day) if d.weekday() < 5)
+        elif self.repeat_type == 'week':
+            first += datetime.timedelta((python_weekday - first.weekday()) % 7)
+            dates = _iterate_date_range(first, last, datetime.timedelta(7))
         else:
-            raise LogicError
+            dates = (
+                self._get_monthly_date(year, month, python_weekday)
+                for year, month in _iterate_months(first, last))
+            dates = (d for d in dates if d is not None and first <= d <= last)
+
+        for date in dates:
+            yield date
+
+    def _get_monthly_date(self, year, month, python_weekday):
+        days = calendar.monthrange(year, month)[1]
+
+        if self.repeat_type == 'month':
+            day = self.repeat_day or days
+            return datetime.date(year, month, day) if day <= days else None
+
+        if self.repeat_type == 'lastweek':
+            last = datetime.date(year, month, days)
+            return last - datetime.timedelta((last.weekday() - python_weekday) % 7)
+
+        first = datetime.date(year, month, 1)
+        offset = (python_weekday - first.weekday()) % 7
+        return first + datetime.timedelta(offset + 7 * _RepeatEventRule._NTH_WEEK_TYPES[
+            self.repeat_type])
+
+    def _get_occurrence_start(self, date):
+        time = () if self.is_all_day else self.start_time
+        return DateTime.get(date.year, date.month, date.day, *time, tzinfo=self.start_tz)
+
+    def _create_occurrence(self, date):
+        start = self._get_occurrence_start(date)
+        if self.is_all_day:
+            end = DateTime.get(date.year, date.month, date.day, tzinfo=self.end_tz)
+        else:
+            end = None
+            if not self.is_start_only:
+                end = DateTime.get(
+                    date.year, date.month, date.day, *self.end_time, tzinfo=self.end_tz)
+
+        return Event(
+            self.id, Event.NORMAL, self.detail, self.description, start, end, self.is_all_day,
+            self.members, self.is_public, self.last_update, self.version)
+
+    def _is_excluded(self, start):
+        index = bisect.bisect_right(self._exclusion_starts, start) - 1
+        return index >= 0 and start < self._exclusion_ends[index]
+
+
+def _iterate_date_range(first, last, step):
+    current = first
+    while current <= last:
+        yield current
+        current += step
+
+
+def _iterate_months(first, last):
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _parse_date(text):
+    return datetime.datetime.strptime(text, '%Y-%m-%d').date()
+
 
-    def _resolve_day_type(self):
-        current = self.start_date
-        while current < self.end_date:
-            yield current
-            current += datetime.timedelta(days=1)
+def _parse_time(text):
+    return tuple(int(x) for x in text.split(':'))
 
-    def _resolve_weekday_type(self):
-        pass
 
-    def _resolve_x_week_type(self):
-        pass
+def _parse_datetime_with_offset(text, tzinfo):
+    # unlike `DateTime.parse`, UTC offset in the text is respected
+    if isinstance(tzinfo, str):
+        tzinfo = TimeZone.get(tzinfo)
 
-    def _resolve_last_week_type(self):
-        pass
+    dt = dateutil.parser.parse(text)
+    if dt.tzinfo is None:
+        return DateTime.get(*dt.timetuple()[:6], tzinfo=tzinfo)
 
-    def _resolve_month_type(self):
-        pass
+    return DateTime.get(*dt.astimezone(tzinfo).timetuple()[:6], tzinfo=tzinfo)
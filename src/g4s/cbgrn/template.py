@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+SOAP request rendering for Cybozu Garoon API.
+
+The SOAP envelope (authentication header etc.) has the same shape for all actions, so it is
+rendered with plain string formatting. Only the action specific body is rendered with the Jinja2
+template ``templates/<service>.<action>.xml``, which is compiled once per process.
+"""
+
+__all__ = (
+    'SoapRequestTemplateRegistry',
+    'configure_bytecode_cache',
+    'format_utc_datetime',
+    'render_soap_envelope',
+    'render_soap_request',
+)
+
+import datetime
+import os
+import threading
+import xml.sax.saxutils
+import jinja2
+from ..core.arg import ArgumentNullError
+from ..core.arg import ArgumentTypeError
+
+
+_TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+_SOAP_ENVELOPE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soap:Envelope
+  xmlns:soap="http://www.w3.org/2003/05/soap-envelope"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+  xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+  <soap:Header>
+    <Action
+      soap:mustUnderstand="1"
+      xmlns="http://schemas.xmlsoap.org/ws/2003/03/addressing">{action}</Action>
+    <Timestamp
+      soap:mustUnderstand="1"
+      Id="id"
+      xmlns="http://schemas.xmlsoap.org/ws/2002/07/utility">
+      <Created>{created}</Created>
+      <Expires>{expires}</Expires>
+    </Timestamp>
+    <Security soap:mustUnderstand="1">
+      <UsernameToken>
+        <Username>{login_name}</Username>
+        <Password>{password}</Password>
+      </UsernameToken>
+    </Security>
+    <Locale>{language}</Locale>
+  </soap:Header>
+  <soap:Body>
+{body}
+  </soap:Body>
+</soap:Envelope>'''
+
+
+class SoapRequestTemplateRegistry(object):
+    """
+    A registry which loads and compiles SOAP request body templates only once.
+    """
+
+    def __init__(self, template_dir, bytecode_cache_dir=None):
+        """
+        Initializes an instance of :py:class:`SoapRequestTemplateRegistry` class.
+
+        :param template_dir:       directory which contains ``<service>.<action>.xml`` templates
+        :param bytecode_cache_dir: directory to store compiled templates between processes, or
+                                   :py:const:`None`
+        :type  template_dir:       str
+        :type  bytecode_cache_dir: str
+        """
+
+        if template_dir is None:
+            raise ArgumentNullError('template_dir')
+        if not isinstance(template_dir, str):
+            raise ArgumentTypeError('template_dir', str)
+        if bytecode_cache_dir is not None and not isinstance(bytecode_cache_dir, str):
+            raise ArgumentTypeError('bytecode_cache_dir', str)
+
+        bytecode_cache = None
+        if bytecode_cache_dir is not None:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+
+        self._env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(template_dir),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False,
+            autoescape=True)
+        self._env.filters['utc_datetime'] = format_utc_datetime
+
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get_template(self, service, action):
+        """
+        Gets the compiled SOAP request body template for the specified action.
+
+        :param service: SOAP service name
+        :param action:  SOAP action name
+        :type  service: str
+        :type  action:  str
+
+        :rtype:  :py:class:`jinja2.Template`
+        :return: compiled template
+
+        :raises jinja2.TemplateNotFound: if the template does not exist
+        """
+
+        key = (service, action)
+        template = self._templates.get(key)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(key)
+                if template is None:
+                    template = self._env.get_template('{0}.{1}.xml'.format(service, action))
+                    self._templates[key] = template
+
+        return template
+
+    def render(self, service, action, params):
+        """
+        Renders SOAP request body of the specified action.
+
+        :param service: SOAP service name
+        :param action:  SOAP action name
+        :param params:  template parameters
+        :type  service: str
+        :type  action:  str
+        :type  params:  dict
+
+        :rtype:  str
+        :return: rendered SOAP request body
+        """
+
+        return self.get_template(service, action).render(params)
+
+
+def configure_bytecode_cache(directory):
+    """
+    Replaces the process-wide template registry with one which stores compiled templates in the
+    specified directory, so that other processes can skip compilation.
+
+    :param directory: directory to store compiled templates, or :py:const:`None` to disable
+    :type  directory: str
+    """
+
+    global _registry
+    _registry = SoapRequestTemplateRegistry(_TEMPLATE_DIR, directory)
+
+
+def render_soap_envelope(action, body, created, expires, login_name, password, language):
+    """
+    Renders SOAP envelope which wraps the specified request body.
+
+    :param action:     SOAP action name
+    :param body:       rendered SOAP request body
+    :param created:    creation date time of the request
+    :param expires:    expiration date time of the request
+    :param login_name: login name
+    :param password:   password
+    :param language:   language of SOAP response
+    :type  action:     str
+    :type  body:       str
+    :type  created:    :py:class:`g4s.core.date.DateTime`
+    :type  expires:    :py:class:`g4s.core.date.DateTime`
+    :type  login_name: str
+    :type  password:   str
+    :type  language:   str
+
+    :rtype:  str
+    :return: SOAP request text
+    """
+
+    escape = xml.sax.saxutils.escape
+    return _SOAP_ENVELOPE.format(
+        action=escape(action),
+        created=format_utc_datetime(created),
+        expires=format_utc_datetime(expires),
+        login_name=escape(login_name),
+        password=escape(password),
+        language=escape(language),
+        body=body)
+
+
+def render_soap_request(service, action, header_params, action_params):
+    """
+    Renders whole SOAP request using the process-wide template registry.
+
+    :param service:       SOAP service name
+    :param action:        SOAP action name
+    :param header_params: keyword arguments of :py:func:`render_soap_envelope` except ``action``
+                          and ``body``
+    :param action_params: parameters of the request body template
+    :type  service:       str
+    :type  action:        str
+    :type  header_params: dict
+    :type  action_params: dict
+
+    :rtype:  str
+    :return: SOAP request text
+    """
+
+    body = _registry.render(service, action, action_params)
+    return render_soap_envelope(action, body, **header_params)
+
+
+def format_utc_datetime(dt):
+    """
+    Formats the specified date time as UTC date time for SOAP requests.
+
+    :param dt: date time
+    :type  dt: :py:class:`g4s.core.date.DateTime`
+
+    :rtype:  str
+    :return: formatted text, e.g. ``2014-01-01T00:00:00Z``
+    """
+
+    # avoids `DateTime.astimezone` which is relatively slow because of argument verification
+    dt = datetime.datetime(
+        dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second) - dt.utcoffset()
+    return '{0:04d}-{1:02d}-{2:02d}T{3:02d}:{4:02d}:{5:02d}Z'.format(
+        dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+
+
+_registry = SoapRequestTemplateRegistry(_TEMPLATE_DIR)
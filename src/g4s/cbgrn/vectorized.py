@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Vectorized expansion of Cybozu Garoon repeat events, which requires NumPy.
+
+The expansion is equivalent to :py:meth:`resolve` of repeat event rules, however, dates, start and
+end of occurrences are computed as NumPy arrays, and :py:class:`g4s.core.model.Event` objects are
+created only when they are accessed.
+"""
+
+__all__ = (
+    'RepeatEventOccurrences',
+    'expand_repeat_event',
+)
+
+import datetime
+
+try:
+    import numpy
+except ImportError as e:
+    raise ImportError(
+        'g4s.cbgrn.vectorized requires NumPy, which is installed by '
+        '"pip install g4s[vectorized]" ({0})'.format(e))
+
+
+# UTC offsets are assumed to be constant between two datetimes which are this close and have the
+# same offset, since no time zone switches its offset twice within four weeks
+_MAX_CONSTANT_OFFSET_SPAN = 28 * 24 * 60 * 60
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class RepeatEventOccurrences(object):
+    """
+    A sequence of occurrences of a repeat event.
+    Items are created as :py:class:`g4s.core.model.Event` on access.
+    """
+
+    def __init__(self, rule, dates, starts, ends):
+        self._rule = rule
+        self._dates = dates
+        self._starts = starts
+        self._ends = ends
+
+    def __len__(self):
+        return len(self._dates)
+
+    def __getitem__(self, index):
+        date = self._dates[index].astype(datetime.date)
+        return self._rule._create_occurrence(date)
+
+    def __iter__(self):
+        for date in self._dates.astype(datetime.date):
+            yield self._rule._create_occurrence(date)
+
+    @property
+    def dates(self):
+        """
+        Gets local dates of occurrences.
+
+        :rtype: :py:class:`numpy.ndarray` of ``datetime64[D]``
+        """
+
+        return self._dates
+
+    @property
+    def starts(self):
+        """
+        Gets start of occurrences as UTC.
+
+        :rtype: :py:class:`numpy.ndarray` of ``datetime64[s]``
+        """
+
+        return self._starts
+
+    @property
+    def ends(self):
+        """
+        Gets end of occurrences as UTC, ``NaT`` for events which do not have end.
+
+        :rtype: :py:class:`numpy.ndarray` of ``datetime64[s]``
+        """
+
+        return self._ends
+
+
+def expand_repeat_event(rule, start=None, end=None):
+    """
+    Expands occurrences of the repeat event rule which overlap with ``[start, end)``.
+
+    :param rule:  repeat event rule created by :py:class:`g4s.cbgrn.api.CybozuGaroonApi`
+    :param start: start of the range, or :py:const:`None` for the first occurrence
+    :param end:   end of the range, or :py:const:`None` for the last occurrence
+    :type  start: :py:class:`g4s.core.date.DateTime`
+    :type  end:   :py:class:`g4s.core.date.DateTime`
+
+    :rtype:  :py:class:`g4s.cbgrn.vectorized.RepeatEventOccurrences`
+    :return: occurrences
+    """
+
+    start, end, first, last = rule._get_date_range(start, end)
+    dates = _generate_dates(rule, first, last)
+    local_dates = dates.astype('datetime64[s]').astype('int64')
+
+    # start, end and end of overlap in seconds since UTC epoch
+    if rule.is_all_day:
+        starts = _to_utc(rule.start_tz, local_dates)
+        ends = _to_utc(rule.end_tz, local_dates)
+        overlap_ends = _to_utc(rule.end_tz, local_dates + 24 * 60 * 60)
+    else:
+        starts = _to_utc(rule.start_tz, local_dates + _to_seconds(rule.start_time))
+        if rule.is_start_only:
+            ends = None
+            overlap_ends = starts
+        else:
+            ends = _to_utc(rule.end_tz, local_dates + _to_seconds(rule.end_time))
+            overlap_ends = ends
+
+    #
+    mask = ~_get_excluded(rule, starts)
+    if end is not None:
+        mask &= starts < end.timestamp()
+    if start is not None:
+        start_timestamp = start.timestamp()
+        mask &= ~((overlap_ends <= start_timestamp) & (starts < start_timestamp))
+
+    #
+    starts = starts[mask].astype('datetime64[s]')
+    if ends is None:
+        ends = numpy.full(len(starts), numpy.datetime64('NaT'), dtype='datetime64[s]')
+    else:
+        ends = ends[mask].astype('datetime64[s]')
+
+    return RepeatEventOccurrences(rule, dates[mask], starts, ends)
+
+
+def _generate_dates(rule, first, last):
+    if first > last:
+        return numpy.array([], dtype='datetime64[D]')
+
+    first = numpy.datetime64(first, 'D')
+    last = numpy.datetime64(last, 'D')
+    python_weekday = (rule.repeat_week - 1) % 7
+
+    #
+    if rule.repeat_type in ('day', 'weekday', 'week'):
+        dates = numpy.arange(first, last + 1, dtype='datetime64[D]')
+        if rule.repeat_type == 'weekday':
+            dates = dates[_get_weekdays(dates) < 5]
+        elif rule.repeat_type == 'week':
+            dates = dates[_get_weekdays(dates) == python_weekday]
+
+        return dates
+
+    #
+    months = numpy.arange(
+        first.astype('datetime64[M]'), last.astype('datetime64[M]') + 1, dtype='datetime64[M]')
+    month_starts = months.astype('datetime64[D]')
+    month_ends = (months + 1).astype('datetime64[D]') - 1
+
+    if rule.repeat_type == 'month':
+        if rule.repeat_day == 0:
+            dates = month_ends
+        else:
+            dates = month_starts + (rule.repeat_day - 1)
+            dates = dates[dates <= month_ends]
+    elif rule.repeat_type == 'lastweek':
+        dates = month_ends - (_get_weekdays(month_ends) - python_weekday) % 7
+    else:
+        nth = rule._NTH_WEEK_TYPES[rule.repeat_type]
+        dates = month_starts + (python_weekday - _get_weekdays(month_starts)) % 7 + 7 * nth
+
+    return dates[(first <= dates) & (dates <= last)]
+
+
+def _get_weekdays(dates):
+    # 1970-01-01 is Thursday, Monday is 0 as `datetime.date.weekday`
+    return (dates.astype('int64') + 3) % 7
+
+
+def _to_seconds(time):
+    hour, minute, second = (tuple(time) + (0, 0, 0))[:3]
+    return hour * 60 * 60 + minute * 60 + second
+
+
+def _to_utc(tzinfo, local_seconds):
+    return local_seconds - _get_utc_offsets(tzinfo, local_seconds)
+
+
+def _get_utc_offsets(tzinfo, local_seconds):
+    # offsets are computed only at the boundaries of segments, which are split until both
+    # boundaries have the same offset and are close enough
+    offsets = numpy.empty(len(local_seconds), dtype='int64')
+    if not len(local_seconds):
+        return offsets
+
+    cache = {}
+
+    def get_offset(index):
+        value = int(local_seconds[index])
+        if value not in cache:
+            dt = (_EPOCH + datetime.timedelta(seconds=value)).replace(tzinfo=tzinfo)
+            cache[value] = int(tzinfo.utcoffset(dt).total_seconds())
+
+        return cache[value]
+
+    segments = [(0, len(local_seconds) - 1)]
+    while segments:
+        first, last = segments.pop()
+        first_offset, last_offset = get_offset(first), get_offset(last)
+
+        span = local_seconds[last] - local_seconds[first]
+        if first_offset == last_offset and span <= _MAX_CONSTANT_OFFSET_SPAN:
+            offsets[first:last + 1] = first_offset
+        elif last - first <= 1:
+            offsets[first] = first_offset
+            offsets[last] = last_offset
+        else:
+            middle = (first + last) // 2
+            segments.append((first, middle))
+            segments.append((middle, last))
+
+    return offsets
+
+
+def _get_excluded(rule, starts):
+    if not rule._exclusion_starts:
+        return numpy.zeros(len(starts), dtype=bool)
+
+    exclusion_starts = numpy.array([dt.timestamp() for dt in rule._exclusion_starts])
+    exclusion_ends = numpy.array([dt.timestamp() for dt in rule._exclusion_ends])
+
+    # exclusions are sorted and do not overlap, only the last one which starts before each
+    # occurrence can contain it
+    indices = numpy.searchsorted(exclusion_starts, starts, side='right') - 1
+    candidates = exclusion_ends[numpy.maximum(indices, 0)]
+    return (indices >= 0) & (starts < candidates)
@@ -5,6 +5,7 @@ Calendar API interface.
 """
 
 __all__ = (
+    'BatchRequestError',
     'CalendarApi',
     'NetworkError',
     'RequestError',
@@ -150,3 +151,48 @@ class ResponseParseError(ValueError):
     """
 
     pass
+
+
+class BatchRequestError(RequestError):
+    """
+    An exception which is raised when some of requests sent in batches failed.
+    The results of the succeeded requests are kept, since they have already been applied to remote
+    server.
+    """
+
+    def __init__(self, message, results, errors):
+        """
+        Initializes an instance of :py:class:`BatchRequestError` class.
+
+        :param message: error message
+        :param results: results of the succeeded requests, which have the same shape as the
+                        return value of the method
+        :param errors:  pairs of items in a failed request and the exception
+        :type  message: str
+        :type  errors:  list of (tuple, :py:class:`Exception`)
+        """
+
+        super(BatchRequestError, self).__init__(message)
+        self._results = results
+        self._errors = tuple(errors)
+
+    @property
+    def results(self):
+        """
+        Gets the results of the succeeded requests.
+
+        :return: the results, which have the same shape as the return value of the method
+        """
+
+        return self._results
+
+    @property
+    def errors(self):
+        """
+        Gets the items in the failed requests and the exceptions.
+
+        :rtype:  tuple of (tuple, :py:class:`Exception`)
+        :return: pairs of items in a failed request and the exception
+        """
+
+        return self._errors
@@ -7,6 +7,7 @@ Function argument verification utilities.
 __all__ = (
     'ArgumentNullError',
     'ArgumentTypeError',
+    'verify_number',
 )
 
 
@@ -84,3 +85,32 @@ class ArgumentTypeError(TypeError):
         """
 
         return self._type
+
+
+def verify_number(name, value, type, minimum, exclusive=False):
+    """
+    Verifies that the argument is a number of the specified type in the specified range.
+    :py:class:`bool` is not accepted as a number.
+
+    :param name:      name of the argument
+    :param value:     value of the argument
+    :param type:      type of the argument, e.g. ``(int, float)``
+    :param minimum:   minimum value of the argument
+    :param exclusive: whether ``minimum`` itself is out of the range
+    :type  name:      str
+    :type  exclusive: bool
+
+    :raises g4s.core.arg.ArgumentNullError: if ``value`` is :py:const:`None`
+    :raises g4s.core.arg.ArgumentTypeError: if ``value`` is not an instance of ``type``
+    :raises ValueError:                     if ``value`` is out of the range
+    """
+
+    if value is None:
+        raise ArgumentNullError(name)
+    if isinstance(value, bool) or not isinstance(value, type):
+        raise ArgumentTypeError(name, type)
+
+    if exclusive and value <= minimum:
+        raise ValueError('`{0}` must be greater than {1}.'.format(name, minimum))
+    if value < minimum:
+        raise ValueError('`{0}` must be {1} or greater.'.format(name, minimum))
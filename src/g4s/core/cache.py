@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+"""
+Key-value caches with time-based expiry.
+"""
+
+__all__ = (
+    'FileCache',
+    'MemoryCache',
+)
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from .arg import ArgumentNullError
+from .arg import ArgumentTypeError
+
+
+_MISSING = object()
+
+_SALT_SIZE = 16
+
+
+class MemoryCache(object):
+    """
+    A thread-safe in-memory cache whose entries expire after the specified time-to-live.
+    When the number of entries exceeds ``max_size``, the least recently used entry is evicted.
+
+    .. code-block:: python
+
+        cache = MemoryCache(ttl=60, max_size=100)
+        cache.set('foo', 1)
+        cache.get('foo')  # => 1
+    """
+
+    def __init__(self, ttl=None, max_size=None, clock=None):
+        """
+        Initializes an instance of :py:class:`MemoryCache` class.
+
+        :param ttl:      default time-to-live of entries in seconds, or :py:const:`None` for
+                         entries which never expire
+        :param max_size: maximum number of entries, or :py:const:`None` for no limit
+        :param clock:    a function which returns current time in seconds (for testing)
+        :type  ttl:      int or float
+        :type  max_size: int
+        """
+
+        _validate_ttl(ttl)
+        if max_size is not None:
+            if isinstance(max_size, bool) or not isinstance(max_size, int):
+                raise ArgumentTypeError('max_size', int)
+            if max_size < 1:
+                raise ValueError('`max_size` must be positive.')
+
+        self._ttl = ttl
+        self._max_size = max_size
+        self._clock = clock or time.monotonic
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Gets the value associated with the specified key.
+
+        :param key:     key
+        :param default: a value to be returned when the key is not found or expired
+
+        :return: the cached value, or ``default``
+        """
+
+        now = self._clock()
+        with self._lock:
+            value, expires_at = self._entries.get(key, (_MISSING, None))
+            if value is not _MISSING and expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                value = _MISSING
+
+            if value is _MISSING:
+                self._misses += 1
+                return default
+
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Associates the specified value with the key.
+
+        :param key:   key
+        :param value: value to be cached
+        :param ttl:   time-to-live of the entry in seconds, overrides the default of the cache
+        :type  ttl:   int or float
+        """
+
+        if ttl is _MISSING:
+            ttl = self._ttl
+        _validate_ttl(ttl)
+
+        expires_at = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            if self._max_size is not None and len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        """
+        Removes the entry associated with the specified key if it exists.
+
+        :param key: key
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        """
+        Removes the entries whose keys satisfy the specified predicate.
+
+        :param predicate: a function which takes a key and returns :py:const:`True` if the entry
+                          should be removed
+
+        :rtype:  int
+        :return: number of removed entries
+        """
+
+        with self._lock:
+            keys = [k for k in self._entries if predicate(k)]
+            for key in keys:
+                del self._entries[key]
+
+            return len(keys)
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    @property
+    def hits(self):
+        """
+        Gets the number of lookups which found a live entry.
+
+        :rtype: int
+        """
+
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        Gets the number of lookups which found no live entry.
+
+        :rtype: int
+        """
+
+        return self._misses
+
+    @property
+    def evictions(self):
+        """
+        Gets the number of entries evicted because of ``max_size``.
+
+        :rtype: int
+        """
+
+        return self._evictions
+
+
+class FileCache(object):
+    """
+    A cache which stores pickled entries as files in the specified directory, so that the entries
+    can be shared between processes and survive restarts.
+
+    The key of an entry is pickled before its value, so that keys can be read without loading the
+    values (see :py:meth:`invalidate_if`).
+
+    The directory must be trusted. Entries are unpickled when they are read, so anyone who can
+    write to the directory can run code in processes which use the cache, and anyone who can
+    read it can read the cached values. The directory is created with mode ``0o700`` and entries
+    are written with mode ``0o600``, but the mode of an existing directory is kept.
+    """
+
+    def __init__(self, directory, ttl=None, clock=None):
+        """
+        Initializes an instance of :py:class:`FileCache` class.
+
+        :param directory: path of the cache directory, created if it does not exist
+        :param ttl:       default time-to-live of entries in seconds, or :py:const:`None`
+        :param clock:     a function which returns current UNIX time (for testing)
+        :type  directory: str
+        :type  ttl:       int or float
+
+        :raises g4s.core.arg.ArgumentNullError: if ``directory`` is :py:const:`None`
+        :raises g4s.core.arg.ArgumentTypeError: if ``directory`` is not :py:class:`str`
+        """
+
+        if directory is None:
+            raise ArgumentNullError('directory')
+        if not isinstance(directory, str):
+            raise ArgumentTypeError('directory', str)
+        _validate_ttl(ttl)
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        self._directory = directory
+        self._ttl = ttl
+        self._clock = clock or time.time
+        self._hits = 0
+        self._misses = 0
+        self._salt = None
+
+    def get(self, key, default=None):
+        """
+        Gets the value associated with the specified key.
+        Unreadable or corrupted entries are treated as missing.
+
+        :param key:     key, must be convertible to :py:class:`str` stably
+        :param default: a value to be returned when the key is not found or expired
+
+        :return: the cached value, or ``default``
+        """
+
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as fin:
+                stored_key = pickle.load(fin)
+                if stored_key != key:  # pragma: no cover
+                    self._misses += 1
+                    return default
+
+                value, expires_at = pickle.load(fin)
+        except Exception:
+            self._misses += 1
+            return default
+
+        if expires_at is not None and expires_at <= self._clock():
+            self.invalidate(key)
+            self._misses += 1
+            return default
+
+        self._hits += 1
+        return value
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Associates the specified value with the key.
+        The entry is written to a temporary file and renamed, so that concurrent readers never see
+        a partially written entry.
+
+        :param key:   key, must be convertible to :py:class:`str` stably
+        :param value: picklable value to be cached
+        :param ttl:   time-to-live of the entry in seconds, overrides the default of the cache
+        :type  ttl:   int or float
+        """
+
+        if ttl is _MISSING:
+            ttl = self._ttl
+        _validate_ttl(ttl)
+
+        expires_at = None if ttl is None else self._clock() + ttl
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                pickle.dump(key, fout, pickle.HIGHEST_PROTOCOL)
+                pickle.dump((value, expires_at), fout, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._get_path(key))
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    def invalidate(self, key):
+        """
+        Removes the entry associated with the specified key if it exists.
+
+        :param key: key
+        """
+
+        _unlink(self._get_path(key))
+
+    def invalidate_if(self, predicate):
+        """
+        Removes the entries whose keys satisfy the specified predicate. Entries which cannot be
+        read are kept, since they are never returned by :py:meth:`get`.
+
+        :param predicate: a function which takes a key and returns :py:const:`True` if the entry
+                          should be removed
+
+        :rtype:  int
+        :return: number of removed entries
+        """
+
+        count = 0
+        for path in self._list_paths():
+            try:
+                with open(path, 'rb') as fin:
+                    key = pickle.load(fin)
+            except Exception:
+                continue
+
+            if predicate(key) and _unlink(path):
+                count += 1
+
+        return count
+
+    def clear(self):
+        """
+        Removes all entries. Entries removed concurrently by other processes are ignored.
+        """
+
+        for path in self._list_paths():
+            _unlink(path)
+
+    @property
+    def salt(self):
+        """
+        Gets random bytes which are generated once for the directory, and are shared by all the
+        instances for it. Secrets in keys (e.g. passwords) must be hashed with the salt by a key
+        derivation function, since keys are written to the directory.
+
+        :rtype: bytes
+        """
+
+        if self._salt is None:
+            self._salt = self._read_or_create_salt()
+
+        return self._salt
+
+    @property
+    def hits(self):
+        """
+        Gets the number of lookups which found a live entry in this instance.
+
+        :rtype: int
+        """
+
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        Gets the number of lookups which found no live entry in this instance.
+
+        :rtype: int
+        """
+
+        return self._misses
+
+    def _get_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, digest + '.cache')
+
+    def _read_or_create_salt(self):
+        # the salt is linked into place, so that concurrent processes agree on a single salt
+        path = os.path.join(self._directory, 'salt')
+        if not os.path.exists(path):
+            fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as fout:
+                    fout.write(os.urandom(_SALT_SIZE))
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(temp_path)
+
+        with open(path, 'rb') as fin:
+            return fin.read()
+
+    def _list_paths(self):
+        return [
+            os.path.join(self._directory, name)
+            for name in os.listdir(self._directory) if name.endswith('.cache')]
+
+
+def _unlink(path):
+    # returns whether the file was removed by this call
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _validate_ttl(ttl):
+    if ttl is None:
+        return
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)):
+        raise ArgumentTypeError('ttl', (int, float))
+    if ttl < 0:
+        raise ValueError('`ttl` must not be negative.')
@@ -257,6 +257,10 @@ class TimeZone(datetime.tzinfo):
 
         return self.g4s_name != other.g4s_name
 
+    def __reduce__(self):
+        # unpickled instances are looked up by name, instead of pickling the underlying instance
+        return (TimeZone.get, (self._g4s_name,))
+
     def __repr__(self):  # pragma: no cover
         return '<g4s.core.date.TimeZone "{0}" at 0x{1:x}>'.format(self.g4s_name, id(self))
 
@@ -297,6 +301,9 @@ class TimeZone(datetime.tzinfo):
             raise ArgumentTypeError('name', str)
         if len(name) == 3 and (name.upper() not in ('UTC', 'GMT')):
             raise TimeZoneNotFoundError(name)
+        if not name:
+            # `gettz` returns the local time zone for an empty name since python-dateutil 2.7
+            raise TimeZoneNotFoundError(name)
 
         try:
             tz = dateutil.tz.gettz(name)
@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+
+"""
+A lightweight metrics registry which exposes counters, gauges and histograms in Prometheus text
+format.
+
+.. code-block:: python
+
+    from g4s.core.metrics import get_registry
+
+    registry = get_registry()
+    requests = registry.counter('app_requests_total', 'Number of requests.', ('action', ))
+    requests.inc(action='ScheduleGetEvents')
+
+    registry.write('/var/lib/node_exporter/g4s.prom')   # for textfile collectors
+    server = registry.serve(9464)                       # or a local HTTP endpoint
+"""
+
+__all__ = (
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'MetricsRegistry',
+    'MetricsServer',
+    'get_registry',
+)
+
+import contextlib
+import http.server
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from .arg import ArgumentNullError
+from .arg import ArgumentTypeError
+
+
+_NAME_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+_LABEL_NAME_PATTERN = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+# the default buckets of Prometheus client libraries, suited to latencies in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric(object):
+    # a metric which holds a value for each combination of label values
+
+    type = None
+
+    def __init__(self, name, help, label_names):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _get_key(self, labels):
+        if len(labels) != len(self.label_names):
+            msg = '`{0}` requires labels {1}.'.format(self.name, ', '.join(self.label_names))
+            raise ValueError(msg)
+
+        try:
+            return tuple(str(labels[name]) for name in self.label_names)
+        except KeyError:
+            msg = '`{0}` requires labels {1}.'.format(self.name, ', '.join(self.label_names))
+            raise ValueError(msg)
+
+    def _reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ''
+
+        return '{' + ','.join('{0}="{1}"'.format(n, _escape(v)) for n, v in pairs) + '}'
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+
+        for key, value in items:
+            yield '{0}{1} {2}'.format(self.name, self._format_labels(key), _format_value(value))
+
+    def render(self):
+        """
+        Renders the metric in Prometheus text format.
+
+        :rtype: str
+        """
+
+        help = self.help.replace('\\', '\\\\').replace('\n', '\\n')
+        lines = [
+            '# HELP {0} {1}'.format(self.name, help),
+            '# TYPE {0} {1}'.format(self.name, self.type)]
+        lines.extend(self._render_samples())
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """
+    A value which only increases, e.g. number of requests.
+    """
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases the value.
+
+        :param amount: non-negative amount
+        :param labels: values of the labels of the metric
+        """
+
+        if amount < 0:
+            raise ValueError('Counters cannot be decreased.')
+
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """
+        Gets the value.
+
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Gauge(_Metric):
+    """
+    A value which can increase and decrease, e.g. number of requests in progress.
+    """
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        """
+        Sets the value.
+
+        :param value:  the value
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases the value.
+
+        :param amount: amount, which may be negative
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """
+        Decreases the value.
+
+        :param amount: amount, which may be negative
+        :param labels: values of the labels of the metric
+        """
+
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        """
+        Gets the value.
+
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. latencies of requests.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, label_names, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, label_names)
+
+        buckets = sorted(float(b) for b in buckets)
+        if not buckets:
+            raise ValueError('`buckets` must not be empty.')
+        if buckets[-1] != math.inf:
+            buckets.append(math.inf)
+
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Observes a value.
+
+        :param value:  the value
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Returns a context manager which observes elapsed time in seconds while it is entered.
+
+        :param labels: values of the labels of the metric
+        """
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get_count(self, **labels):
+        """
+        Gets the number of observed values.
+
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            return state[2] if state is not None else 0
+
+    def get_sum(self, **labels):
+        """
+        Gets the sum of observed values.
+
+        :param labels: values of the labels of the metric
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            return state[1] if state is not None else 0.0
+
+    def _render_samples(self):
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._values.items())
+
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = self._format_labels(key, [('le', _format_value(bound))])
+                yield '{0}_bucket{1} {2}'.format(self.name, labels, cumulative)
+
+            labels = self._format_labels(key)
+            yield '{0}_sum{1} {2}'.format(self.name, labels, _format_value(total))
+            yield '{0}_count{1} {2}'.format(self.name, labels, count)
+
+
+class MetricsRegistry(object):
+    """
+    A collection of metrics, which is rendered in Prometheus text format.
+    Metrics are created on first use, and the same metric is returned for the same name.
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of :py:class:`MetricsRegistry` class.
+        """
+
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def counter(self, name, help, label_names=()):
+        """
+        Gets the counter which has the specified name, and creates it if it does not exist.
+
+        :param name:        name of the metric, e.g. ``g4s_events_fetched_total``
+        :param help:        description of the metric
+        :param label_names: names of the labels
+        :type  name:        str
+        :type  help:        str
+        :type  label_names: tuple of str
+
+        :rtype: :py:class:`g4s.core.metrics.Counter`
+        """
+
+        return self._get_or_create(Counter, name, help, label_names)
+
+    def gauge(self, name, help, label_names=()):
+        """
+        Gets the gauge which has the specified name, and creates it if it does not exist.
+        See :py:meth:`counter` for the parameters.
+
+        :rtype: :py:class:`g4s.core.metrics.Gauge`
+        """
+
+        return self._get_or_create(Gauge, name, help, label_names)
+
+    def histogram(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        Gets the histogram which has the specified name, and creates it if it does not exist.
+        See :py:meth:`counter` for the other parameters.
+
+        :param buckets: upper bounds of the buckets, ``+Inf`` is added implicitly
+        :type  buckets: tuple of float
+
+        :rtype: :py:class:`g4s.core.metrics.Histogram`
+        """
+
+        return self._get_or_create(Histogram, name, help, label_names, buckets)
+
+    def get(self, name):
+        """
+        Gets the metric which has the specified name.
+
+        :rtype:  :py:class:`g4s.core.metrics.Counter`, :py:class:`g4s.core.metrics.Gauge` or
+                 :py:class:`g4s.core.metrics.Histogram`
+        :return: the metric, or :py:const:`None` if it does not exist
+        """
+
+        with self._lock:
+            return self._metrics.get(name)
+
+    def reset(self):
+        """
+        Resets values of all the metrics. The metrics themselves are kept.
+        """
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+            metric._reset()
+
+    def render(self):
+        """
+        Renders all the metrics in Prometheus text format.
+
+        :rtype: str
+        """
+
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+
+        return ''.join(metric.render() for metric in metrics)
+
+    def write(self, path):
+        """
+        Writes all the metrics to the specified file in Prometheus text format.
+        The file is replaced atomically, so that readers never see a partially written file.
+
+        :param path: path of the file, e.g. in the directory of the textfile collector of
+                     Prometheus node exporter
+        :type  path: str
+        """
+
+        if path is None:
+            raise ArgumentNullError('path')
+        if not isinstance(path, str):
+            raise ArgumentTypeError('path', str)
+
+        data = self.render().encode('utf-8')
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def serve(self, port=0, host='127.0.0.1'):
+        """
+        Starts a HTTP server which responds to any ``GET`` request with all the metrics in
+        Prometheus text format, in a background thread.
+
+        :param port: port number, or ``0`` to use a free port
+        :param host: address to listen on, only local clients are accepted by default
+        :type  port: int
+        :type  host: str
+
+        :rtype:  :py:class:`g4s.core.metrics.MetricsServer`
+        :return: the started server
+        """
+
+        return MetricsServer(self, host, port)
+
+    def _get_or_create(self, type, name, help, label_names, *args):
+        if name is None:
+            raise ArgumentNullError('name')
+        if not isinstance(name, str):
+            raise ArgumentTypeError('name', str)
+        if not _NAME_PATTERN.match(name):
+            raise ValueError('Invalid metric name: {0}'.format(name))
+        if not all(isinstance(n, str) and _LABEL_NAME_PATTERN.match(n) for n in label_names):
+            raise ValueError('Invalid label names: {0}'.format(label_names))
+
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = type(name, help, label_names, *args)
+            elif not isinstance(metric, type) or metric.label_names != tuple(label_names):
+                msg = 'The metric `{0}` is already registered with different type or labels.'
+                raise ValueError(msg.format(name))
+
+            return metric
+
+
+class MetricsServer(object):
+    """
+    A HTTP server started by :py:meth:`g4s.core.metrics.MetricsRegistry.serve`.
+    """
+
+    def __init__(self, registry, host, port):
+        """
+        Initializes an instance of :py:class:`MetricsServer` class, and starts serving.
+        """
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                data = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        """
+        Gets the URL of the server.
+
+        :rtype: str
+        """
+
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}/metrics'.format(host, port)
+
+    def close(self):
+        """
+        Stops the server.
+        """
+
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def get_registry():
+    """
+    Gets the process-wide registry, which holds the metrics of g4s.
+
+    :rtype: :py:class:`g4s.core.metrics.MetricsRegistry`
+    """
+
+    return _registry
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+_registry = MetricsRegistry()
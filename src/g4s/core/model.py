@@ -6,6 +6,7 @@ Calendar event representation.
 
 __all__ = (
     'Participant',
+    'ParticipantPool',
     'Event',
     'InvalidEventDateTimePairError',
 )
@@ -42,6 +43,83 @@ class Participant(object):
         self.name = name
 
 
+class ParticipantPool(object):
+    """
+    A pool which interns participants, so that events which have the same members share
+    :py:class:`Participant` objects and member tuples instead of holding their own copies.
+
+    .. code-block:: python
+
+        pool = ParticipantPool()
+        members1 = pool.get_members([(1, 'foo'), (2, 'bar')])
+        members2 = pool.get_members([(1, 'foo'), (2, 'bar')])
+        members1 is members2  # => True
+
+    The interned participants are shared, so they must not be modified.
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of :py:class:`ParticipantPool` class.
+        """
+
+        self._participants = {}
+        self._members = {}
+
+    def __len__(self):
+        return len(self._participants)
+
+    def get(self, id, name):
+        """
+        Gets the participant which has the specified ID and name.
+
+        :param id:   ID of the participant
+        :param name: name of the participant
+        :type  name: str
+
+        :rtype:  :py:class:`g4s.core.model.Participant`
+        :return: the shared participant
+
+        :raises g4s.core.arg.ArgumentNullError: if the ``name`` is :py:const:`None`
+        :raises g4s.core.arg.ArgumentTypeError: if the ``name`` is not :py:class:`str`
+        """
+
+        key = (id, name)
+        participant = self._participants.get(key)
+        if participant is None:
+            # `setdefault` keeps the first one when another thread creates the same participant
+            participant = self._participants.setdefault(key, Participant(id, name))
+
+        return participant
+
+    def get_members(self, members):
+        """
+        Gets the tuple of participants which have the specified IDs and names.
+
+        :param members: pairs of ID and name of participants, in order
+        :type  members: list of (object, str)
+
+        :rtype:  tuple of :py:class:`g4s.core.model.Participant`
+        :return: the shared tuple of the participants
+        """
+
+        key = tuple(members)
+        participants = self._members.get(key)
+        if participants is None:
+            participants = tuple(self.get(id, name) for id, name in key)
+            participants = self._members.setdefault(key, participants)
+
+        return participants
+
+    def clear(self):
+        """
+        Removes all the interned participants.
+        """
+
+        self._participants.clear()
+        self._members.clear()
+
+
 class Event(object):
     """
     Represents an event.
@@ -52,7 +130,7 @@ class Event(object):
 
     def __init__(
             self, id, type, title, description, start, end, is_allday, participants,
-            is_public, last_update):
+            is_public, last_update, version=None):
         """
         Initializes an instance of :py:class:`Event` class.
 
@@ -65,6 +143,8 @@ class Event(object):
         :param is_allday:    all-day event flag
         :param participants: collection of participants
         :param last_update:  last-update date time
+        :param version:      version of the event in the remote calendar, which is sent to
+                             detect conflicting modifications, or :py:const:`None` if unknown
         :type type:          int
         :type title:         str
         :type description:   str
@@ -90,6 +170,7 @@ class Event(object):
         self.participants = participants
         self.is_public = is_public
         self.last_update = last_update
+        self.version = version
 
     def is_same_event(self, other):
         """
@@ -132,7 +213,7 @@ class Event(object):
 
         .. note::
 
-           The ``participants`` field cannot be serialized.
+           The ``participants`` and ``version`` fields are not contained.
         """
 
         return dict(
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+"""
+Retry and circuit breaker utilities for unreliable remote calls.
+"""
+
+__all__ = (
+    'CircuitBreaker',
+    'CircuitOpenError',
+    'RetryPolicy',
+)
+
+import random
+import threading
+import time
+from .api import NetworkError
+from .arg import verify_number
+from .metrics import get_registry
+
+
+# totals across all the policies, which are exposed by `g4s.core.metrics`
+_retries = get_registry().counter('g4s_retries_total', 'Number of retries of remote calls.')
+_remote_call_failures = get_registry().counter(
+    'g4s_remote_call_failures_total', 'Number of remote calls which failed after all attempts.')
+
+
+class RetryPolicy(object):
+    """
+    Retries a function which fails with :py:class:`g4s.core.api.NetworkError`, waiting for
+    exponentially increasing, randomized ("full jitter") delays between the attempts.
+
+    .. code-block:: python
+
+        policy = RetryPolicy(max_attempts=3, base_delay=0.5)
+        response = policy.call(requests.get, url)
+
+    .. note::
+
+        Only idempotent operations should be retried, since a failed attempt might have been
+        processed by the remote server.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=10.0, jitter=True):
+        """
+        Initializes an instance of :py:class:`RetryPolicy` class.
+
+        :param max_attempts: maximum number of attempts, ``1`` disables retry
+        :param base_delay:   delay before the first retry in seconds
+        :param max_delay:    upper bound of delays in seconds
+        :param jitter:       randomizes delays to avoid synchronized retries of many clients
+        :type  max_attempts: int
+        :type  base_delay:   int or float
+        :type  max_delay:    int or float
+        :type  jitter:       bool
+        """
+
+        verify_number('max_attempts', max_attempts, int, 1)
+        verify_number('base_delay', base_delay, (int, float), 0)
+        verify_number('max_delay', max_delay, (int, float), 0)
+
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._jitter = jitter
+
+        self._lock = threading.Lock()
+        self._retries = 0
+        self._failures = 0
+
+    def get_delay(self, retry):
+        """
+        Gets delay before the specified retry.
+
+        :param retry: retry number, starts with ``1``
+        :type  retry: int
+
+        :rtype:  float
+        :return: delay in seconds
+        """
+
+        delay = min(self._max_delay, self._base_delay * (2 ** (retry - 1)))
+        return random.uniform(0, delay) if self._jitter else delay
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls the specified function, and retries it if it fails with a network error.
+
+        :param function: function to be called
+        :param args:     positional arguments of the function
+        :param kwargs:   keyword arguments of the function
+
+        :return: the return value of the function
+
+        :raises g4s.core.api.NetworkError: if all attempts failed
+        """
+
+        retry = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except NetworkError as ex:
+                retry += 1
+                if not self.should_retry(ex, retry):
+                    raise
+
+            time.sleep(self.get_delay(retry))
+
+    def should_retry(self, ex, retry):
+        """
+        Decides whether the failed call should be retried, and updates the counters.
+        This method is used to implement retry loops for coroutines.
+
+        :param ex:    the exception raised by the failed attempt
+        :param retry: number of the next retry, starts with ``1``
+        :type  ex:    :py:class:`g4s.core.api.NetworkError`
+        :type  retry: int
+
+        :rtype:  bool
+        :return: :py:const:`True` if the call should be retried
+        """
+
+        if isinstance(ex, CircuitOpenError) or retry >= self._max_attempts:
+            self._count('_failures')
+            _remote_call_failures.inc()
+            return False
+
+        self._count('_retries')
+        _retries.inc()
+        return True
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def retries(self):
+        """
+        Gets the number of retries.
+
+        :rtype: int
+        """
+
+        return self._retries
+
+    @property
+    def failures(self):
+        """
+        Gets the number of calls which failed after all attempts.
+
+        :rtype: int
+        """
+
+        return self._failures
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a remote server while it is considered unhealthy.
+
+    The circuit is opened after ``failure_threshold`` consecutive network errors. While the circuit
+    is open, calls fail immediately with :py:class:`g4s.core.retry.CircuitOpenError`. After
+    ``reset_timeout`` seconds, one trial call is allowed ("half-open" state); the circuit is closed
+    if it succeeds, and is opened again if it fails with a network error. Another trial call is
+    allowed if it ends otherwise, e.g. it is cancelled or the server rejects the request.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=None):
+        """
+        Initializes an instance of :py:class:`CircuitBreaker` class.
+
+        :param failure_threshold: number of consecutive failures to open the circuit
+        :param reset_timeout:     seconds to wait before a trial call
+        :param clock:             a function which returns current time in seconds (for testing)
+        :type  failure_threshold: int
+        :type  reset_timeout:     int or float
+        """
+
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self.configure(failure_threshold, reset_timeout)
+
+        self._state = CircuitBreaker.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._failures = 0
+        self._rejections = 0
+        self._trips = 0
+
+    def configure(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Changes the thresholds, e.g. of a circuit breaker shared by several clients. The state of
+        the circuit is not changed. See :py:meth:`__init__` for the parameters.
+        """
+
+        verify_number('failure_threshold', failure_threshold, int, 1)
+        verify_number('reset_timeout', reset_timeout, (int, float), 0)
+
+        with self._lock:
+            self._failure_threshold = failure_threshold
+            self._reset_timeout = reset_timeout
+
+    def call(self, function, *args, **kwargs):
+        """
+        Calls the specified function unless the circuit is open.
+
+        :param function: function to be called
+        :param args:     positional arguments of the function
+        :param kwargs:   keyword arguments of the function
+
+        :return: the return value of the function
+
+        :raises g4s.core.retry.CircuitOpenError: if the circuit is open
+        """
+
+        trial = self.before_call()
+        try:
+            result = function(*args, **kwargs)
+        except NetworkError:
+            self.record_failure()
+            raise
+        except BaseException:
+            if trial:
+                self.release_trial()
+            raise
+
+        self.record_success()
+        return result
+
+    def before_call(self):
+        """
+        Checks whether a call is allowed, and switches the circuit to half-open state if the reset
+        timeout has elapsed. This method and :py:meth:`record_success` / :py:meth:`record_failure`
+        / :py:meth:`release_trial` are used to guard coroutines.
+
+        :rtype:  bool
+        :return: :py:const:`True` if the call is the trial call in half-open state
+
+        :raises g4s.core.retry.CircuitOpenError: if the circuit is open
+        """
+
+        with self._lock:
+            if self._state == CircuitBreaker.CLOSED:
+                return False
+
+            if self._state == CircuitBreaker.OPEN:
+                if self._clock() - self._opened_at >= self._reset_timeout:
+                    self._state = CircuitBreaker.HALF_OPEN
+                    return True
+
+            # only one trial call is allowed in half-open state
+            self._rejections += 1
+
+        raise CircuitOpenError('The circuit is open because the server seems unhealthy.')
+
+    def record_success(self):
+        """
+        Records a successful call, and closes the circuit.
+        """
+
+        with self._lock:
+            self._state = CircuitBreaker.CLOSED
+            self._consecutive_failures = 0
+
+    def release_trial(self):
+        """
+        Records the trial call which neither succeeded nor failed with a network error (e.g. it was
+        cancelled), so that the next call becomes a trial call. This method must be called only if
+        :py:meth:`before_call` returned :py:const:`True`.
+        """
+
+        with self._lock:
+            if self._state == CircuitBreaker.HALF_OPEN:
+                self._state = CircuitBreaker.OPEN
+
+    def record_failure(self):
+        """
+        Records a failed call, and opens the circuit if necessary.
+        """
+
+        with self._lock:
+            self._failures += 1
+            self._consecutive_failures += 1
+            if (self._state == CircuitBreaker.HALF_OPEN or
+                    self._consecutive_failures >= self._failure_threshold):
+                if self._state != CircuitBreaker.OPEN:
+                    self._trips += 1
+
+                self._state = CircuitBreaker.OPEN
+                self._opened_at = self._clock()
+
+    @property
+    def state(self):
+        """
+        Gets state of the circuit, one of ``CLOSED``, ``OPEN`` and ``HALF_OPEN``.
+
+        :rtype: str
+        """
+
+        return self._state
+
+    @property
+    def failure_threshold(self):
+        """
+        Gets the number of consecutive failures to open the circuit.
+
+        :rtype: int
+        """
+
+        return self._failure_threshold
+
+    @property
+    def reset_timeout(self):
+        """
+        Gets the seconds to wait before a trial call.
+
+        :rtype: int or float
+        """
+
+        return self._reset_timeout
+
+    @property
+    def failures(self):
+        """
+        Gets the number of failed calls.
+
+        :rtype: int
+        """
+
+        return self._failures
+
+    @property
+    def rejections(self):
+        """
+        Gets the number of calls rejected because the circuit was open.
+
+        :rtype: int
+        """
+
+        return self._rejections
+
+    @property
+    def trips(self):
+        """
+        Gets the number of times the circuit was opened.
+
+        :rtype: int
+        """
+
+        return self._trips
+
+
+class CircuitOpenError(NetworkError):
+    """
+    An exception which is raised when a call is rejected by an open circuit.
+    """
+
+    pass
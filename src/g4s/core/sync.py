@@ -9,8 +9,20 @@ __all__ = (
     'EventMappingError',
 )
 
+import time
 from .arg import ArgumentNullError
 from .debug import LogicError
+from .metrics import get_registry
+from .trace import get_tracer
+
+
+_events_mapped = get_registry().counter(
+    'g4s_events_mapped_total',
+    'Number of mapped events by result (common, calendar1_only or calendar2_only).', ('result', ))
+_mapping_duration = get_registry().histogram(
+    'g4s_event_mapping_duration_seconds', 'Time spent on event mapping.')
+
+_tracer = get_tracer()
 
 
 def perform_event_mapping(events1, events2):
@@ -39,6 +51,26 @@ def perform_event_mapping(events1, events2):
     if events2 is None:
         raise ArgumentNullError('events2')
 
+    attributes = {
+        'g4s.calendar1_event_count': len(events1), 'g4s.calendar2_event_count': len(events2)}
+    with _tracer.start_span('g4s.perform_event_mapping', attributes) as span:
+        started = time.perf_counter()
+        common_events, calendar1_only_events, calendar2_only_events = _map_events(
+            events1, events2)
+        _mapping_duration.observe(time.perf_counter() - started)
+
+        span.set_attribute('g4s.common_event_count', len(common_events))
+        span.set_attribute('g4s.calendar1_only_event_count', len(calendar1_only_events))
+        span.set_attribute('g4s.calendar2_only_event_count', len(calendar2_only_events))
+
+    _events_mapped.inc(len(common_events), result='common')
+    _events_mapped.inc(len(calendar1_only_events), result='calendar1_only')
+    _events_mapped.inc(len(calendar2_only_events), result='calendar2_only')
+
+    return common_events, calendar1_only_events, calendar2_only_events
+
+
+def _map_events(events1, events2):
     # event1 -> event2
     common_events = []
     calendar1_only_events = []
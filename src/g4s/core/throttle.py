@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rate limiting and concurrency limiting of requests to a remote server.
+"""
+
+__all__ = (
+    'Throttle',
+)
+
+import asyncio
+import contextlib
+import threading
+import time
+from .arg import verify_number
+from .metrics import get_registry
+
+
+# coroutines waiting for a concurrency slot poll at this interval, since slots are released by
+# threads which cannot wake them up directly
+_ASYNC_POLL_INTERVAL = 0.01
+
+# totals across all the throttles, which are exposed by `g4s.core.metrics`
+_wait_duration = get_registry().histogram(
+    'g4s_throttle_wait_seconds', 'Time which requests waited for throttles before they started.')
+_waiting_requests = get_registry().gauge(
+    'g4s_throttle_waiting_requests', 'Number of requests which are waiting for throttles.')
+_active_requests = get_registry().gauge(
+    'g4s_throttle_active_requests', 'Number of requests which occupy slots of throttles.')
+
+
+class Throttle(object):
+    """
+    Limits the number of concurrent requests with a semaphore, and the rate of requests with a
+    token bucket. A throttle can be shared by threads and :py:mod:`asyncio` coroutines.
+
+    .. code-block:: python
+
+        throttle = Throttle(max_concurrency=4, rate=10)
+
+        with throttle.limit():
+            response = requests.get(url)
+
+        async with throttle.limit_async():
+            response = await transport.request('GET', url)
+    """
+
+    def __init__(self, max_concurrency=None, rate=None, burst=None, clock=None):
+        """
+        Initializes an instance of :py:class:`Throttle` class.
+
+        :param max_concurrency: maximum number of concurrent requests, or :py:const:`None` for no
+                                limit
+        :param rate:            maximum number of requests per second on average, or
+                                :py:const:`None` for no limit
+        :param burst:           maximum number of requests which can be started at once after
+                                idle time (optional, default: ``rate`` but at least ``1``)
+        :param clock:           a function which returns current time in seconds (for testing)
+        :type  max_concurrency: int
+        :type  rate:            int or float
+        :type  burst:           int
+        """
+
+        self._clock = clock or time.monotonic
+        self._condition = threading.Condition()
+        self._active = 0
+        self.configure(max_concurrency, rate, burst)
+
+        self._acquisitions = 0
+        self._waits = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def configure(self, max_concurrency=None, rate=None, burst=None):
+        """
+        Changes the limits, e.g. of a throttle shared by several clients. Requests in progress
+        keep their concurrency slots, and the token bucket is refilled.
+        See :py:meth:`__init__` for the parameters.
+        """
+
+        if max_concurrency is not None:
+            verify_number('max_concurrency', max_concurrency, int, 1)
+        if rate is not None:
+            verify_number('rate', rate, (int, float), 0, exclusive=True)
+        if burst is not None:
+            verify_number('burst', burst, int, 1)
+
+        with self._condition:
+            self._max_concurrency = max_concurrency
+            self._rate = rate
+            self._burst = burst if burst is not None else max(1, int(rate or 1))
+            self._tokens = float(self._burst)
+            self._refilled_at = self._clock()
+            self._condition.notify_all()
+
+    def acquire(self):
+        """
+        Waits until a request can be started, and occupies a concurrency slot.
+        :py:meth:`release` must be called after the request is completed.
+
+        :rtype:  float
+        :return: waited time in seconds
+        """
+
+        started = self._clock()
+        with self._condition:
+            delay = self._try_acquire()
+            if delay == 0:
+                return self._record_wait(0.0)
+
+            _waiting_requests.inc()
+            try:
+                while delay != 0:
+                    self._condition.wait(delay)
+                    delay = self._try_acquire()
+            finally:
+                _waiting_requests.dec()
+
+            return self._record_wait(self._clock() - started)
+
+    async def acquire_async(self):
+        """
+        Waits until a request can be started without blocking the event loop, and occupies a
+        concurrency slot. :py:meth:`release` must be called after the request is completed.
+
+        :rtype:  float
+        :return: waited time in seconds
+        """
+
+        started = self._clock()
+        with self._condition:
+            delay = self._try_acquire()
+            if delay == 0:
+                return self._record_wait(0.0)
+
+        _waiting_requests.inc()
+        try:
+            while True:
+                await asyncio.sleep(_ASYNC_POLL_INTERVAL if delay is None else delay)
+                with self._condition:
+                    delay = self._try_acquire()
+                    if delay == 0:
+                        return self._record_wait(self._clock() - started)
+        finally:
+            _waiting_requests.dec()
+
+    def release(self):
+        """
+        Releases the concurrency slot occupied by :py:meth:`acquire` or :py:meth:`acquire_async`.
+        """
+
+        with self._condition:
+            if self._active <= 0:
+                raise ValueError('The throttle is released too many times.')
+
+            self._active -= 1
+            _active_requests.dec()
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def limit(self):
+        """
+        Returns a context manager which occupies a concurrency slot while it is entered.
+        """
+
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def limit_async(self):
+        """
+        Returns an asynchronous context manager which occupies a concurrency slot while it is
+        entered.
+        """
+
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def max_concurrency(self):
+        """
+        Gets the maximum number of concurrent requests, or :py:const:`None` if it is not limited.
+
+        :rtype: int
+        """
+
+        return self._max_concurrency
+
+    @property
+    def rate(self):
+        """
+        Gets the maximum number of requests per second, or :py:const:`None` if it is not limited.
+
+        :rtype: int or float
+        """
+
+        return self._rate
+
+    @property
+    def active(self):
+        """
+        Gets the number of requests in progress.
+
+        :rtype: int
+        """
+
+        return self._active
+
+    @property
+    def acquisitions(self):
+        """
+        Gets the number of started requests.
+
+        :rtype: int
+        """
+
+        return self._acquisitions
+
+    @property
+    def waits(self):
+        """
+        Gets the number of requests which had to wait before they were started.
+
+        :rtype: int
+        """
+
+        return self._waits
+
+    @property
+    def total_wait_time(self):
+        """
+        Gets the total time in seconds which requests waited before they were started.
+
+        :rtype: float
+        """
+
+        return self._total_wait_time
+
+    @property
+    def max_wait_time(self):
+        """
+        Gets the longest time in seconds which a request waited before it was started.
+
+        :rtype: float
+        """
+
+        return self._max_wait_time
+
+    def _try_acquire(self):
+        # returns `0` if acquired, seconds until a token is available, or `None` if no
+        # concurrency slot is available; the lock must be held by the caller
+        if self._max_concurrency is not None and self._active >= self._max_concurrency:
+            return None
+
+        if self._rate is not None:
+            now = self._clock()
+            elapsed = max(0.0, now - self._refilled_at)
+            self._tokens = min(float(self._burst), self._tokens + elapsed * self._rate)
+            self._refilled_at = now
+
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self._rate
+
+            self._tokens -= 1.0
+
+        self._active += 1
+        _active_requests.inc()
+        return 0
+
+    def _record_wait(self, wait_time):
+        # the lock must be held by the caller
+        self._acquisitions += 1
+        _wait_duration.observe(wait_time)
+        if wait_time > 0:
+            self._waits += 1
+            self._total_wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        return wait_time
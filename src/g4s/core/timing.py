@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-phase timing of requests to calendar servers.
+"""
+
+__all__ = (
+    'RequestTimings',
+)
+
+import time
+
+
+class RequestTimings(object):
+    """
+    Elapsed time and byte counts of phases of a request, which are reported to timing hooks
+    (e.g. :py:meth:`g4s.cbgrn.api.CybozuGaroonApi.add_timing_hook`).
+
+    The phases are the following.
+
+    * ``render``: rendering of the request body
+    * ``send``: sending the request and waiting for the response, including retries
+    * ``receive``: receiving the response body
+    * ``parse``: parsing the response
+    * ``convert``: converting the parsed response (e.g. into events)
+
+    Phases of a streamed response are interleaved, and elapsed time of each phase is the sum of
+    its slices.
+    """
+
+    PHASES = ('render', 'send', 'receive', 'parse', 'convert')
+
+    def __init__(self, service, action, clock=None):
+        """
+        Initializes an instance of :py:class:`RequestTimings` class, and starts the first phase.
+
+        :param service: name of the service
+        :param action:  name of the action
+        :param clock:   a function which returns current time in seconds (for testing)
+        :type  service: str
+        :type  action:  str
+        """
+
+        self.service = service
+        self.action = action
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.elements = 0
+        self.error = None
+
+        self._clock = clock or time.perf_counter
+        self._phases = dict((phase, 0.0) for phase in RequestTimings.PHASES)
+        self._started = self._last = self._clock()
+
+    def lap(self, phase):
+        """
+        Adds time elapsed since the previous lap to the specified phase.
+
+        :param phase: one of :py:attr:`PHASES`
+        :type  phase: str
+        """
+
+        now = self._clock()
+        self._phases[phase] += now - self._last
+        self._last = now
+
+    def move(self, source, destination, seconds):
+        """
+        Moves time from a phase to another phase, for phases which cannot be measured separately.
+
+        :param source:      the phase from which the time is subtracted
+        :param destination: the phase to which the time is added
+        :param seconds:     the time to be moved, which is limited to the time of ``source``
+        """
+
+        seconds = min(max(seconds, 0.0), self._phases[source])
+        self._phases[source] -= seconds
+        self._phases[destination] += seconds
+
+    def __getitem__(self, phase):
+        return self._phases[phase]
+
+    @property
+    def phases(self):
+        """
+        Gets elapsed time of each phase in seconds.
+
+        :rtype: dict of (str, float)
+        """
+
+        return dict(self._phases)
+
+    @property
+    def total(self):
+        """
+        Gets elapsed time from the start of the request to the latest lap in seconds.
+
+        :rtype: float
+        """
+
+        return self._last - self._started
+
+    def __repr__(self):
+        phases = ', '.join(
+            '{0}={1:.6f}'.format(p, self._phases[p]) for p in RequestTimings.PHASES)
+        return '<RequestTimings {0}.{1}: {2}, request_bytes={3}, response_bytes={4}>'.format(
+            self.service, self.action, phases, self.request_bytes, self.response_bytes)
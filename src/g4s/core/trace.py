@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tracing of requests and synchronization, with spans shaped after OpenTelemetry.
+
+Tracing is disabled until an exporter is added to the tracer, and spans cost almost nothing
+while it is disabled.
+
+.. code-block:: python
+
+    from g4s.core.trace import JsonLinesSpanExporter
+    from g4s.core.trace import get_tracer
+
+    get_tracer().add_exporter(JsonLinesSpanExporter('/var/log/g4s/spans.jsonl'))
+
+    with get_tracer().start_span('sync', {'account': 'foo'}):
+        events = api.get_events(start, end)   # spans of g4s become children of `sync`
+
+Each line of the file is a span in the following format, where times are nanoseconds since the
+epoch::
+
+    {"name": "g4s.get_events", "trace_id": "...", "span_id": "...", "parent_span_id": "...",
+     "start_time_unix_nano": ..., "end_time_unix_nano": ..., "attributes": {...},
+     "status": {"code": "OK"}, "events": [...]}
+"""
+
+__all__ = (
+    'JsonLinesSpanExporter',
+    'MemorySpanExporter',
+    'Span',
+    'Tracer',
+    'get_tracer',
+)
+
+import contextvars
+import json
+import random
+import threading
+import time
+from .arg import ArgumentNullError
+from .arg import ArgumentTypeError
+
+
+_current_span = contextvars.ContextVar('g4s_current_span', default=None)
+
+
+class Span(object):
+    """
+    An operation which is traced. Spans are created by :py:meth:`Tracer.start_span`.
+
+    A span which is used as a context manager becomes the parent of spans started within the
+    block, records the exception raised from the block, and is ended at the end of the block.
+    Otherwise :py:meth:`end` must be called explicitly.
+    """
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else _generate_id(16)
+        self.span_id = _generate_id(8)
+        self.parent_span_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = 'UNSET'
+        self.status_message = None
+        self.start_time = time.time_ns()
+        self.end_time = None
+
+        self._tracer = tracer
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_current_span.set(self))
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _current_span.reset(self._tokens.pop())
+        if value is not None:
+            self.record_exception(value)
+
+        self.end()
+
+    @property
+    def is_recording(self):
+        """
+        Gets whether the span records attributes, i.e. whether tracing is enabled.
+
+        :rtype: bool
+        """
+
+        return True
+
+    @property
+    def duration(self):
+        """
+        Gets elapsed time of the span in seconds, or :py:const:`None` if it has not ended.
+
+        :rtype: float
+        """
+
+        if self.end_time is None:
+            return None
+
+        return (self.end_time - self.start_time) / 1e9
+
+    def set_attribute(self, key, value):
+        """
+        Sets an attribute, e.g. number of events.
+
+        :param key:   name of the attribute, e.g. ``g4s.event_count``
+        :param value: value of the attribute, which must be serializable to JSON
+        :type  key:   str
+        """
+
+        self.attributes[key] = value
+
+    def add_event(self, name, attributes=None):
+        """
+        Adds an event which occurred in the span, e.g. a cache hit.
+
+        :param name:       name of the event
+        :param attributes: attributes of the event
+        :type  name:       str
+        :type  attributes: dict
+        """
+
+        self.events.append(dict(
+            name=name, time_unix_nano=time.time_ns(), attributes=dict(attributes or {})))
+
+    def record_exception(self, ex):
+        """
+        Records an exception, and marks the span as failed.
+
+        :param ex: the exception
+        :type  ex: Exception
+        """
+
+        self.add_event('exception', {
+            'exception.type': type(ex).__name__, 'exception.message': str(ex)})
+        self.status = 'ERROR'
+        self.status_message = '{0}: {1}'.format(type(ex).__name__, ex)
+
+    def end(self):
+        """
+        Ends the span, and passes it to the exporters. Spans are ended only once.
+        """
+
+        if self.end_time is not None:
+            return
+
+        self.end_time = time.time_ns()
+        if self.status == 'UNSET':
+            self.status = 'OK'
+
+        self._tracer._export(self)
+
+    def to_dict(self):
+        """
+        Converts the span into a dict, which can be serialized to JSON.
+
+        :rtype: dict
+        """
+
+        status = dict(code=self.status)
+        if self.status_message is not None:
+            status['message'] = self.status_message
+
+        return dict(
+            name=self.name, trace_id=self.trace_id, span_id=self.span_id,
+            parent_span_id=self.parent_span_id, start_time_unix_nano=self.start_time,
+            end_time_unix_nano=self.end_time, attributes=dict(self.attributes), status=status,
+            events=list(self.events))
+
+    def __repr__(self):
+        return '<Span {0}: trace_id={1}, span_id={2}, status={3}>'.format(
+            self.name, self.trace_id, self.span_id, self.status)
+
+
+class _NoOpSpan(object):
+    # returned while tracing is disabled; it never becomes the current span
+
+    is_recording = False
+    duration = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, ex):
+        pass
+
+    def end(self):
+        pass
+
+
+_NO_OP_SPAN = _NoOpSpan()
+
+
+class Tracer(object):
+    """
+    Creates spans, and passes ended spans to exporters.
+
+    An exporter is an object which has ``export(span)`` method, which may be called from any
+    thread (e.g. :py:class:`MemorySpanExporter` or :py:class:`JsonLinesSpanExporter`).
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of :py:class:`Tracer` class.
+        """
+
+        self._exporters = ()
+
+    @property
+    def enabled(self):
+        """
+        Gets whether tracing is enabled, i.e. whether any exporter is added.
+
+        :rtype: bool
+        """
+
+        return bool(self._exporters)
+
+    def add_exporter(self, exporter):
+        """
+        Adds an exporter, which enables tracing.
+
+        :param exporter: the exporter
+        """
+
+        if exporter is None:
+            raise ArgumentNullError('exporter')
+        if not callable(getattr(exporter, 'export', None)):
+            raise ArgumentTypeError('exporter', 'span exporter')
+
+        # the tuple is replaced, so that spans can be exported without locks
+        self._exporters = self._exporters + (exporter, )
+
+    def remove_exporter(self, exporter):
+        """
+        Removes the exporter. Tracing is disabled when all the exporters are removed.
+
+        :param exporter: the exporter
+        """
+
+        exporters = list(self._exporters)
+        exporters.remove(exporter)
+        self._exporters = tuple(exporters)
+
+    def start_span(self, name, attributes=None):
+        """
+        Starts a span, which is a child of the current span.
+
+        :param name:       name of the operation, e.g. ``g4s.get_events``
+        :param attributes: initial attributes of the span
+        :type  name:       str
+        :type  attributes: dict
+
+        :rtype: :py:class:`g4s.core.trace.Span`
+        """
+
+        if not self._exporters:
+            return _NO_OP_SPAN
+
+        return Span(self, name, _current_span.get(), attributes)
+
+    def get_current_span(self):
+        """
+        Gets the current span, which is a span used as a context manager in the current thread
+        or coroutine.
+
+        :rtype:  :py:class:`g4s.core.trace.Span`
+        :return: the current span, which does nothing if there is no current span
+        """
+
+        return _current_span.get() or _NO_OP_SPAN
+
+    def bind(self, function):
+        """
+        Returns a function which calls ``function`` within the current span, so that spans
+        started in other threads (e.g. workers of a thread pool) have the correct parent.
+
+        :param function: the function
+        :type  function: callable
+
+        :rtype: callable
+        """
+
+        span = _current_span.get()
+        if span is None:
+            return function
+
+        def bound(*args, **kwargs):
+            token = _current_span.set(span)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _current_span.reset(token)
+
+        return bound
+
+    def _export(self, span):
+        for exporter in self._exporters:
+            exporter.export(span)
+
+
+class MemorySpanExporter(object):
+    """
+    An exporter which keeps ended spans in memory.
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of :py:class:`MemorySpanExporter` class.
+        """
+
+        self._lock = threading.Lock()
+        self._spans = []
+
+    def export(self, span):
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self):
+        """
+        Gets the ended spans in order of their end.
+
+        :rtype: list of :py:class:`g4s.core.trace.Span`
+        """
+
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        """
+        Removes all the spans.
+        """
+
+        with self._lock:
+            self._spans.clear()
+
+    def to_json(self):
+        """
+        Serializes the spans into a JSON array.
+
+        :rtype: str
+        """
+
+        return json.dumps([span.to_dict() for span in self.spans], default=str)
+
+
+class JsonLinesSpanExporter(object):
+    """
+    An exporter which appends each ended span to a file as a line of JSON.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes an instance of :py:class:`JsonLinesSpanExporter` class.
+
+        :param path: path of the file
+        :type  path: str
+        """
+
+        if path is None:
+            raise ArgumentNullError('path')
+        if not isinstance(path, str):
+            raise ArgumentTypeError('path', str)
+
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + '\n'
+        with self._lock:
+            with open(self._path, 'a', encoding='utf-8') as fout:
+                fout.write(line)
+
+
+def get_tracer():
+    """
+    Gets the process-wide tracer, which creates the spans of g4s.
+
+    :rtype: :py:class:`g4s.core.trace.Tracer`
+    """
+
+    return _tracer
+
+
+def _generate_id(size):
+    return '{0:0{1}x}'.format(random.getrandbits(size * 8), size * 2)
+
+
+_tracer = Tracer()
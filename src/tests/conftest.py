@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+import g4s.cbgrn.api
+
+
+###
+### Fixture
+###
+
+@pytest.fixture
+def reset_shared_state(monkeypatch):
+    """
+    Clears the state which :py:class:`g4s.cbgrn.api.CybozuGaroonApi` instances share in the
+    process, and makes retries immediate.
+    """
+
+    # SOAP endpoints are cached process-wide, each test must retrieve WSDL by itself
+    g4s.cbgrn.api._endpoint_cache.clear()
+    g4s.cbgrn.api._response_cache.clear()
+    g4s.cbgrn.api._occurrence_cache.clear()
+    g4s.cbgrn.api._participant_pool.clear()
+
+    # circuit breakers and throttles are shared per server, and retries must not slow down tests
+    g4s.cbgrn.api._circuit_breakers.clear()
+    g4s.cbgrn.api._throttles.clear()
+    monkeypatch.setattr('g4s.core.retry.RetryPolicy.get_delay', lambda self, retry: 0)
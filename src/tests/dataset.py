@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+A generator of deterministic synthetic calendars, which are emitted both as Garoon SOAP
+responses and as :py:class:`g4s.core.model.Event` sequences, so that parser, mapping and storage
+benchmarks share one data source.
+
+.. code-block:: python
+
+    dataset = CalendarDataset(100000, seed=1)
+    data = dataset.render_response()       # ScheduleGetEvents response
+    events = list(dataset.iter_events())   # the same events, without parsing the response
+"""
+
+__all__ = (
+    'CalendarDataset',
+)
+
+import datetime
+import itertools
+import random
+import jinja2
+from g4s.cbgrn.api import _RepeatEventRule
+from g4s.core.date import DateTime
+from g4s.core.date import TimeZone
+from g4s.core.model import Event
+from g4s.core.model import Participant
+from .util import read
+
+
+# relative frequencies of kinds of events
+DEFAULT_WEIGHTS = dict(normal=60, banner=5, allday=10, start_only=10, repeat=15)
+
+_REPEAT_TYPES = ('day', 'weekday', 'week', '1stweek', '3rdweek', 'lastweek', 'month')
+_FIRST_VERSION = 1388534400
+
+
+class CalendarDataset(object):
+    """
+    A synthetic calendar which contains normal, banner, all-day and start-only events, and
+    repeat series with exclusive date times. A few events have large member lists.
+
+    Events are generated from the seed whenever they are iterated, so that even calendars with
+    millions of events are not held in memory.
+    """
+
+    def __init__(
+            self, event_count, seed=0, user_count=1000, member_count=3, large_member_count=300,
+            large_member_ratio=0.01, weights=None, origin=datetime.date(2014, 1, 1), days=365,
+            tz_name='Asia/Tokyo'):
+        """
+        Initializes an instance of :py:class:`CalendarDataset` class.
+
+        :param event_count:        number of events (repeat series are counted as one event)
+        :param seed:               seed of random numbers
+        :param user_count:         number of users who take part in events
+        :param member_count:       number of members of usual events
+        :param large_member_count: number of members of events which have large member lists
+        :param large_member_ratio: ratio of events which have large member lists
+        :param weights:            relative frequencies of ``normal``, ``banner``, ``allday``,
+                                   ``start_only`` and ``repeat`` events
+        :param origin:             the first date of the calendar
+        :param days:               number of days of the calendar
+        :param tz_name:            time zone of events
+        """
+
+        self.event_count = event_count
+        self.seed = seed
+        self.user_count = user_count
+        self.member_count = min(member_count, user_count)
+        self.large_member_count = min(large_member_count, user_count)
+        self.large_member_ratio = large_member_ratio
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.origin = origin
+        self.days = days
+        self.tz_name = tz_name
+
+    @property
+    def start(self):
+        """
+        Gets the start of the calendar.
+
+        :rtype: :py:class:`g4s.core.date.DateTime`
+        """
+
+        return DateTime.get(*self.origin.timetuple()[:3], tzinfo=self.tz_name)
+
+    @property
+    def end(self):
+        """
+        Gets the end of the calendar, which is exclusive.
+
+        :rtype: :py:class:`g4s.core.date.DateTime`
+        """
+
+        return self.start + datetime.timedelta(days=self.days)
+
+    def iter_event_infos(self):
+        """
+        Yields events as dicts in the format of ``get_events-response.xml`` template.
+
+        :rtype: generator of dict
+        """
+
+        rng = random.Random(self.seed)
+        kinds = list(self.weights)
+        cum_weights = list(itertools.accumulate(self.weights[k] for k in kinds))
+
+        for id in range(1, self.event_count + 1):
+            kind = rng.choices(kinds, cum_weights=cum_weights)[0]
+            yield self._generate_event_info(rng, id, kind)
+
+    def render_response(self):
+        """
+        Renders all the events as a ``ScheduleGetEvents`` response.
+
+        :rtype: bytes
+        """
+
+        return b''.join(self.iter_response_chunks())
+
+    def iter_response_chunks(self):
+        """
+        Yields a ``ScheduleGetEvents`` response which contains all the events in chunks, without
+        holding the whole response in memory.
+
+        :rtype: generator of bytes
+        """
+
+        template = jinja2.Template(read('g4s.cbgrn', 'get_events-response.xml').decode('utf-8'))
+        for text in template.generate(events=self.iter_event_infos()):
+            yield text.encode('utf-8')
+
+    def iter_events(self, start=None, end=None, participant_pool=None):
+        """
+        Yields the events which would be parsed from the response. Repeat series are expanded
+        into occurrences within ``[start, end)``.
+
+        :param start:            start of the range of repeat series, or :py:const:`None` for
+                                 the first occurrence
+        :param end:              end of the range of repeat series, or :py:const:`None` for the
+                                 last occurrence
+        :param participant_pool: a pool which interns participants (optional)
+        :type  start:            :py:class:`g4s.core.date.DateTime`
+        :type  end:              :py:class:`g4s.core.date.DateTime`
+        :type  participant_pool: :py:class:`g4s.core.model.ParticipantPool`
+
+        :rtype: generator of :py:class:`g4s.core.model.Event`
+        """
+
+        tz = TimeZone.get(self.tz_name)
+        for info in self.iter_event_infos():
+            event = _convert_event_info(info, tz, participant_pool)
+            if isinstance(event, _RepeatEventRule):
+                yield from event.resolve(start, end)
+            else:
+                yield event
+
+    def _generate_event_info(self, rng, id, kind):
+        if rng.random() < self.large_member_ratio:
+            member_ids = rng.sample(range(1, self.user_count + 1), self.large_member_count)
+        else:
+            member_ids = rng.sample(range(1, self.user_count + 1), self.member_count)
+
+        info = dict(
+            id=id, event_type='banner' if kind == 'banner' else 'normal',
+            public_type='public' if rng.random() < 0.9 else 'private',
+            detail='{0} event {1}'.format(kind, id), version=_FIRST_VERSION + id,
+            timezone=self.tz_name, end_timezone=self.tz_name,
+            allday=kind in ('banner', 'allday'), start_only=kind == 'start_only',
+            members=[
+                dict(id=member_id, name='user{0}'.format(member_id), order=order)
+                for order, member_id in enumerate(member_ids)])
+
+        date = self.origin + datetime.timedelta(days=rng.randrange(self.days))
+        if kind == 'repeat':
+            info['event_type'] = 'repeat'
+            info['repeat_info'] = self._generate_repeat_info(rng, date)
+        elif info['allday']:
+            length = rng.randint(1, 5) if kind == 'banner' else 1
+            end = date + datetime.timedelta(days=length - 1)
+            info['when'] = dict(start=date, end=end, has_time=False)
+        else:
+            # date times are sent in UTC
+            local = DateTime.get(
+                *date.timetuple()[:3], hour=rng.randrange(8, 20), minute=rng.choice((0, 30)),
+                tzinfo=self.tz_name)
+            start = datetime.datetime(*local.astimezone(TimeZone.get('UTC')).timetuple()[:6])
+            info['when'] = dict(start=start, has_time=True)
+            if kind != 'start_only':
+                info['when']['end'] = start + datetime.timedelta(minutes=rng.choice((30, 60, 90)))
+
+        return info
+
+    def _generate_repeat_info(self, rng, start_date):
+        end_date = start_date + datetime.timedelta(days=rng.randint(7, 180))
+        hour = rng.randrange(8, 19)
+        info = dict(
+            type=rng.choice(_REPEAT_TYPES), day=rng.randrange(29), week=rng.randrange(7),
+            start_date=start_date, end_date=end_date,
+            start_time='{0:02d}:00:00'.format(hour), end_time='{0:02d}:00:00'.format(hour + 1))
+
+        if rng.random() < 0.3:
+            info['exclusive_datetimes'] = []
+            for x in range(rng.randint(1, 3)):
+                date = start_date + datetime.timedelta(days=rng.randint(0, 7))
+                start = DateTime.get(*date.timetuple()[:3], tzinfo=self.tz_name)
+                end = start + datetime.timedelta(days=1)
+                info['exclusive_datetimes'].append(
+                    dict(start=start.isoformat(), end=end.isoformat()))
+
+        return info
+
+
+def _convert_event_info(info, tz, participant_pool):
+    # converts an event dict in the same way as `CybozuGaroonApi` parses `schedule_event`
+    members = [(m['id'], m['name']) for m in info['members']]
+    if participant_pool is None:
+        members = tuple(Participant(id, name) for id, name in members)
+    else:
+        members = participant_pool.get_members(members)
+
+    is_public = info['public_type'] == 'public'
+    vt = datetime.datetime.fromtimestamp(info['version']).timetuple()[:6]
+    last_update = DateTime.get(*vt, tzinfo='Asia/Tokyo')
+
+    if info['event_type'] == 'repeat':
+        repeat = info['repeat_info']
+        exclusive_datetimes = [
+            (_parse_local_datetime(x['start'], tz), _parse_local_datetime(x['end'], tz))
+            for x in repeat.get('exclusive_datetimes', ())]
+
+        return _RepeatEventRule(
+            info['id'], info['detail'], None, info['allday'], info['start_only'], members,
+            is_public, last_update, info['timezone'], info['end_timezone'], repeat['type'],
+            repeat['day'], repeat['week'], repeat['start_date'], repeat['end_date'],
+            _parse_time(repeat['start_time']), _parse_time(repeat['end_time']),
+            exclusive_datetimes)
+
+    type = Event.BANNER if info['event_type'] == 'banner' else Event.NORMAL
+    when = info['when']
+    if info['allday']:
+        start = DateTime.get(*when['start'].timetuple()[:3], tzinfo=tz)
+        end = DateTime.get(*when['end'].timetuple()[:3], tzinfo=tz)
+    else:
+        start = DateTime.get(*when['start'].timetuple()[:6], tzinfo='UTC').astimezone(tz)
+        end = None
+        if not info['start_only']:
+            end = DateTime.get(*when['end'].timetuple()[:6], tzinfo='UTC').astimezone(tz)
+
+    return Event(
+        info['id'], type, info['detail'], None, start, end, info['allday'], members, is_public,
+        last_update)
+
+
+def _parse_local_datetime(text, tz):
+    dt = datetime.datetime.fromisoformat(text)
+    return DateTime.get(*dt.timetuple()[:6], tzinfo=tz)
+
+
+def _parse_time(text):
+    return tuple(int(x) for x in text.split(':'))
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+
+"""
+A local HTTP server which imitates Garoon SOAP API, for tests and benchmarks which exercise
+connection pooling, concurrency and streaming without network access.
+
+.. code-block:: python
+
+    with GaroonServer(events, latency=0.05, failure_rate=0.1) as server:
+        api = CybozuGaroonApi({'url': server.url, 'user': 'foo', 'password': 'bar'})
+        events = api.get_events(start, end)
+"""
+
+__all__ = (
+    'GaroonServer',
+    'Request',
+)
+
+import collections
+import datetime
+import gzip
+import http.server
+import random
+import threading
+import time
+import zlib
+import jinja2
+import lxml.etree
+from .util import parse_xml
+from .util import read
+
+
+ORIGINAL_SERVER_URL = 'http://example.com/cgi-bin/cbgrn/grn.cgi'
+SOAP_NS = 'http://www.w3.org/2003/05/soap-envelope'
+SCHEDULE_NS = 'http://schemas.cybozu.co.jp/schedule/2008'
+
+_WRITE_ACTIONS = ('ScheduleAddEvents', 'ScheduleModifyEvents', 'ScheduleRemoveEvents')
+_UTC_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+Request = collections.namedtuple(
+    'Request', ('method', 'path', 'action', 'content_encoding', 'accept_encoding', 'body'))
+"""
+A request received by :py:class:`GaroonServer`. ``action`` is :py:const:`None` for WSDL requests,
+and ``body`` is the decompressed request body.
+"""
+
+
+class GaroonServer(object):
+    """
+    An in-process HTTP server which serves WSDL, answers ``ScheduleGetEvents``,
+    ``ScheduleGetEventsByTarget``, ``ScheduleGetEventsById`` and ``ScheduleGetEventVersions``
+    from event dicts rendered with ``get_events-response.xml``, and applies
+    ``ScheduleAddEvents``, ``ScheduleModifyEvents`` and ``ScheduleRemoveEvents`` to the events.
+
+    The server speaks HTTP/1.1 with keep-alive, and sends responses with chunked transfer
+    encoding. Responses are compressed if the client accepts the encoding.
+    """
+
+    def __init__(
+            self, events=(), latency=0.0, failures=0, failure_rate=0.0, failure_status=503,
+            padding=0, chunk_size=16384, content_encoding='gzip', accepts_compressed_requests=True,
+            wsdl_status=200, groups=None, seed=0):
+        """
+        Initializes an instance of :py:class:`GaroonServer` class.
+
+        :param events:                      event dicts in the format of
+                                            ``get_events-response.xml``; events of facilities
+                                            have IDs of the facilities as ``facility_ids``
+        :param latency:                     seconds to wait before responding to each request
+        :param failures:                    number of SOAP requests which fail first
+        :param failure_rate:                probability that each later SOAP request fails
+        :param failure_status:              HTTP status of failed requests
+        :param padding:                     number of bytes appended to each SOAP response as a
+                                            comment
+        :param chunk_size:                  size of chunks of response bodies in bytes
+        :param content_encoding:            ``gzip``, ``deflate`` (sent without zlib header, as
+                                            some servers do) or :py:const:`None` to send
+                                            responses uncompressed
+        :param accepts_compressed_requests: whether compressed request bodies are accepted,
+                                            otherwise they are rejected with HTTP status 415
+        :param wsdl_status:                 HTTP status of WSDL responses, which have no body
+                                            unless the status is 200
+        :param groups:                      a dict which maps IDs of groups to IDs of their users
+        :param seed:                        seed of random numbers used for failure injection
+        """
+
+        self.latency = latency
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.padding = padding
+        self.chunk_size = chunk_size
+        self.content_encoding = content_encoding
+        self.accepts_compressed_requests = accepts_compressed_requests
+        self.wsdl_status = wsdl_status
+        self.groups = dict(groups or {})
+
+        self.requests = []
+        self.bytes_sent = 0
+        self.bytes_rendered = 0
+        self.bytes_received = 0
+
+        self._events = {}
+        for event in events:
+            self._events[int(event['id'])] = event
+        self._next_id = max(self._events, default=0) + 1
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._template = jinja2.Template(
+            read('g4s.cbgrn', 'get_events-response.xml').decode('utf-8'))
+
+        self._server = _HTTPServer(('127.0.0.1', 0), self._create_handler())
+        self.url = 'http://127.0.0.1:{0}/cgi-bin/cbgrn/grn.cgi'.format(self._server.server_port)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Starts serving requests in a background thread.
+        """
+
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """
+        Stops serving requests and closes the listening socket.
+        """
+
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def events(self):
+        """
+        Gets the events which the server holds, sorted by ID.
+
+        :rtype: list[dict]
+        """
+
+        with self._lock:
+            return [self._events[id] for id in sorted(self._events)]
+
+    @property
+    def actions(self):
+        """
+        Gets SOAP actions of the received requests in order.
+
+        :rtype: list[str]
+        """
+
+        return [r.action for r in self.requests if r.method == 'POST']
+
+    def set_event(self, event):
+        """
+        Adds the event dict, or replaces the event which has the same ID.
+
+        :param event: the event dict
+        :type  event: dict
+        """
+
+        with self._lock:
+            self._events[int(event['id'])] = event
+            self._next_id = max(self._next_id, int(event['id']) + 1)
+
+    def remove_event(self, id):
+        """
+        Removes the event which has the specified ID.
+
+        :param id: ID of the event
+        :type  id: int
+        """
+
+        with self._lock:
+            del self._events[id]
+
+    def _create_handler(self):
+        owner = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                owner._record(Request('GET', self.path, None, None, self._accept_encoding, b''))
+                owner._wait()
+
+                if owner.wsdl_status != 200:
+                    return self._send(owner.wsdl_status, b'')
+
+                wsdl = read('g4s.cbgrn', 'valid_wsdl_001.xml').decode('utf-8')
+                self._send(200, wsdl.replace(ORIGINAL_SERVER_URL, owner.url).encode('utf-8'))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with owner._lock:
+                    owner.bytes_received += len(body)
+
+                encoding = self.headers.get('Content-Encoding')
+                if encoding is not None and not owner.accepts_compressed_requests:
+                    owner._record(Request(
+                        'POST', self.path, None, encoding, self._accept_encoding, body))
+                    return self._send(415, b'')
+                if encoding == 'gzip':
+                    body = gzip.decompress(body)
+                elif encoding == 'deflate':
+                    body = zlib.decompress(body)
+
+                request = parse_xml(body).xpath(
+                    '/soap:Envelope/soap:Body/*', namespaces=dict(soap=SOAP_NS))[0]
+                action = lxml.etree.QName(request).localname
+                owner._record(Request(
+                    'POST', self.path, action, encoding, self._accept_encoding, body))
+                owner._wait()
+
+                if owner._should_fail():
+                    return self._send(owner.failure_status, b'')
+                if action in _READ_ACTIONS:
+                    return self._send(200, getattr(owner, _READ_ACTIONS[action])(request))
+                if action in _WRITE_ACTIONS:
+                    return self._send(200, owner._write_events(action, request))
+
+                self._send(400, b'')
+
+            @property
+            def _accept_encoding(self):
+                return self.headers.get('Accept-Encoding') or ''
+
+            def _send(self, status, data):
+                encoding = owner.content_encoding
+                compresses = data and encoding is not None and encoding in self._accept_encoding
+                if compresses:
+                    data = _compress(data, encoding)
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+                if compresses:
+                    self.send_header('Content-Encoding', encoding)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+
+                for x in range(0, len(data), owner.chunk_size):
+                    chunk = data[x:x + owner.chunk_size]
+                    self.wfile.write('{0:x}\r\n'.format(len(chunk)).encode('latin-1'))
+                    self.wfile.write(chunk + b'\r\n')
+                self.wfile.write(b'0\r\n\r\n')
+
+                with owner._lock:
+                    owner.bytes_sent += len(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _record(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def _wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _should_fail(self):
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                return True
+
+            return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    def _get_events(self, request):
+        start, end = _parse_range(request)
+        return self._render([e for e in self.events if _overlaps(e, start, end)])
+
+    def _get_events_by_target(self, request):
+        start, end = _parse_range(request)
+        target = request.find('{*}parameters')[0]
+        target_type, target_id = target.tag, int(target.attrib['id'])
+
+        if target_type == 'facility':
+            matches = lambda e: target_id in e.get('facility_ids', ())
+        else:
+            user_ids = self.groups.get(target_id, ()) if target_type == 'group' else (target_id, )
+            matches = lambda e: any(m['id'] in user_ids for m in e.get('members', ()))
+
+        return self._render([e for e in self.events if matches(e) and _overlaps(e, start, end)])
+
+    def _get_events_by_id(self, request):
+        ids = [int(node.text) for node in request.iter('event_id')]
+        with self._lock:
+            events = [self._events[id] for id in ids if id in self._events]
+
+        return self._render(events)
+
+    def _get_event_versions(self, request):
+        start, end = _parse_range(request)
+        known = dict(
+            (int(n.attrib['id']), int(n.attrib['version'])) for n in request.iter('event_item'))
+
+        items = []
+        events = [e for e in self.events if _overlaps(e, start, end)]
+        for event in events:
+            if event['id'] not in known:
+                items.append((event['id'], event['version'], 'add'))
+            elif known[event['id']] != event['version']:
+                items.append((event['id'], event['version'], 'modify'))
+
+        ids = set(e['id'] for e in events)
+        for id in sorted(set(known) - ids):
+            items.append((id, known[id], 'remove'))
+
+        returns = ''.join(
+            '<event_item id="{0}" version="{1}" operation="{2}"/>'.format(*item) for item in items)
+        data = (
+            '<soap:Envelope xmlns:soap="{0}"><soap:Body><returns>{1}</returns></soap:Body>'
+            '</soap:Envelope>').format(SOAP_NS, returns).encode('utf-8')
+
+        with self._lock:
+            self.bytes_rendered += len(data)
+
+        return data
+
+    def _write_events(self, action, request):
+        if action == 'ScheduleRemoveEvents':
+            with self._lock:
+                for node in request.iter('event_id'):
+                    self._events.pop(int(node.text), None)
+
+            return self._render([])
+
+        events = []
+        with self._lock:
+            for node in request.iter('schedule_event'):
+                event = _convert_event_node(node)
+                if action == 'ScheduleAddEvents':
+                    event['id'] = self._next_id
+                    self._next_id += 1
+
+                event['version'] = int(time.time())
+                self._events[event['id']] = event
+                events.append(event)
+
+        return self._render(events)
+
+    def _render(self, events):
+        data = self._template.render(events=events)
+        if self.padding > 0:
+            data += '<!--{0}-->'.format(' ' * self.padding)
+
+        data = data.encode('utf-8')
+        with self._lock:
+            self.bytes_rendered += len(data)
+
+        return data
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    # many clients connect concurrently in tests
+    daemon_threads = True
+    request_queue_size = 256
+
+
+# methods of `GaroonServer` which answer read-only actions
+_READ_ACTIONS = dict(
+    ScheduleGetEvents='_get_events', ScheduleGetEventsByTarget='_get_events_by_target',
+    ScheduleGetEventsById='_get_events_by_id', ScheduleGetEventVersions='_get_event_versions')
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data)
+
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _parse_range(request):
+    parameters = request.find('{*}parameters')
+    return (
+        _parse_utc_datetime(parameters.attrib['start']),
+        _parse_utc_datetime(parameters.attrib['end']))
+
+
+def _parse_utc_datetime(text):
+    return datetime.datetime.strptime(text, _UTC_DATETIME_FORMAT)
+
+
+def _overlaps(event, start, end):
+    # repeat events and events without time range are always returned, as Garoon does
+    when = event.get('when')
+    if event.get('event_type') != 'normal' or when is None or 'start' not in when:
+        return True
+
+    event_start = when['start']
+    event_end = when.get('end', event_start)
+    if not when.get('has_time', True):
+        return event_start <= end.date() and start.date() <= event_end
+
+    if event_start == event_end:
+        return start <= event_start < end
+
+    return event_start < end and start < event_end
+
+
+def _convert_event_node(node):
+    # converts `schedule_event` element of write requests into an event dict
+    attrib = node.attrib
+    event = dict(
+        id=int(attrib['id']) if attrib['id'].isdigit() else None,
+        event_type=attrib['event_type'], public_type=attrib['public_type'],
+        detail=attrib['detail'], timezone=attrib['timezone'],
+        end_timezone=attrib['end_timezone'], allday=attrib['allday'] == 'true',
+        start_only=attrib['start_only'] == 'true')
+
+    users = node.iter('{{{0}}}user'.format(SCHEDULE_NS))
+    event['members'] = [
+        dict(id=int(u.attrib['id']), name='user{0}'.format(u.attrib['id']), order=order)
+        for order, u in enumerate(users)]
+
+    date = node.find('{{{0}}}when/{{{0}}}date'.format(SCHEDULE_NS))
+    if date is not None:
+        parse = lambda text: datetime.datetime.strptime(text, '%Y-%m-%d').date()
+        event['when'] = dict(
+            start=parse(date.attrib['start']), end=parse(date.attrib['end']), has_time=False)
+    else:
+        datetime_node = node.find('{{{0}}}when/{{{0}}}datetime'.format(SCHEDULE_NS))
+        event['when'] = dict(
+            start=_parse_utc_datetime(datetime_node.attrib['start']), has_time=True)
+        if 'end' in datetime_node.attrib:
+            event['when']['end'] = _parse_utc_datetime(datetime_node.attrib['end'])
+
+    return event
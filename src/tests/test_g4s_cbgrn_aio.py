@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import pytest
+import g4s.cbgrn.api
+from g4s.cbgrn.aio import AsyncCybozuGaroonApi
+from g4s.cbgrn.aio import AsyncHttpTransport
+from g4s.cbgrn.aio import AsyncTransport
+from g4s.cbgrn.aio import TransportResponse
+from g4s.core.api import NetworkError
+from g4s.core.api import RequestError
+from g4s.core.date import DateTime
+from .garoon_server import ORIGINAL_SERVER_URL
+from .garoon_server import GaroonServer
+from .util import create_event_info_on_day
+from .util import raises_argument_null_error
+from .util import raises_argument_type_error
+from .util import read
+
+
+pytestmark = pytest.mark.usefixtures('reset_shared_state')
+
+
+###
+### utilities
+###
+
+def create_params(url):
+    return {'url': url, 'user': 'foo', 'password': 'bar', 'language': 'en'}
+
+
+START = DateTime.get(2014, 1, 1, tzinfo='UTC')
+END = DateTime.get(2014, 1, 8, tzinfo='UTC')
+
+
+###
+### g4s.cbgrn.aio.AsyncCybozuGaroonApi
+###
+
+def test__AsyncCybozuGaroonApi__init__raises_ArgumentNullError_if_None_is_specified():
+    with raises_argument_null_error('params'):
+        AsyncCybozuGaroonApi(None)
+
+
+def test__AsyncCybozuGaroonApi__init__raises_ValueError_if_invalid_param_is_specified():
+    with pytest.raises(ValueError):
+        AsyncCybozuGaroonApi(dict(create_params('http://example.com/'), language='fr'))
+
+
+def test__AsyncCybozuGaroonApi__init__raises_ArgumentTypeError_if_invalid_transport_is_specified():
+    with raises_argument_type_error('transport'):
+        AsyncCybozuGaroonApi(create_params('http://example.com/'), object())
+
+
+def test__AsyncCybozuGaroonApi__get_events__raises_ArgumentNullError_if_None_is_specified():
+    api = AsyncCybozuGaroonApi(create_params('http://example.com/'))
+
+    with raises_argument_null_error('start'):
+        asyncio.run(api.get_events(None, END))
+
+
+def test__AsyncCybozuGaroonApi__get_events__returns_events():
+    with GaroonServer([create_event_info_on_day(1, 2), create_event_info_on_day(2, 3)]) as server:
+        api = AsyncCybozuGaroonApi(create_params(server.url))
+        events = asyncio.run(api.get_events(START, END))
+
+    assert [e.id for e in events] == [1, 2]
+    assert events[0].start == DateTime.get(2014, 1, 2, 9, tzinfo='UTC')
+    assert [r.method for r in server.requests] == ['GET', 'POST']
+    assert server.requests[1].path == '/cgi-bin/cbgrn/grn.cgi/cbpapi/schedule/api?'
+
+
+def test__AsyncCybozuGaroonApi__get_events__shares_wsdl_among_concurrent_instances():
+    async def main(url):
+        apis = [AsyncCybozuGaroonApi(create_params(url)) for x in range(200)]
+        return await asyncio.gather(*[api.get_events(START, END) for api in apis])
+
+    with GaroonServer([create_event_info_on_day(1, 2)]) as server:
+        results = asyncio.run(main(server.url))
+
+    assert all(len(events) == 1 for events in results)
+    assert len([r for r in server.requests if r.method == 'GET']) == 1
+    assert len([r for r in server.requests if r.method == 'POST']) == 200
+
+
+def test__AsyncCybozuGaroonApi__get_events__limits_concurrent_requests_with_throttle():
+    async def main(url):
+        params = dict(create_params(url), max_concurrent_requests=2)
+        apis = [AsyncCybozuGaroonApi(params) for x in range(20)]
+        return await asyncio.gather(*[api.get_events(START, END) for api in apis])
+
+    with GaroonServer([create_event_info_on_day(1, 2)]) as server:
+        results = asyncio.run(main(server.url))
+
+    throttle = g4s.cbgrn.api._throttles[server.url]
+    assert all(len(events) == 1 for events in results)
+    assert throttle.acquisitions == 21
+    assert throttle.waits > 0
+    assert throttle.active == 0
+
+
+def test__AsyncCybozuGaroonApi__get_events__reuses_cached_events():
+    async def main(url):
+        api = AsyncCybozuGaroonApi(dict(create_params(url), response_cache_ttl=60))
+        return (await api.get_events(START, END), await api.get_events(START, END))
+
+    with GaroonServer([create_event_info_on_day(1, 2)]) as server:
+        events1, events2 = asyncio.run(main(server.url))
+
+    assert [e.id for e in events2] == [e.id for e in events1]
+    assert events2[0] is not events1[0]
+    assert [r.method for r in server.requests] == ['GET', 'POST']
+
+
+@pytest.mark.parametrize('content_encoding', ['gzip', 'deflate'])
+def test__AsyncCybozuGaroonApi__get_events__receives_compressed_response(content_encoding):
+    events_info = [create_event_info_on_day(x, x % 7 + 1) for x in range(1, 201)]
+
+    with GaroonServer(events_info, content_encoding=content_encoding) as server:
+        api = AsyncCybozuGaroonApi(create_params(server.url))
+        events = asyncio.run(api.get_events(START, END))
+
+    assert len(events) == 200
+    assert server.bytes_sent * 10 < server.bytes_rendered
+
+
+def test__AsyncCybozuGaroonApi__get_soap_endpoints__raises_NetworkError():
+    with GaroonServer(wsdl_status=500) as server:
+        api = AsyncCybozuGaroonApi(create_params(server.url))
+
+        with pytest.raises(NetworkError):
+            asyncio.run(api.get_soap_endpoints())
+
+
+def test__AsyncCybozuGaroonApi__retries_read_request_which_failed_with_network_error():
+    class FlakyTransport(AsyncTransport):
+        def __init__(self):
+            self.calls = 0
+
+        async def request(self, method, url, body=None, headers=None):
+            self.calls += 1
+            if self.calls <= 2:
+                raise ConnectionResetError
+
+            return TransportResponse(200, {}, read('g4s.cbgrn', 'valid_wsdl_001.xml'))
+
+    transport = FlakyTransport()
+    api = AsyncCybozuGaroonApi(create_params(ORIGINAL_SERVER_URL), transport)
+    endpoints = asyncio.run(api.get_soap_endpoints())
+
+    assert 'ScheduleService' in endpoints
+    assert transport.calls == 3
+    assert api.retry_policy.retries == 2
+
+
+def test__AsyncCybozuGaroonApi__execute_soap_request__raises_RequestError_for_soap_error():
+    class SoapErrorTransport(AsyncTransport):
+        async def request(self, method, url, body=None, headers=None):
+            if method == 'GET':
+                wsdl = read('g4s.cbgrn', 'valid_wsdl_001.xml')
+                return TransportResponse(200, {}, wsdl)
+
+            return TransportResponse(200, {}, read('g4s.cbgrn', 'soap_error.xml'))
+
+    api = AsyncCybozuGaroonApi(create_params(ORIGINAL_SERVER_URL), SoapErrorTransport())
+    params = dict(start=START, end=END)
+
+    with pytest.raises(RequestError):
+        asyncio.run(api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params))
+
+
+def test__AsyncCybozuGaroonApi__does_not_retry_soap_fault_with_server_error_status():
+    class SoapFaultTransport(AsyncTransport):
+        def __init__(self):
+            self.posts = 0
+
+        async def request(self, method, url, body=None, headers=None):
+            if method == 'GET':
+                return TransportResponse(200, {}, read('g4s.cbgrn', 'valid_wsdl_001.xml'))
+
+            self.posts += 1
+            return TransportResponse(500, {}, read('g4s.cbgrn', 'soap_error.xml'))
+
+    transport = SoapFaultTransport()
+    api = AsyncCybozuGaroonApi(create_params(ORIGINAL_SERVER_URL), transport)
+    params = dict(start=START, end=END)
+
+    with pytest.raises(RequestError) as ex:
+        asyncio.run(api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params))
+
+    assert 'Cannot log in.' in str(ex.value)
+    assert transport.posts == 1
+    assert api.circuit_breaker.failures == 0
+
+
+def test__AsyncCybozuGaroonApi__releases_cancelled_trial_call_of_circuit_breaker():
+    class HangingTransport(AsyncTransport):
+        async def request(self, method, url, body=None, headers=None):
+            await asyncio.sleep(3600)
+
+    params = dict(create_params(ORIGINAL_SERVER_URL), circuit_reset_timeout=0)
+    api = AsyncCybozuGaroonApi(params, HangingTransport())
+    circuit_breaker = api.circuit_breaker
+    for x in range(5):
+        circuit_breaker.record_failure()
+
+    async def main():
+        task = asyncio.ensure_future(api.get_soap_endpoints())
+        await asyncio.sleep(0.01)
+        assert circuit_breaker.state == circuit_breaker.HALF_OPEN
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    # the next call becomes a trial call
+    assert circuit_breaker.state == circuit_breaker.OPEN
+    assert circuit_breaker.before_call()
+
+
+###
+### g4s.cbgrn.aio.AsyncHttpTransport
+###
+
+def test__AsyncCybozuGaroonApi__sends_uncompressed_request_if_server_rejects_compressed_one(
+        monkeypatch):
+    class RejectingTransport(AsyncTransport):
+        def __init__(self):
+            self.encodings = []
+
+        async def request(self, method, url, body=None, headers=None):
+            if method == 'GET':
+                return TransportResponse(200, {}, read('g4s.cbgrn', 'valid_wsdl_001.xml'))
+
+            encoding = headers.get('Content-Encoding')
+            self.encodings.append(encoding)
+            if encoding is not None:
+                return TransportResponse(415, {}, b'')
+
+            return TransportResponse(200, {}, read('g4s.cbgrn', 'soap_error.xml'))
+
+    monkeypatch.setattr('g4s.cbgrn.api._MIN_COMPRESSED_REQUEST_SIZE', 0)
+    g4s.cbgrn.api._uncompressed_endpoints.clear()
+
+    transport = RejectingTransport()
+    params = dict(create_params(ORIGINAL_SERVER_URL), request_compression='gzip')
+    api = AsyncCybozuGaroonApi(params, transport)
+
+    for x in range(2):
+        with pytest.raises(RequestError):
+            asyncio.run(api.get_events(START, END))
+
+    assert transport.encodings == ['gzip', None, None]
+    g4s.cbgrn.api._uncompressed_endpoints.clear()
+
+
+def test__AsyncHttpTransport__request__raises_ValueError_for_unsupported_scheme():
+    transport = AsyncHttpTransport()
+
+    with pytest.raises(ValueError):
+        asyncio.run(transport.request('GET', 'ftp://example.com/'))
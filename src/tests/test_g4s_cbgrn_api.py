@@ -1,18 +1,40 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+import hashlib
 import io
 import jinja2
+import logging
 import lxml.etree
 import mock
 import pytest
 import requests
+import sys
+import threading
+import time
 import yaml
+import g4s.cbgrn.api
+import g4s.core.retry
 from g4s.cbgrn.api import CybozuGaroonApi
+from g4s.cbgrn.api import EventChanges
+from g4s.core.api import BatchRequestError
 from g4s.core.api import NetworkError
+from g4s.core.api import RequestError
 from g4s.core.api import ResponseParseError
 from g4s.core.date import DateTime
+from g4s.core.date import TimeZone
+from g4s.core.metrics import get_registry
 from g4s.core.model import Event
+from g4s.core.model import Participant
+from g4s.core.retry import CircuitBreaker
+from g4s.core.retry import CircuitOpenError
+from g4s.core.trace import MemorySpanExporter
+from g4s.core.trace import get_tracer
+from .dataset import CalendarDataset
+from .garoon_server import GaroonServer
 from .util import check_if_current_datetime_is_correctly_fixed
+from .util import create_event_info
+from .util import create_event_info_on_day
 from .util import fix_current_datetime
 from .util import parse_xml
 from .util import raises_argument_null_error
@@ -21,12 +43,15 @@ from .util import read
 from .util import xml_compare
 
 
+pytestmark = pytest.mark.usefixtures('reset_shared_state')
+
+
 ###
 ### utilities
 ###
 
 def create_soap_request_response_pairs_from_yaml(name):
-    data = yaml.load(read('g4s.cbgrn', name))
+    data = yaml.safe_load(read('g4s.cbgrn', name))
 
     request_generator_info = data['generators']['request']
     response_generator_info = data['generators']['response']
@@ -63,6 +88,11 @@ def create_soap_response(generator_info, response_info):
     return xml
 
 
+def render_get_events_response(events):
+    template = jinja2.Template(read('g4s.cbgrn', 'get_events-response.xml').decode('utf-8'))
+    return template.render(events=events).encode('utf-8')
+
+
 def verify_events(events, expected_events_name):
     record = [r for r in SOAP_REQUEST_RESPONSE_PAIRS if r[0] == expected_events_name][0]
     name, service, action, req_info, req_xml, res_info, res_xml = record
@@ -135,9 +165,23 @@ SOAP_REQUEST_RESPONSE_PAIRS = create_soap_request_response_pairs_from_yaml('get_
 ### fixture
 ###
 
+class RawResponseStream(io.BytesIO):
+    # `requests.Response.raw` accepts attributes such as `decode_content`
+    pass
+
+
+def create_response_mock(data, status_code=200):
+    response = mock.Mock(spec=requests.Response)
+    response.status_code = status_code
+    type(response).content = mock.PropertyMock(return_value=data)
+    type(response).text = mock.PropertyMock(return_value=data.decode('utf-8'))
+    response.raw = RawResponseStream(data)
+    return response
+
+
 def patch_requests_to_cause_network_error(monkeypatch, target):
-    def my_request_method(url, *args):
-        response = mock.Mock(spec=requests.Response)
+    def my_request_method(url, *args, **kwargs):
+        response = create_response_mock(b'Service Unavailable', 503)
         response.raise_for_status.side_effect = requests.exceptions.HTTPError
         return response
 
@@ -145,7 +189,7 @@ def patch_requests_to_cause_network_error(monkeypatch, target):
 
 
 def patch_requests_get_to_return_specified_wsdl(monkeypatch, wsdl_path):
-    def my_request_get(url, *args):
+    def my_request_get(url, *args, **kwargs):
         # GET request is used only to get WSDL.
         if url != SOAP_WSDL_URL: raise Exception
 
@@ -180,30 +224,43 @@ def patch_requests_post_to_return_correct_soap_response(monkeypatch):
         buf = io.BytesIO()
         response_xml.getroottree().write(buf, pretty_print=True)
 
-        response = mock.Mock(spec=requests.Response)
-        type(response).text = mock.PropertyMock(return_value=buf.getvalue().decode('utf-8'))
+        return create_response_mock(buf.getvalue())
 
-        return response
+    monkeypatch.setattr('requests.post', my_request_post)
+
+
+def patch_requests_post_to_return_events_in_range(monkeypatch, events):
+    """
+    Patches `requests.post` to return events in the requested range, and returns a list which
+    records the requested ranges.
+    """
+
+    requested_ranges = []
+    nss = dict(base='http://wsdl.cybozu.co.jp/base/2008')
+
+    def my_request_post(url, data, *args, **kwargs):
+        node = parse_xml(data).xpath('//base:parameters', namespaces=nss)[0]
+        start = datetime.datetime.strptime(node.attrib['start'], '%Y-%m-%dT%H:%M:%SZ')
+        end = datetime.datetime.strptime(node.attrib['end'], '%Y-%m-%dT%H:%M:%SZ')
+        requested_ranges.append((start, end))
+
+        matched = [e for e in events if e['when']['start'] < end and start < e['when']['end']]
+        return create_response_mock(render_get_events_response(matched))
 
     monkeypatch.setattr('requests.post', my_request_post)
+    return requested_ranges
 
 
 def patch_requests_post_to_invalid_xml_text(monkeypatch):
     def my_request_post(*args, **kwargs):
-        response = mock.Mock(spec=requests.Response)
-        type(response).text = mock.PropertyMock(return_value='foo')
-        return response
+        return create_response_mock(b'foo')
 
     monkeypatch.setattr('requests.post', my_request_post)
 
 
-def patch_requests_post_to_return_soap_error(monkeypatch):
+def patch_requests_post_to_return_soap_error(monkeypatch, status_code=200):
     def my_request_post(*args, **kwargs):
-        response_text = read('g4s.cbgrn', 'soap_error.xml').decode('utf-8')
-
-        response = mock.Mock(spec=requests.Response)
-        type(response).text = mock.PropertyMock(return_value=response_text)
-        return response
+        return create_response_mock(read('g4s.cbgrn', 'soap_error.xml'), status_code)
 
     monkeypatch.setattr('requests.post', my_request_post)
 
@@ -251,9 +308,10 @@ def invalid_soap_response(monkeypatch):
 
 @pytest.fixture
 def valid_response(monkeypatch):
+    # fixtures cannot be called directly since pytest 4
     fix_current_datetime(monkeypatch)
-    valid_wsdl_001(monkeypatch)
-    valid_soap_response(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
 
 
 @pytest.fixture
@@ -407,6 +465,89 @@ def test__CybozuGaroonApi__get_events__returns_correct_result_when_start_only_ev
     verify_events(events, 'get_events-005')
 
 
+def test__CybozuGaroonApi__get_events__converts_utc_date_times_into_time_zones_of_event(
+        monkeypatch):
+
+    # Garoon returns date times of events as UTC, regardless of the time zones of the events
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    event_info = create_event_info(
+        1, datetime.datetime(2014, 1, 1, 0), datetime.datetime(2014, 1, 1, 1))
+    event_info.update(timezone='Asia/Tokyo', end_timezone='America/New_York')
+    patch_requests_post_to_return_events_in_range(monkeypatch, [event_info])
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    event, = api.get_events(
+        DateTime.get(2014, 1, 1, tzinfo='UTC'), DateTime.get(2014, 1, 2, tzinfo='UTC'))
+
+    assert event.start == DateTime.get(2014, 1, 1, 9, tzinfo='Asia/Tokyo')
+    assert (event.start.hour, event.start.tzinfo) == (9, TimeZone.get('Asia/Tokyo'))
+    assert event.end == DateTime.get(2013, 12, 31, 20, tzinfo='America/New_York')
+    assert (event.end.hour, event.end.tzinfo) == (20, TimeZone.get('America/New_York'))
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1])
+def test__CybozuGaroonApi__get_events__raises_ValueError_if_invalid_chunk_size_is_specified(chunk_size):
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+
+    with pytest.raises(ValueError):
+        api.get_events(start, end, chunk_size=datetime.timedelta(days=chunk_size))
+
+    with pytest.raises(ValueError):
+        api.get_events(start, end, max_workers=chunk_size)
+
+
+@pytest.mark.parametrize('obj', [1, 2.34, 'foo', object()])
+def test__CybozuGaroonApi__get_events__raises_ArgumentTypeError_if_invalid_chunk_option_is_specified(obj):
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+
+    with raises_argument_type_error('chunk_size'):
+        api.get_events(start, end, chunk_size=obj)
+
+    if not isinstance(obj, int):
+        with raises_argument_type_error('max_workers'):
+            api.get_events(start, end, max_workers=obj)
+
+
+def test__CybozuGaroonApi__get_events__retrieves_chunks_and_removes_duplicated_events(monkeypatch):
+    d = lambda day, hour=0: datetime.datetime(2014, 1, day, hour)
+    events = [
+        create_event_info(1, d(1, 9), d(1, 10)),
+        create_event_info(2, d(2, 23), d(3, 1)),  # spans the boundary of the first two chunks
+        create_event_info(3, d(4, 9), d(4, 10)),
+        create_event_info(4, d(8, 9), d(8, 10)),  # out of range
+    ]
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(monkeypatch, events)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 6, 12, tzinfo='UTC')
+    result = api.get_events(start, end, chunk_size=datetime.timedelta(days=2), max_workers=2)
+
+    assert sorted(requested_ranges) == [(d(1), d(3)), (d(3), d(5)), (d(5), d(6, 12))]
+    assert [e.id for e in result] == [1, 2, 3]
+    assert isinstance(result, tuple)
+
+
+def test__CybozuGaroonApi__get_events__sends_single_request_if_range_is_smaller_than_chunk_size(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(monkeypatch, [])
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    api.get_events(start, end, chunk_size=datetime.timedelta(days=7))
+
+    assert len(requested_ranges) == 1
+
+
 ###
 ### g4s.cbgrn.api.CybozuGaroonApi.get_soap_endpoints
 ###
@@ -443,103 +584,1981 @@ def test__CybozuGaroonApi__get_soap_endpoints__returns_correct_results__001(vali
 
 
 ###
-### g4s.cbgrn.api.CybozuGaroonApi.execute_soap_request
+### g4s.cbgrn.api.CybozuGaroonApi (SOAP endpoint cache)
 ###
 
-@pytest.mark.parametrize('name', ['service', 'action', 'action_params'])
-def test__CybouzGaroonApi__execute_soap_request__raises_ArgumentNullError_if_None_is_specified(name):
-    kwargs = dict(service='foo', action='bar', action_params=dict())
-    kwargs[name] = None
+def count_wsdl_requests(monkeypatch):
+    counter = []
+    original = requests.get
 
-    api = CybozuGaroonApi(VALID_API_PARAMS)
-    with raises_argument_null_error(name):
-        api.execute_soap_request(**kwargs)
+    def my_request_get(url, *args, **kwargs):
+        counter.append(url)
+        return original(url, *args, **kwargs)
 
+    monkeypatch.setattr('requests.get', my_request_get)
+    return counter
 
-@pytest.mark.parametrize('name', ['service', 'action', 'action_params'])
-def test__CybouzGaroonApi__execute_soap_request__raises_ArgumentTypeError_if_invalid_value_is_specified(name):
 
-    for value in (1, 1.234, object()):
-        kwargs = dict(service='foo', action='bar', action_params=dict())
-        kwargs[name] = value
+def test__CybozuGaroonApi__endpoint_cache__is_shared_among_instances(monkeypatch):
+    fix_current_datetime(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
+    counter = count_wsdl_requests(monkeypatch)
 
-        api = CybozuGaroonApi(VALID_API_PARAMS)
-        with raises_argument_type_error(name):
-            api.execute_soap_request(**kwargs)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    for x in range(3):
+        CybozuGaroonApi(VALID_API_PARAMS).get_events(start, end)
 
+    assert counter == [SOAP_WSDL_URL]
 
-def test__CybouzGaroonApi__execute_soap_request__returns_valid_response(valid_response):
-    api = CybozuGaroonApi(VALID_API_PARAMS)
 
-    # get_events-001
-    params = dict(start=DateTime.get(2014, 1, 1, tzinfo='UTC'), end=DateTime.get(2014, 1, 2, tzinfo='UTC'))
-    response = api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+def test__CybozuGaroonApi__endpoint_cache__expires_after_ttl(monkeypatch):
+    fix_current_datetime(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
+    counter = count_wsdl_requests(monkeypatch)
 
-    expected_response = [r[6] for r in SOAP_REQUEST_RESPONSE_PAIRS if r[0] == 'get_events-001'][0]
-    assert xml_compare(response, expected_response)
+    params = dict(VALID_API_PARAMS, endpoint_cache_ttl=0)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    for x in range(2):
+        CybozuGaroonApi(params).get_events(start, end)
 
+    assert len(counter) == 2
 
-def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_invalid_service_is_specified(
-        valid_incompleted_wsdl_001, valid_soap_response):
+
+def test__CybozuGaroonApi__endpoint_cache__is_persisted_to_directory(monkeypatch, tmpdir):
+    fix_current_datetime(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
+    counter = count_wsdl_requests(monkeypatch)
+
+    params = dict(VALID_API_PARAMS, endpoint_cache_dir=str(tmpdir))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+
+    CybozuGaroonApi(params).get_events(start, end)
+    g4s.cbgrn.api._endpoint_cache.clear()  # simulates another process
+    CybozuGaroonApi(params).get_events(start, end)
+
+    assert counter == [SOAP_WSDL_URL]
+
+
+@pytest.mark.parametrize('status_code', [200, 500])
+def test__CybozuGaroonApi__endpoint_cache__is_kept_after_soap_fault(monkeypatch, status_code):
+    # e.g. a wrong password of a user must not invalidate endpoints of the other users
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_soap_error(monkeypatch, status_code)
+    counter = count_wsdl_requests(monkeypatch)
 
     api = CybozuGaroonApi(VALID_API_PARAMS)
     params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    for x in range(2):
+        with pytest.raises(RequestError):
+            api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+        with pytest.raises(RequestError):
+            api.get_events(params['start'], params['end'])
 
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+    assert len(counter) == 1
 
 
-def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_invalid_service_or_action_name_is_specified(
-        valid_response):
+def test__CybozuGaroonApi__endpoint_cache__is_invalidated_if_endpoint_is_not_found(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    monkeypatch.setattr('requests.post', lambda *args, **kwargs: create_response_mock(b'', 404))
+    counter = count_wsdl_requests(monkeypatch)
 
     api = CybozuGaroonApi(VALID_API_PARAMS)
     params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    for x in range(2):
+        with pytest.raises(RequestError):
+            api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
 
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('FooService', 'ScheduleGetEvents', params)
-
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('ScheduleService', 'BarAction', params)
+    assert len(counter) == 2
 
 
+def test__CybozuGaroonApi__endpoint_cache__is_invalidated_by_connection_failure(monkeypatch):
+    def my_request_post(*args, **kwargs):
+        raise requests.exceptions.ConnectionError
 
-@pytest.mark.parametrize('name', ['start', 'end'])
-def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_required_value_is_missing(
-        valid_response, name):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    monkeypatch.setattr('requests.post', my_request_post)
+    counter = count_wsdl_requests(monkeypatch)
 
-    api = CybozuGaroonApi(VALID_API_PARAMS)
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, retry_max_attempts=1))
     params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
-    params.pop(name)
+    for x in range(2):
+        with pytest.raises(NetworkError):
+            api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
 
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+    assert len(counter) == 2
 
 
-def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_required_value_is_missing(
-        valid_wsdl_001, network_post_error):
+@pytest.mark.parametrize('key,value', [
+    ('endpoint_cache_ttl', '60'), ('endpoint_cache_ttl', True), ('endpoint_cache_dir', 1),
+    ('response_cache_ttl', '60'), ('response_cache_dir', 1)])
+def test__CybozuGaroonApi__init__raises_ArgumentTypeError_if_invalid_cache_option_is_specified(
+        key, value):
 
-    api = CybozuGaroonApi(VALID_API_PARAMS)
-    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    params = dict(VALID_API_PARAMS)
+    params[key] = value
 
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+    with raises_argument_type_error('params[{0}]'.format(key)):
+        CybozuGaroonApi(params)
 
 
-def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_failed_to_parse_soap_response(
-        valid_wsdl_001, invalid_soap_response):
+###
+### g4s.cbgrn.api.CybozuGaroonApi (response cache)
+###
+
+RESPONSE_CACHE_EVENTS = [
+    create_event_info(1, datetime.datetime(2014, 1, 1, 9), datetime.datetime(2014, 1, 1, 10)),
+]
+
+
+def test__CybozuGaroonApi__get_events__does_not_cache_events_by_default(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
 
     api = CybozuGaroonApi(VALID_API_PARAMS)
-    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    api.get_events(start, end)
+    api.get_events(start, end)
 
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+    assert len(requested_ranges) == 2
 
 
-def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_soap_error_is_happened(
-        valid_wsdl_001, soap_error):
+def test__CybozuGaroonApi__get_events__reuses_events_retrieved_by_another_instance(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
 
-    api = CybozuGaroonApi(VALID_API_PARAMS)
-    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    params = dict(VALID_API_PARAMS, response_cache_ttl=60)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    events1 = CybozuGaroonApi(params).get_events(start, end)
+    events2 = CybozuGaroonApi(params).get_events(
+        start.astimezone(TimeZone.get('Asia/Tokyo')), end.astimezone(TimeZone.get('Asia/Tokyo')))
 
-    with pytest.raises(Exception):  # TODO
-        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+    assert len(requested_ranges) == 1
+    assert [(e.id, e.title) for e in events2] == [(e.id, e.title) for e in events1]
+
+
+def test__CybozuGaroonApi__get_events__returns_copies_of_cached_events(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    events1 = api.get_events(start, end)
+    title = events1[0].title
+    events1[0].title = 'modified by caller'
+
+    events2 = api.get_events(start, end)
+    events2[0].title = 'modified by caller'
+
+    assert len(requested_ranges) == 1
+    assert api.get_events(start, end)[0].title == title
+    assert [e.id for e in events2] == [1]
+
+
+def test__CybozuGaroonApi__get_events__does_not_share_cached_events_between_credentials(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
+
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60)).get_events(start, end)
+    CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60, password='baz')).get_events(
+        start, end)
+    CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60)).get_events(
+        start, end + datetime.timedelta(hours=1))
+
+    assert len(requested_ranges) == 3
+
+
+def test__CybozuGaroonApi__get_events__caches_each_chunk(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    chunk_size = datetime.timedelta(days=1)
+    api.get_events(start, start + datetime.timedelta(days=2), chunk_size=chunk_size)
+    api.get_events(start, start + datetime.timedelta(days=3), chunk_size=chunk_size)
+
+    assert len(requested_ranges) == 3
+
+
+def test__CybozuGaroonApi__get_events__reuses_events_persisted_in_response_cache_dir(
+        monkeypatch, tmpdir):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
+
+    params = dict(VALID_API_PARAMS, response_cache_ttl=60, response_cache_dir=str(tmpdir))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    CybozuGaroonApi(params).get_events(start, end)
+
+    # imitates another process
+    g4s.cbgrn.api._response_cache.clear()
+    events = CybozuGaroonApi(params).get_events(start, end)
+
+    assert len(requested_ranges) == 1
+    assert [e.id for e in events] == [1]
+    assert len(g4s.cbgrn.api._response_cache) == 1
+
+
+def test__CybozuGaroonApi__get_events__does_not_write_password_or_its_plain_digest(
+        monkeypatch, tmpdir):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, RESPONSE_CACHE_EVENTS)
+
+    params = dict(
+        VALID_API_PARAMS, password='secret password', response_cache_ttl=60,
+        response_cache_dir=str(tmpdir))
+    CybozuGaroonApi(params).get_events(
+        DateTime.get(2014, 1, 1, tzinfo='UTC'), DateTime.get(2014, 1, 2, tzinfo='UTC'))
+
+    data = b''.join(f.read_binary() for f in tmpdir.listdir())
+    password = 'secret password'.encode('utf-8')
+    assert password not in data
+    assert hashlib.sha256(password).hexdigest().encode('ascii') not in data
+
+
+def test__CybozuGaroonApi__get_events__does_not_cache_failed_requests(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_soap_error(monkeypatch)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+
+    with pytest.raises(RequestError):
+        api.get_events(start, end)
+
+    assert len(g4s.cbgrn.api._response_cache) == 0
+
+
+def test__CybozuGaroonApi__init__raises_ValueError_if_negative_response_cache_ttl_is_specified():
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=-1))
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (multi-process parsing)
+###
+
+def create_events_for_parse_test(count):
+    return [
+        create_event_info(
+            x + 1,
+            datetime.datetime(2014, 1, 1) + datetime.timedelta(hours=x),
+            datetime.datetime(2014, 1, 1) + datetime.timedelta(hours=x + 1))
+        for x in range(count)]
+
+
+@pytest.mark.parametrize('key,value', [('parse_processes', '2'), ('parse_shard_size', 1.5)])
+def test__CybozuGaroonApi__init__raises_ArgumentTypeError_if_invalid_parse_option_is_specified(
+        key, value):
+
+    with raises_argument_type_error('params[{0}]'.format(key)):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, **{key: value}))
+
+
+def test__CybozuGaroonApi__init__raises_ValueError_if_unknown_repeat_expansion_is_specified():
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, repeat_expansion='foo'))
+
+
+def test__CybozuGaroonApi__init__raises_ImportError_if_vectorized_expansion_lacks_numpy(
+        monkeypatch):
+
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    monkeypatch.delitem(sys.modules, 'g4s.cbgrn.vectorized', raising=False)
+
+    with pytest.raises(ImportError) as excinfo:
+        CybozuGaroonApi(dict(VALID_API_PARAMS, repeat_expansion='vectorized'))
+
+    assert 'g4s[vectorized]' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('key', ['parse_processes', 'parse_shard_size'])
+def test__CybozuGaroonApi__init__raises_ValueError_if_non_positive_parse_option_is_specified(key):
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, **{key: 0}))
+
+
+def test__CybozuGaroonApi__get_events__parses_small_response_in_calling_process(monkeypatch):
+    def my_get_parse_executor(processes):
+        raise AssertionError('process pool must not be used')
+
+    monkeypatch.setattr('g4s.cbgrn.api._get_parse_executor', my_get_parse_executor)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, create_events_for_parse_test(3))
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, parse_processes=2, parse_shard_size=3))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    events = api.get_events(start, end)
+
+    assert [e.id for e in events] == [1, 2, 3]
+
+
+def test__CybozuGaroonApi__get_events__parses_shards_in_worker_processes_in_original_order(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, create_events_for_parse_test(23))
+
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 3, tzinfo='UTC')
+    expected = CybozuGaroonApi(VALID_API_PARAMS).get_events(start, end)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, parse_processes=2, parse_shard_size=5))
+    events = api.get_events(start, end)
+
+    assert [e.id for e in events] == list(range(1, 24))
+    for expected_event, event in zip(expected, events):
+        assert event.to_dict() == expected_event.to_dict()
+        assert [(p.id, p.name) for p in event.participants] == [(1, 'foo')]
+
+
+def test__parse_event_shard__returns_events_of_serialized_nodes():
+    text = render_get_events_response(create_events_for_parse_test(2))
+    nodes = parse_xml(text).iter('schedule_event')
+    shards = list(g4s.cbgrn.api._serialize_event_shards(nodes, 1))
+    events = [e for shard in shards for e in g4s.cbgrn.api._parse_event_shard(shard)]
+
+    assert len(shards) == 2
+    assert [e.id for e in events] == [1, 2]
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (participant pool)
+###
+
+def create_events_with_same_members(count):
+    members = [dict(id=x, name='user{0}'.format(x), order=x) for x in range(1, 4)]
+    return [
+        dict(create_event_info(
+            x, datetime.datetime(2014, 1, 1, 9), datetime.datetime(2014, 1, 1, 10)),
+            members=members)
+        for x in range(1, count + 1)]
+
+
+def test__CybozuGaroonApi__get_events__shares_participants_among_events(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, create_events_with_same_members(3))
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    events1 = api.get_events(start, end)
+    events2 = api.get_events(start, end)
+
+    assert [p.name for p in events1[0].participants] == ['user1', 'user2', 'user3']
+    assert all(e.participants is events1[0].participants for e in events1)
+    assert events2[0].participants is not events1[0].participants
+    assert len(g4s.cbgrn.api._participant_pool) == 0
+
+
+def test__CybozuGaroonApi__get_events__shares_participants_among_requests_if_specified(
+        monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, create_events_with_same_members(3))
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, participant_pool='process'))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    events1 = api.get_events(start, end)
+    events2 = api.get_events(start, end)
+
+    assert events2[0].participants is events1[0].participants
+    assert len(g4s.cbgrn.api._participant_pool) == 3
+
+
+def test__CybozuGaroonApi__init__raises_ValueError_if_unknown_participant_pool_is_specified():
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, participant_pool='thread'))
+
+
+def test__CybozuGaroonApi__parse_members__sorts_members_by_order():
+    node = parse_xml(render_get_events_response([dict(
+        create_event_info(1, datetime.datetime(2014, 1, 1, 9), datetime.datetime(2014, 1, 1, 10)),
+        members=[
+            dict(id=1, name='foo', order=2), dict(id=2, name='bar', order=1),
+            dict(id=3, name='baz', order=2)])])).find('.//schedule_event')
+
+    members = CybozuGaroonApi._parse_members(node)
+    assert [p.name for p in members] == ['bar', 'foo', 'baz']
+
+
+###
+### g4s.cbgrn.api._RepeatEventRule
+###
+
+def create_repeat_rule(
+        type, start_date, end_date, day=0, week=0, start_time=(9, 0, 0), end_time=(10, 0, 0),
+        all_day=False, start_only=False, exclusive_datetimes=(), tz_name='Asia/Tokyo'):
+
+    return g4s.cbgrn.api._RepeatEventRule(
+        1, 'meeting', None, all_day, start_only, (Participant(1, 'foo'), ), True,
+        DateTime.get(2014, 1, 1, tzinfo=tz_name), tz_name, tz_name, type, day, week,
+        start_date, end_date, start_time, end_time, exclusive_datetimes)
+
+
+def resolve_dates(rule, start=None, end=None):
+    return [(e.start.year, e.start.month, e.start.day) for e in rule.resolve(start, end)]
+
+
+def test__RepeatEventRule__init__raises_ValueError_if_unsupported_type_is_specified():
+    with pytest.raises(ValueError):
+        create_repeat_rule('year', datetime.date(2014, 1, 1), datetime.date(2014, 12, 31))
+
+
+def test__RepeatEventRule__resolve__returns_occurrences_of_day_type():
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 30), datetime.date(2014, 2, 2))
+    events = list(rule.resolve())
+
+    assert resolve_dates(rule) == [(2014, 1, 30), (2014, 1, 31), (2014, 2, 1), (2014, 2, 2)]
+    assert events[0].start == DateTime.get(2014, 1, 30, 9, tzinfo='Asia/Tokyo')
+    assert events[0].end == DateTime.get(2014, 1, 30, 10, tzinfo='Asia/Tokyo')
+    assert all(e.id == 1 and e.type == Event.NORMAL for e in events)
+
+
+def test__RepeatEventRule__resolve__returns_occurrences_of_weekday_type():
+    # 2014-01-03 is Friday
+    rule = create_repeat_rule('weekday', datetime.date(2014, 1, 3), datetime.date(2014, 1, 7))
+
+    assert resolve_dates(rule) == [(2014, 1, 3), (2014, 1, 6), (2014, 1, 7)]
+
+
+def test__RepeatEventRule__resolve__returns_occurrences_of_week_type():
+    # every Wednesday, 2014-01-01 is Wednesday
+    rule = create_repeat_rule('week', datetime.date(2013, 12, 30), datetime.date(2014, 1, 22), week=3)
+
+    assert resolve_dates(rule) == [(2014, 1, 1), (2014, 1, 8), (2014, 1, 15), (2014, 1, 22)]
+
+
+@pytest.mark.parametrize('type,expected', [
+    ('1stweek', [(2014, 1, 5), (2014, 2, 2), (2014, 3, 2)]),
+    ('2ndweek', [(2014, 1, 12), (2014, 2, 9), (2014, 3, 9)]),
+    ('3rdweek', [(2014, 1, 19), (2014, 2, 16), (2014, 3, 16)]),
+    ('4thweek', [(2014, 1, 26), (2014, 2, 23), (2014, 3, 23)]),
+    ('lastweek', [(2014, 1, 26), (2014, 2, 23), (2014, 3, 30)]),
+])
+def test__RepeatEventRule__resolve__returns_occurrences_of_nth_week_type(type, expected):
+    # Sundays
+    rule = create_repeat_rule(type, datetime.date(2014, 1, 1), datetime.date(2014, 3, 31), week=0)
+
+    assert resolve_dates(rule) == expected
+
+
+@pytest.mark.parametrize('day,expected', [
+    (15, [(2014, 1, 15), (2014, 2, 15), (2014, 3, 15)]),
+    (31, [(2014, 1, 31), (2014, 3, 31)]),
+    (0, [(2014, 1, 31), (2014, 2, 28), (2014, 3, 31)]),
+])
+def test__RepeatEventRule__resolve__returns_occurrences_of_month_type(day, expected):
+    rule = create_repeat_rule('month', datetime.date(2014, 1, 1), datetime.date(2014, 3, 31), day=day)
+
+    assert resolve_dates(rule) == expected
+
+
+def test__RepeatEventRule__resolve__returns_all_day_and_start_only_occurrences():
+    all_day_rule = create_repeat_rule(
+        'day', datetime.date(2014, 1, 1), datetime.date(2014, 1, 1), start_time=None,
+        end_time=None, all_day=True)
+    start_only_rule = create_repeat_rule(
+        'day', datetime.date(2014, 1, 1), datetime.date(2014, 1, 1), end_time=None,
+        start_only=True)
+
+    all_day_event, = all_day_rule.resolve()
+    start_only_event, = start_only_rule.resolve()
+
+    assert all_day_event.is_allday
+    assert all_day_event.start == all_day_event.end == DateTime.get(2014, 1, 1, tzinfo='Asia/Tokyo')
+    assert start_only_event.end is None
+
+
+def test__RepeatEventRule__resolve__returns_occurrences_which_overlap_with_window():
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 1), datetime.date(2014, 1, 31))
+
+    # 09:30 JST on 2014-01-10 is in the middle of the occurrence of the day
+    start = DateTime.get(2014, 1, 10, 0, 30, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 13, 0, 0, tzinfo='UTC')
+
+    assert resolve_dates(rule, start, end) == [(2014, 1, 10), (2014, 1, 11), (2014, 1, 12)]
+
+
+def test__RepeatEventRule__resolve__does_not_create_occurrences_outside_window(monkeypatch):
+    created = []
+    original = g4s.cbgrn.api._RepeatEventRule._create_occurrence
+
+    def my_create_occurrence(self, date):
+        created.append(date)
+        return original(self, date)
+
+    monkeypatch.setattr(
+        'g4s.cbgrn.api._RepeatEventRule._create_occurrence', my_create_occurrence)
+
+    rule = create_repeat_rule('day', datetime.date(2010, 1, 1), datetime.date(2019, 12, 31))
+    start = DateTime.get(2014, 6, 1, tzinfo='Asia/Tokyo')
+    end = DateTime.get(2014, 6, 8, tzinfo='Asia/Tokyo')
+
+    assert len(resolve_dates(rule, start, end)) == 7
+    assert len(created) <= 10
+
+
+def test__RepeatEventRule__resolve__requires_end_if_repeat_has_no_end_date():
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 1), None)
+
+    with pytest.raises(ValueError):
+        list(rule.resolve())
+
+    end = DateTime.get(2014, 1, 3, tzinfo='Asia/Tokyo')
+    assert resolve_dates(rule, None, end) == [(2014, 1, 1), (2014, 1, 2)]
+
+
+def test__RepeatEventRule__resolve__skips_exclusive_datetimes():
+    d = lambda day: DateTime.get(2014, 1, day, tzinfo='Asia/Tokyo')
+    exclusive_datetimes = [(d(5), d(6)), (d(2), d(3)), (d(2), d(4))]
+    rule = create_repeat_rule(
+        'day', datetime.date(2014, 1, 1), datetime.date(2014, 1, 6),
+        exclusive_datetimes=exclusive_datetimes)
+
+    assert resolve_dates(rule) == [(2014, 1, 1), (2014, 1, 4), (2014, 1, 6)]
+
+
+def count_expanded_dates(monkeypatch):
+    expanded = []
+    original = g4s.cbgrn.api._RepeatEventRule._iterate_dates
+
+    def my_iterate_dates(self, first, last):
+        for date in original(self, first, last):
+            expanded.append(date)
+            yield date
+
+    monkeypatch.setattr('g4s.cbgrn.api._RepeatEventRule._iterate_dates', my_iterate_dates)
+    return expanded
+
+
+def test__RepeatEventRule__resolve__reuses_cached_occurrences_for_overlapping_window(monkeypatch):
+    expanded = count_expanded_dates(monkeypatch)
+    d = lambda month, day: DateTime.get(2014, month, day, tzinfo='Asia/Tokyo')
+
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 1), datetime.date(2014, 12, 31))
+    first = resolve_dates(rule, d(1, 10), d(1, 20))
+    expanded_by_first = len(expanded)
+
+    # another instance of the same series, e.g. retrieved by the next request
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 1), datetime.date(2014, 12, 31))
+    second = resolve_dates(rule, d(1, 12), d(1, 18))
+
+    assert len(first) == 10 and len(second) == 6
+    assert len(expanded) == expanded_by_first
+
+
+def test__RepeatEventRule__resolve__extends_cached_occurrences_incrementally(monkeypatch):
+    expanded = count_expanded_dates(monkeypatch)
+    d = lambda month, day: DateTime.get(2014, month, day, tzinfo='Asia/Tokyo')
+
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 1), datetime.date(2014, 12, 31))
+    resolve_dates(rule, d(1, 10), d(1, 20))
+    del expanded[:]
+
+    result = resolve_dates(rule, d(1, 5), d(2, 1))
+
+    assert result == [(2014, 1, day) for day in range(5, 32)]
+    assert sorted(expanded) == sorted(
+        [datetime.date(2014, 1, day) for day in range(4, 9)] +
+        [datetime.date(2014, 1, day) for day in range(22, 32)] +
+        [datetime.date(2014, 2, 1), datetime.date(2014, 2, 2)])
+
+
+def test__RepeatEventRule__resolve__does_not_reuse_occurrences_of_another_version(monkeypatch):
+    expanded = count_expanded_dates(monkeypatch)
+    start = DateTime.get(2014, 1, 10, tzinfo='Asia/Tokyo')
+    end = DateTime.get(2014, 1, 20, tzinfo='Asia/Tokyo')
+
+    rule = create_repeat_rule('day', datetime.date(2014, 1, 1), datetime.date(2014, 12, 31))
+    resolve_dates(rule, start, end)
+    del expanded[:]
+
+    exclusive_datetimes = [(DateTime.get(2014, 1, 15, tzinfo='Asia/Tokyo'), end)]
+    rule = create_repeat_rule(
+        'day', datetime.date(2014, 1, 1), datetime.date(2014, 12, 31),
+        exclusive_datetimes=exclusive_datetimes)
+
+    assert resolve_dates(rule, start, end) == [(2014, 1, day) for day in range(10, 15)]
+    assert len(expanded) > 0
+
+
+def test__CybozuGaroonApi__get_events__returns_occurrences_of_repeat_event(monkeypatch):
+    event_info = dict(
+        id=7, event_type='repeat', public_type='public', detail='daily', version=0,
+        timezone='Asia/Tokyo', end_timezone='Asia/Tokyo', allday=False, start_only=False,
+        members=[dict(id=1, name='foo', order=0)],
+        repeat_info=dict(
+            type='day', start_date=datetime.date(2014, 1, 1), end_date=datetime.date(2024, 1, 1),
+            start_time='09:00:00', end_time='10:00:00',
+            exclusive_datetimes=[
+                dict(start='2014-01-02T00:00:00+09:00', end='2014-01-03T00:00:00+09:00')]))
+
+    response = render_get_events_response([event_info])
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    monkeypatch.setattr('requests.post', lambda *args, **kwargs: create_response_mock(response))
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 1, tzinfo='Asia/Tokyo')
+    end = DateTime.get(2014, 1, 4, tzinfo='Asia/Tokyo')
+    events = api.get_events(start, end)
+
+    assert [e.start for e in events] == [
+        DateTime.get(2014, 1, 1, 9, tzinfo='Asia/Tokyo'),
+        DateTime.get(2014, 1, 3, 9, tzinfo='Asia/Tokyo')]
+    assert all(e.id == 7 and e.title == 'daily' for e in events)
+    assert [p.name for p in events[0].participants] == ['foo']
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi.get_events_by_targets
+###
+
+TARGETS_START = DateTime.get(2014, 1, 1, tzinfo='UTC')
+TARGETS_END = DateTime.get(2014, 1, 8, tzinfo='UTC')
+
+
+@pytest.mark.parametrize('targets', [[('user', )], [['user', 1]], [None]])
+def test__CybozuGaroonApi__get_events_by_targets__raises_ArgumentTypeError_if_invalid_target_is_specified(
+        targets):
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with raises_argument_type_error('targets[*]'):
+        api.get_events_by_targets(TARGETS_START, TARGETS_END, targets)
+
+
+def test__CybozuGaroonApi__get_events_by_targets__raises_ValueError_if_unknown_target_type_is_specified():
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with pytest.raises(ValueError):
+        api.get_events_by_targets(TARGETS_START, TARGETS_END, [('organization', 1)])
+
+
+def test__CybozuGaroonApi__get_events_by_targets__returns_events_grouped_by_target():
+    events = [create_event_info_on_day(x, x + 1) for x in range(1, 4)]
+    events[1]['members'].append(dict(id=2, name='bar', order=1))
+    events[2]['members'] = [dict(id=5, name='baz', order=0)]
+
+    with GaroonServer(events, groups={3: [5]}) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        targets = [('user', 1), ('user', 2), ('group', 3), ('facility', 4), ('user', 1)]
+        retrieved = api.get_events_by_targets(TARGETS_START, TARGETS_END, targets)
+
+    requested_targets = [
+        (node.tag, int(node.attrib['id']))
+        for r in server.requests if r.action == 'ScheduleGetEventsByTarget'
+        for node in parse_xml(r.body).iter('user', 'group', 'facility')]
+    assert sorted(requested_targets) == sorted(set(targets))
+    assert list(retrieved) == [('user', 1), ('user', 2), ('group', 3), ('facility', 4)]
+    assert [e.id for e in retrieved[('user', 1)]] == [1, 2]
+    assert [e.id for e in retrieved[('group', 3)]] == [3]
+    assert retrieved[('facility', 4)] == ()
+
+    # the event shared between users is returned as the same object
+    assert retrieved[('user', 2)][0] is retrieved[('user', 1)][1]
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi.get_changed_events
+###
+
+def create_versioned_event_info(id, version):
+    event_info = create_event_info(
+        id, datetime.datetime(2014, 1, 2, 9), datetime.datetime(2014, 1, 2, 10))
+    event_info['version'] = version
+    return event_info
+
+
+@pytest.fixture
+def event_version_server():
+    events = [create_versioned_event_info(x, 100) for x in range(1, 6)]
+    with GaroonServer(events) as server:
+        yield server
+
+
+CHANGES_START = DateTime.get(2014, 1, 1, tzinfo='UTC')
+CHANGES_END = DateTime.get(2014, 2, 1, tzinfo='UTC')
+
+
+def test__CybozuGaroonApi__get_changed_events__raises_ArgumentNullError_if_None_is_specified():
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with raises_argument_null_error('known_versions'):
+        api.get_changed_events(CHANGES_START, CHANGES_END, None)
+    with raises_argument_type_error('known_versions'):
+        api.get_changed_events(CHANGES_START, CHANGES_END, [])
+
+
+def test__CybozuGaroonApi__get_changed_events__returns_all_events_if_no_version_is_known(
+        event_version_server):
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=event_version_server.url))
+    changes = api.get_changed_events(CHANGES_START, CHANGES_END, {})
+
+    assert isinstance(changes, EventChanges)
+    assert event_version_server.actions == ['ScheduleGetEventVersions', 'ScheduleGetEventsById']
+    assert [e.id for e in changes.events] == [1, 2, 3, 4, 5]
+    assert changes.removed_ids == ()
+    assert changes.versions == dict((x, 100) for x in range(1, 6))
+
+
+def test__CybozuGaroonApi__get_changed_events__retrieves_only_changed_events(
+        event_version_server):
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=event_version_server.url))
+    versions = api.get_changed_events(CHANGES_START, CHANGES_END, {}).versions
+
+    event_version_server.remove_event(2)
+    event_version_server.set_event(create_versioned_event_info(3, 101))
+    event_version_server.set_event(create_versioned_event_info(6, 100))
+    del event_version_server.requests[:]
+
+    changes = api.get_changed_events(CHANGES_START, CHANGES_END, versions)
+
+    assert sorted(e.id for e in changes.events) == [3, 6]
+    assert changes.removed_ids == (2, )
+    assert changes.versions == {1: 100, 3: 101, 4: 100, 5: 100, 6: 100}
+    assert versions == dict((x, 100) for x in range(1, 6))
+
+    request = parse_xml(event_version_server.requests[-1].body)
+    assert sorted(int(n.text) for n in request.iter('event_id')) == [3, 6]
+
+
+def test__CybozuGaroonApi__get_changed_events__sends_single_request_if_nothing_changed(
+        event_version_server):
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=event_version_server.url))
+    versions = dict((x, 100) for x in range(1, 6))
+    changes = api.get_changed_events(CHANGES_START, CHANGES_END, versions)
+
+    assert event_version_server.actions == ['ScheduleGetEventVersions']
+    assert changes.events == ()
+    assert changes.versions == versions
+
+    request = parse_xml(event_version_server.requests[-1].body)
+    assert len(list(request.iter('event_item'))) == 5
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (add_events, modify_events and remove_events)
+###
+
+class StandInScheduleWriter(object):
+    """
+    Imitates `ScheduleAddEvents`, `ScheduleModifyEvents` and `ScheduleRemoveEvents` of Garoon.
+    Requests which contain an event titled "fail" are rejected with a SOAP error.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.next_id = 1000
+
+    def post(self, url, data, *args, **kwargs):
+        body = parse_xml(data).xpath(
+            '/soap:Envelope/soap:Body/*', namespaces=dict(soap=SOAP_NS))[0]
+        action = lxml.etree.QName(body).localname
+        nodes = list(body.iter('schedule_event'))
+        event_ids = [int(n.text) for n in body.iter('event_id')]
+        self.requests.append((action, nodes, event_ids))
+
+        if any(n.attrib['detail'] == 'fail' for n in nodes):
+            return create_response_mock(read('g4s.cbgrn', 'soap_error.xml'))
+
+        for node in nodes:
+            if action == 'ScheduleAddEvents':
+                node.attrib['id'] = str(self.next_id)
+                self.next_id += 1
+            node.attrib['version'] = '1388534400'
+            for user in node.iter('{{{0}}}user'.format(SCHEDULE_NS)):
+                user.attrib['name'] = 'user{0}'.format(user.attrib['id'])
+
+        returns = b''.join(lxml.etree.tostring(n) for n in nodes)
+        return create_response_mock(
+            b'<soap:Envelope xmlns:soap="' + SOAP_NS.encode('utf-8') + b'"><soap:Body>' +
+            b'<returns>' + returns + b'</returns></soap:Body></soap:Envelope>')
+
+    @property
+    def actions(self):
+        return [action for action, nodes, event_ids in self.requests]
+
+
+SOAP_NS = 'http://www.w3.org/2003/05/soap-envelope'
+SCHEDULE_NS = 'http://schemas.cybozu.co.jp/schedule/2008'
+
+
+@pytest.fixture
+def schedule_writer(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    writer = StandInScheduleWriter()
+    monkeypatch.setattr('requests.post', writer.post)
+    return writer
+
+
+def create_event_to_write(title, day, id=None, all_day=False, start_only=False, version=None):
+    start = DateTime.get(2014, 1, day, 0 if all_day else 9, tzinfo='Asia/Tokyo')
+    if all_day:
+        end = DateTime.get(2014, 1, day, tzinfo='Asia/Tokyo')
+    elif start_only:
+        end = None
+    else:
+        end = DateTime.get(2014, 1, day, 10, tzinfo='Asia/Tokyo')
+
+    return Event(
+        id, Event.NORMAL, title, None, start, end, all_day, (Participant(1, 'foo'), ), True,
+        None, version)
+
+
+def test__CybozuGaroonApi__add_events__raises_ArgumentTypeError_if_invalid_events_are_specified():
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with raises_argument_null_error('events'):
+        api.add_events(None)
+    with raises_argument_type_error('events[*]'):
+        api.add_events([object()])
+
+
+@pytest.mark.parametrize('name,value', [('batch_size', 0), ('max_workers', 0)])
+def test__CybozuGaroonApi__add_events__raises_ValueError_if_non_positive_option_is_specified(
+        name, value):
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with pytest.raises(ValueError):
+        api.add_events([create_event_to_write('foo', 1)], **{name: value})
+
+
+def test__CybozuGaroonApi__add_events__sends_events_in_batches(schedule_writer):
+    events = [create_event_to_write('event{0}'.format(x), x % 28 + 1) for x in range(250)]
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    added_events = api.add_events(events, batch_size=100)
+
+    assert schedule_writer.actions == ['ScheduleAddEvents'] * 3
+    assert sorted(len(nodes) for a, nodes, ids in schedule_writer.requests) == [50, 100, 100]
+    assert [e.title for e in added_events] == [e.title for e in events]
+    assert [e.start for e in added_events] == [e.start for e in events]
+    assert len(set(e.id for e in added_events)) == 250
+    assert [p.name for p in added_events[0].participants] == ['user1']
+
+
+def test__CybozuGaroonApi__add_events__renders_all_day_and_start_only_events(schedule_writer):
+    events = [
+        create_event_to_write('all-day', 2, all_day=True),
+        create_event_to_write('start-only', 3, start_only=True),
+    ]
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    added_events = api.add_events(events)
+
+    action, nodes, event_ids = schedule_writer.requests[0]
+    when_nodes = [n.find('{{{0}}}when'.format(SCHEDULE_NS))[0] for n in nodes]
+    assert dict(when_nodes[0].attrib) == {'start': '2014-01-02', 'end': '2014-01-02'}
+    assert dict(when_nodes[1].attrib) == {'start': '2014-01-03T00:00:00Z'}
+    assert [n.attrib['start_only'] for n in nodes] == ['false', 'true']
+
+    assert added_events[0].is_allday
+    assert added_events[1].end is None
+
+
+def test__CybozuGaroonApi__add_events__raises_BatchRequestError_with_succeeded_results(
+        schedule_writer):
+    events = [create_event_to_write('event{0}'.format(x), 1) for x in range(5)]
+    events[3] = create_event_to_write('fail', 1)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    with pytest.raises(BatchRequestError) as excinfo:
+        api.add_events(events, batch_size=2)
+
+    assert len(schedule_writer.requests) == 3
+    assert [e.title for e in excinfo.value.results] == ['event0', 'event1', 'event4']
+    assert [b for b, ex in excinfo.value.errors] == [(events[2], events[3])]
+    assert isinstance(excinfo.value.errors[0][1], RequestError)
+
+
+def test__CybozuGaroonApi__add_events__does_not_retry_requests(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    calls = patch_requests_post_to_fail_transiently(monkeypatch, 100)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    with pytest.raises(BatchRequestError) as excinfo:
+        api.add_events([create_event_to_write('foo', 1)])
+
+    assert len(calls) == 1
+    assert isinstance(excinfo.value.errors[0][1], NetworkError)
+
+
+def test__CybozuGaroonApi__add_events__invalidates_cached_events(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, response_cache_ttl=60))
+    start = DateTime.get(2014, 1, 1, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    api.get_events(start, end)
+
+    writer = StandInScheduleWriter()
+    monkeypatch.setattr('requests.post', writer.post)
+    api.add_events([create_event_to_write('foo', 1)])
+
+    requested_ranges = patch_requests_post_to_return_events_in_range(
+        monkeypatch, RESPONSE_CACHE_EVENTS)
+    api.get_events(start, end)
+
+    assert len(requested_ranges) == 1
+
+
+def test__CybozuGaroonApi__add_events__invalidates_only_cached_events_which_may_be_stale(
+        monkeypatch, tmpdir):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    params = dict(VALID_API_PARAMS, response_cache_ttl=60, response_cache_dir=str(tmpdir))
+    api = CybozuGaroonApi(params)
+    other_user_api = CybozuGaroonApi(dict(params, user='baz'))
+    other_url_api = CybozuGaroonApi(dict(params, url='http://example.org/grn.cgi'))
+
+    d = lambda month, day: DateTime.get(2014, month, day, tzinfo='UTC')
+    ranges = [(d(1, 1), d(1, 2)), (d(2, 1), d(2, 2))]
+    for a in (api, other_user_api, other_url_api):
+        for start, end in ranges:
+            a._store_cached_events(start, end, ())
+
+    writer = StandInScheduleWriter()
+    monkeypatch.setattr('requests.post', writer.post)
+    api.add_events([create_event_to_write('foo', 1)])
+
+    # events of the user, and events of the other users in the range of the event are stale
+    def cached():
+        apis = (api, other_user_api, other_url_api)
+        return [a._lookup_cached_events(*r) for a in apis for r in ranges]
+
+    assert cached() == [None, None, None, (), (), ()]
+
+    g4s.cbgrn.api._response_cache.clear()
+    assert cached() == [None, None, None, (), (), ()]
+
+
+def test__CybozuGaroonApi__modify_events__sends_new_values_and_maps_old_events_to_new_ones(
+        schedule_writer):
+    events = [
+        create_event_to_write('event{0}'.format(x), 1, id=x + 1, version=100) for x in range(3)]
+    new_start = DateTime.get(2014, 1, 5, 9, tzinfo='Asia/Tokyo')
+    new_end = DateTime.get(2014, 1, 5, 11, tzinfo='Asia/Tokyo')
+    differences = {
+        events[0]: {'title': ('event0', 'renamed')},
+        events[1]: {'start': (events[1].start, new_start), 'end': (events[1].end, new_end)},
+        events[2]: {},
+    }
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    modified_events = api.modify_events(differences, batch_size=2)
+
+    assert schedule_writer.actions == ['ScheduleModifyEvents'] * 2
+    assert sorted(n.attrib['id'] for a, nodes, ids in schedule_writer.requests for n in nodes) == [
+        '1', '2', '3']
+    assert set(modified_events) == set(events)
+    assert modified_events[events[0]].title == 'renamed'
+    assert modified_events[events[0]].id == 1
+    assert modified_events[events[1]].start == new_start
+    assert modified_events[events[1]].end == new_end
+
+
+def test__CybozuGaroonApi__modify_events__sends_versions_of_old_events(
+        schedule_writer, monkeypatch):
+
+    sent_versions = []
+
+    def my_request_post(url, data, *args, **kwargs):
+        sent_versions.extend(n.attrib['version'] for n in parse_xml(data).iter('schedule_event'))
+        return schedule_writer.post(url, data, *args, **kwargs)
+
+    monkeypatch.setattr('requests.post', my_request_post)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    added_event, = api.add_events([create_event_to_write('foo', 1)])
+    modified_events = api.modify_events({added_event: {'title': ('foo', 'bar')}})
+
+    assert sent_versions == ['dummy', '1388534400']
+    assert added_event.version == 1388534400
+    assert modified_events[added_event].version == 1388534400
+
+
+def test__CybozuGaroonApi__modify_events__raises_ValueError_if_event_without_id_is_specified():
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with pytest.raises(ValueError):
+        api.modify_events({create_event_to_write('foo', 1): {}})
+
+
+def test__CybozuGaroonApi__modify_events__raises_ValueError_if_event_without_version_is_specified(
+        schedule_writer):
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with pytest.raises(ValueError):
+        api.modify_events({create_event_to_write('foo', 1, id=1): {}})
+
+    assert schedule_writer.requests == []
+
+
+def test__CybozuGaroonApi__modify_events__raises_ValueError_if_unknown_field_is_specified(
+        schedule_writer):
+    event = create_event_to_write('foo', 1, id=1, version=100)
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with pytest.raises(ValueError):
+        api.modify_events({event: {'location': (None, 'room')}})
+
+    assert schedule_writer.requests == []
+
+
+def test__CybozuGaroonApi__remove_events__sends_event_ids_in_batches(schedule_writer):
+    events = [create_event_to_write('event{0}'.format(x), 1, id=x + 1) for x in range(5)]
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    removed_events = api.remove_events(events, batch_size=2, max_workers=1)
+
+    assert schedule_writer.actions == ['ScheduleRemoveEvents'] * 3
+    assert [ids for a, nodes, ids in schedule_writer.requests] == [[1, 2], [3, 4], [5]]
+    assert removed_events == tuple(events)
+
+
+def test__CybozuGaroonApi__is_event_modification_supported__returns_True():
+    assert CybozuGaroonApi(VALID_API_PARAMS).is_event_modification_supported
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (compression)
+###
+
+def create_many_events(count):
+    return [
+        create_event_info(
+            x, datetime.datetime(2014, 1, 1, 9) + datetime.timedelta(hours=x),
+            datetime.datetime(2014, 1, 1, 10) + datetime.timedelta(hours=x))
+        for x in range(1, count + 1)]
+
+
+@pytest.fixture
+def clear_uncompressed_endpoints(monkeypatch):
+    # `ScheduleGetEvents` requests are small, they are compressed only in tests
+    monkeypatch.setattr('g4s.cbgrn.api._MIN_COMPRESSED_REQUEST_SIZE', 0)
+    g4s.cbgrn.api._uncompressed_endpoints.clear()
+    yield
+    g4s.cbgrn.api._uncompressed_endpoints.clear()
+
+
+COMPRESSION_START = DateTime.get(2014, 1, 1, tzinfo='UTC')
+COMPRESSION_END = DateTime.get(2014, 2, 1, tzinfo='UTC')
+
+
+def test__CybozuGaroonApi__get_events__receives_compressed_response(clear_uncompressed_endpoints):
+    with GaroonServer(create_many_events(200)) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        events = api.get_events(COMPRESSION_START, COMPRESSION_END)
+
+    request = server.requests[-1]
+    assert len(events) == 200
+    assert (request.content_encoding, request.accept_encoding) == (None, 'gzip, deflate')
+    assert server.bytes_sent * 10 < server.bytes_rendered
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate'])
+def test__CybozuGaroonApi__get_events__sends_compressed_request(
+        clear_uncompressed_endpoints, encoding):
+    with GaroonServer(create_many_events(1)) as server:
+        params = dict(VALID_API_PARAMS, url=server.url, request_compression=encoding)
+        events = CybozuGaroonApi(params).get_events(COMPRESSION_START, COMPRESSION_END)
+
+    request = server.requests[-1]
+    assert len(events) == 1
+    assert (request.content_encoding, request.accept_encoding) == (encoding, 'gzip, deflate')
+    assert server.actions == ['ScheduleGetEvents']
+
+
+def test__CybozuGaroonApi__get_events__sends_uncompressed_request_if_server_rejects_compressed_one(
+        clear_uncompressed_endpoints):
+    with GaroonServer(create_many_events(1), accepts_compressed_requests=False) as server:
+        params = dict(VALID_API_PARAMS, url=server.url, request_compression='gzip')
+        api = CybozuGaroonApi(params)
+        api.get_events(COMPRESSION_START, COMPRESSION_END)
+        api.get_events(COMPRESSION_START, COMPRESSION_END)
+
+    assert [r.content_encoding for r in server.requests if r.method == 'POST'] == [
+        'gzip', None, None]
+
+
+def test__CybozuGaroonApi__init__raises_ValueError_if_unknown_request_compression_is_specified():
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, request_compression='br'))
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (stand-in server)
+###
+
+SERVER_START = DateTime.get(2014, 1, 1, tzinfo='UTC')
+SERVER_END = DateTime.get(2014, 1, 3, tzinfo='UTC')
+
+
+def test__CybozuGaroonApi__get_events__retrieves_events_in_range_from_server():
+    events = [
+        create_event_info(1, datetime.datetime(2014, 1, 1, 9), datetime.datetime(2014, 1, 1, 10)),
+        create_event_info(2, datetime.datetime(2014, 1, 2, 9), datetime.datetime(2014, 1, 2, 10)),
+        create_event_info(3, datetime.datetime(2014, 1, 5, 9), datetime.datetime(2014, 1, 5, 10))]
+
+    with GaroonServer(events) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        retrieved = api.get_events(SERVER_START, SERVER_END)
+
+    assert [e.id for e in retrieved] == [1, 2]
+    assert [(r.method, r.action) for r in server.requests] == [
+        ('GET', None), ('POST', 'ScheduleGetEvents')]
+
+
+def test__CybozuGaroonApi__get_events__retries_failures_injected_by_server():
+    with GaroonServer(create_many_events(3), failures=2, latency=0.01) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        retrieved = api.get_events(SERVER_START, SERVER_END)
+
+    assert len(retrieved) == 3
+    assert server.actions == ['ScheduleGetEvents'] * 3
+    assert api.retry_policy.retries == 2
+
+
+def test__CybozuGaroonApi__add_modify_and_remove_events__are_applied_to_server():
+    with GaroonServer(create_many_events(1)) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        added = api.add_events([create_event_to_write('new', 2)])
+        modified = api.modify_events({added[0]: {'title': ('new', 'renamed')}})
+        retrieved = api.get_events(SERVER_START, SERVER_END)
+        api.remove_events([retrieved[0]])
+
+        assert [e['id'] for e in server.events] == [added[0].id]
+
+    assert modified[added[0]].title == 'renamed'
+    assert [(e.id, e.title) for e in retrieved] == [(1, 'event1'), (added[0].id, 'renamed')]
+    assert server.actions == [
+        'ScheduleAddEvents', 'ScheduleModifyEvents', 'ScheduleGetEvents', 'ScheduleRemoveEvents']
+
+
+def test__CybozuGaroonApi__get_events__reads_padded_response_in_chunks():
+    with GaroonServer(create_many_events(1), padding=100000, chunk_size=1000,
+                      content_encoding=None) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        retrieved = api.get_events(SERVER_START, SERVER_END)
+
+    assert len(retrieved) == 1
+    assert server.bytes_sent > 100000
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (timing hooks)
+###
+
+def test__CybozuGaroonApi__add_timing_hook__raises_ArgumentNullError_if_None_is_specified():
+    with raises_argument_null_error('hook'):
+        CybozuGaroonApi(VALID_API_PARAMS).add_timing_hook(None)
+
+
+def test__CybozuGaroonApi__add_timing_hook__raises_ArgumentTypeError_if_invalid_hook_is_specified():
+    with raises_argument_type_error('hook'):
+        CybozuGaroonApi(VALID_API_PARAMS).add_timing_hook(1)
+
+
+def test__CybozuGaroonApi__get_events__reports_timings_of_each_phase():
+    reported = []
+
+    with GaroonServer(create_many_events(20), latency=0.02) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        api.add_timing_hook(reported.append)
+        events = api.get_events(SERVER_START, SERVER_END)
+
+    timings, = reported
+    assert (timings.service, timings.action) == ('ScheduleService', 'ScheduleGetEvents')
+    assert timings.error is None
+    assert timings.elements == len(events) == 20
+    assert timings.request_bytes == server.bytes_received
+    assert timings.response_bytes > server.bytes_sent
+    assert timings['send'] >= 0.02
+    assert all(timings[phase] > 0 for phase in timings.PHASES)
+    assert sum(timings.phases.values()) == pytest.approx(timings.total)
+
+
+def patch_requests_to_return_single_event(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, [
+        create_event_info(1, datetime.datetime(2014, 1, 1, 9), datetime.datetime(2014, 1, 1, 10))])
+
+
+def test__CybozuGaroonApi__execute_soap_request__reports_timings(monkeypatch):
+    patch_requests_to_return_single_event(monkeypatch)
+    reported = []
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    api.add_timing_hook(reported.append)
+
+    params = dict(
+        start=DateTime.get(2014, 1, 1, tzinfo='UTC'), end=DateTime.get(2014, 1, 2, tzinfo='UTC'))
+    api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+    timings, = reported
+    assert timings.action == 'ScheduleGetEvents'
+    assert timings.request_bytes > 0
+    assert timings.response_bytes > 0
+    assert timings['render'] > 0
+    assert timings['parse'] > 0
+    assert timings['convert'] == 0
+
+
+def test__CybozuGaroonApi__get_events__reports_timings_of_failed_request():
+    reported = []
+
+    with GaroonServer(failures=10) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url, retry_max_attempts=2))
+        api.add_timing_hook(reported.append)
+        with pytest.raises(NetworkError):
+            api.get_events(SERVER_START, SERVER_END)
+
+    timings, = reported
+    assert isinstance(timings.error, NetworkError)
+    assert timings.elements == 0
+    assert server.actions == ['ScheduleGetEvents'] * 2
+
+
+def failing_timing_hook(timings):
+    raise RuntimeError('broken hook')
+
+
+def test__CybozuGaroonApi__execute_soap_request__ignores_errors_of_timing_hooks(
+        monkeypatch, caplog):
+
+    patch_requests_to_return_single_event(monkeypatch)
+    reported = []
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    api.add_timing_hook(failing_timing_hook)
+    api.add_timing_hook(reported.append)
+
+    params = dict(
+        start=DateTime.get(2014, 1, 1, tzinfo='UTC'), end=DateTime.get(2014, 1, 2, tzinfo='UTC'))
+    with caplog.at_level(logging.WARNING, logger='g4s.cbgrn.api'):
+        response = api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+    assert len(response.xpath('//schedule_event')) == 1
+    assert len(reported) == 1
+    assert caplog.records[0].exc_info[0] is RuntimeError
+
+
+def test__CybozuGaroonApi__get_events__raises_error_of_request_rather_than_error_of_timing_hook():
+    with GaroonServer(failures=10) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url, retry_max_attempts=1))
+        api.add_timing_hook(failing_timing_hook)
+
+        with pytest.raises(NetworkError):
+            api.get_events(SERVER_START, SERVER_END)
+
+
+def test__CybozuGaroonApi__remove_timing_hook__stops_reporting(monkeypatch):
+    patch_requests_to_return_single_event(monkeypatch)
+    reported = []
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    api.add_timing_hook(reported.append)
+    api.remove_timing_hook(reported.append)
+
+    params = dict(
+        start=DateTime.get(2014, 1, 1, tzinfo='UTC'), end=DateTime.get(2014, 1, 2, tzinfo='UTC'))
+    api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+    assert reported == []
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (synthetic dataset)
+###
+
+def summarize_events(events):
+    return [
+        (e.id, e.type, e.title, e.start, e.end, e.is_allday, [p.id for p in e.participants],
+         e.is_public, e.last_update)
+        for e in events]
+
+
+def test__CalendarDataset__render_response__is_deterministic():
+    assert CalendarDataset(50, seed=1).render_response() == \
+        CalendarDataset(50, seed=1).render_response()
+    assert CalendarDataset(50, seed=1).render_response() != \
+        CalendarDataset(50, seed=2).render_response()
+
+
+def test__CalendarDataset__covers_all_kinds_of_events():
+    infos = list(CalendarDataset(1000, seed=1, large_member_ratio=0.05).iter_event_infos())
+
+    assert {(i['event_type'], i['allday'], i['start_only']) for i in infos} == {
+        ('normal', False, False), ('normal', True, False), ('normal', False, True),
+        ('banner', True, False), ('repeat', False, False)}
+    assert any(i['repeat_info'].get('exclusive_datetimes') for i in infos if 'repeat_info' in i)
+    assert max(len(i['members']) for i in infos) == 300
+
+
+def test__CybozuGaroonApi__create_event_parser__returns_events_of_dataset():
+    dataset = CalendarDataset(500, seed=3, large_member_ratio=0.02)
+    response = parse_xml(dataset.render_response())
+
+    parsed = CybozuGaroonApi._create_event_parser(
+        response.iter('schedule_event'), dataset.start, dataset.end)
+    expected = dataset.iter_events(dataset.start, dataset.end)
+
+    assert summarize_events(parsed) == summarize_events(expected)
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (metrics)
+###
+
+def test__CybozuGaroonApi__create_event_parser__counts_and_logs_parse_failures(caplog):
+    failures = g4s.cbgrn.api._event_parse_failures.get()
+    response = parse_xml(CalendarDataset(3, seed=1, weights=dict(repeat=0)).render_response())
+    nodes = list(response.iter('schedule_event'))
+    del nodes[1].attrib['public_type']
+
+    with caplog.at_level(logging.WARNING, logger='g4s.cbgrn.api'):
+        events = list(CybozuGaroonApi._create_event_parser(nodes))
+
+    assert [e.id for e in events] == [1, 3]
+    assert g4s.cbgrn.api._event_parse_failures.get() == failures + 1
+    assert len(caplog.records) == 1
+    assert 'id=2' in caplog.records[0].getMessage()
+    assert caplog.records[0].exc_info[0] is KeyError
+
+
+def test__CybozuGaroonApi__get_events__records_metrics_of_requests_and_caches():
+    registry = get_registry()
+    before = registry.render()
+    fetched = g4s.cbgrn.api._events_fetched.get()
+    latency = g4s.cbgrn.api._soap_request_duration
+    requests_count = latency.get_count(action='ScheduleGetEvents')
+    lookups = g4s.cbgrn.api._cache_lookups
+    hits = lookups.get(cache='events', result='hit')
+    misses = lookups.get(cache='events', result='miss')
+
+    with GaroonServer(create_many_events(3)) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url, response_cache_ttl=60))
+        api.get_events(SERVER_START, SERVER_END)
+        api.get_events(SERVER_START, SERVER_END)
+
+    assert g4s.cbgrn.api._events_fetched.get() == fetched + 3
+    assert latency.get_count(action='ScheduleGetEvents') == requests_count + 1
+    assert lookups.get(cache='events', result='miss') == misses + 1
+    assert lookups.get(cache='events', result='hit') == hits + 1
+    assert registry.render() != before
+    assert 'g4s_soap_request_duration_seconds_bucket{action="ScheduleGetEvents",le="+Inf"}' in \
+        registry.render()
+
+
+def test__CybozuGaroonApi__get_events__counts_failed_soap_requests(
+        valid_wsdl_001, network_post_error):
+    errors = g4s.cbgrn.api._soap_request_errors
+    count = errors.get(action='ScheduleGetEvents')
+    retries = g4s.core.retry._retries.get()
+
+    with pytest.raises(NetworkError):
+        CybozuGaroonApi(VALID_API_PARAMS).get_events(SERVER_START, SERVER_END)
+
+    assert errors.get(action='ScheduleGetEvents') == count + 1
+    assert g4s.core.retry._retries.get() == retries + 2
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (tracing)
+###
+
+@pytest.fixture
+def span_exporter():
+    exporter = MemorySpanExporter()
+    get_tracer().add_exporter(exporter)
+    yield exporter
+    get_tracer().remove_exporter(exporter)
+
+
+def test__CybozuGaroonApi__get_events__traces_requests_and_parsing_of_chunks(span_exporter):
+    events = [create_event_info_on_day(1, 1), create_event_info_on_day(2, 2)]
+    with GaroonServer(events) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        api.get_events(SERVER_START, SERVER_END, chunk_size=datetime.timedelta(days=1))
+
+    root, = [s for s in span_exporter.spans if s.name == 'g4s.get_events']
+    requests = [s for s in span_exporter.spans if s.name == 'g4s.execute_soap_request']
+    parsers = [s for s in span_exporter.spans if s.name == 'g4s.parse_events']
+
+    assert root.attributes['g4s.event_count'] == 2
+    assert len(requests) == 2 and len(parsers) == 2
+    assert all(s.parent_span_id == root.span_id for s in requests + parsers)
+    assert all(s.trace_id == root.trace_id for s in requests + parsers)
+    assert sorted(s.attributes['g4s.event_count'] for s in parsers) == [1, 1]
+
+    request = requests[0]
+    assert request.attributes['g4s.action'] == 'ScheduleGetEvents'
+    assert request.attributes['g4s.request_bytes'] > 0
+    assert request.attributes['g4s.response_bytes'] > 0
+    assert request.attributes['g4s.element_count'] == 1
+    assert request.status == 'OK'
+
+
+def test__CybozuGaroonApi__execute_streaming_soap_request__starts_span_when_iterated(
+        span_exporter, monkeypatch):
+
+    started = []
+
+    def my_start_soap_request_span(service, action):
+        started.append(get_tracer().start_span('g4s.execute_soap_request'))
+        return started[-1]
+
+    monkeypatch.setattr('g4s.cbgrn.api._start_soap_request_span', my_start_soap_request_span)
+
+    with GaroonServer(create_many_events(3)) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        params = dict(start=SERVER_START, end=SERVER_END)
+
+        # a generator which is never iterated sends no request and starts no span
+        nodes = api.execute_streaming_soap_request(
+            'ScheduleService', 'ScheduleGetEvents', params, 'schedule_event')
+        del nodes
+        assert started == []
+
+        nodes = api.execute_streaming_soap_request(
+            'ScheduleService', 'ScheduleGetEvents', params, 'schedule_event')
+        next(nodes)
+        assert len(started) == 1 and started[0].end_time is None
+
+        # the span is ended if the generator is closed early
+        nodes.close()
+
+    span, = span_exporter.spans
+    assert span is started[0]
+    assert span.attributes['g4s.element_count'] == 1
+    assert server.actions == ['ScheduleGetEvents']
+
+
+def test__CybozuGaroonApi__get_events__records_cache_hit_in_span(span_exporter):
+    with GaroonServer(create_many_events(1)) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url, response_cache_ttl=60))
+        api.get_events(SERVER_START, SERVER_END)
+        api.get_events(SERVER_START, SERVER_END)
+
+    first, second = [s for s in span_exporter.spans if s.name == 'g4s.get_events']
+    assert first.events == []
+    assert [e['name'] for e in second.events] == ['g4s.cache_hit']
+    assert second.attributes['g4s.event_count'] == 1
+
+
+def test__CybozuGaroonApi__add_events__traces_failed_batches(span_exporter):
+    with GaroonServer(failures=1) as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url))
+        with pytest.raises(BatchRequestError):
+            api.add_events([create_event_to_write('new', 2)])
+
+    span, = [s for s in span_exporter.spans if s.name == 'g4s.add_events']
+    request, = [s for s in span_exporter.spans if s.name == 'g4s.execute_soap_request']
+    assert span.status == 'ERROR'
+    assert span.attributes['g4s.event_count'] == 1
+    assert request.parent_span_id == span.span_id
+    assert request.status == 'ERROR'
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (retry and circuit breaker)
+###
+
+def patch_requests_post_to_fail_transiently(monkeypatch, failures):
+    calls = []
+    original = requests.post
+
+    def my_request_post(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise requests.exceptions.ConnectionError
+
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr('requests.post', my_request_post)
+    return calls
+
+
+def test__CybozuGaroonApi__retries_read_request_which_failed_with_network_error(monkeypatch):
+    fix_current_datetime(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
+    calls = patch_requests_post_to_fail_transiently(monkeypatch, 2)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    start = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 7, tzinfo='UTC')
+    events = api.get_events(start, end)
+
+    assert len(events) == 1
+    assert len(calls) == 3
+    assert api.retry_policy.retries == 2
+    assert api.retry_policy.failures == 0
+
+
+def test__CybozuGaroonApi__raises_NetworkError_after_all_attempts_failed(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    calls = patch_requests_post_to_fail_transiently(monkeypatch, 100)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, retry_max_attempts=4))
+    with pytest.raises(NetworkError):
+        api.get_events(DateTime.get_utc_now(), DateTime.get_utc_now())
+
+    assert len(calls) == 4
+    assert api.retry_policy.retries == 3
+    assert api.retry_policy.failures == 1
+
+
+def test__CybozuGaroonApi__retries_read_request_which_timed_out(monkeypatch):
+    fix_current_datetime(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
+    original = requests.post
+    timeouts = []
+
+    def my_request_post(*args, **kwargs):
+        timeouts.append(kwargs.get('timeout'))
+        if len(timeouts) == 1:
+            raise requests.exceptions.ReadTimeout
+
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr('requests.post', my_request_post)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, request_timeout=2.5))
+    start = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 7, tzinfo='UTC')
+    events = api.get_events(start, end)
+
+    assert len(events) == 1
+    assert timeouts == [2.5, 2.5]
+    assert api.retry_policy.retries == 1
+
+
+@pytest.mark.parametrize('value', [0, -1])
+def test__CybozuGaroonApi__init__raises_ValueError_if_non_positive_request_timeout_is_specified(
+        value):
+
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, request_timeout=value))
+
+
+def test__CybozuGaroonApi__circuit_breaker_rejects_requests_to_unhealthy_server(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    calls = patch_requests_post_to_fail_transiently(monkeypatch, 100)
+
+    params = dict(VALID_API_PARAMS, retry_max_attempts=1, circuit_failure_threshold=2)
+    api1 = CybozuGaroonApi(params)
+    api2 = CybozuGaroonApi(params)
+    now = DateTime.get_utc_now()
+    api1._get_cached_soap_endpoints()
+
+    # the server goes down, and WSDL is requested again since the endpoints are invalidated
+    def my_request_get(*args, **kwargs):
+        raise requests.exceptions.ConnectionError
+
+    monkeypatch.setattr('requests.get', my_request_get)
+    for api in (api1, api2, api1):
+        with pytest.raises(NetworkError):
+            api.get_events(now, now)
+
+    # the third request is rejected without network access
+    assert len(calls) == 1
+    assert api1.circuit_breaker is api2.circuit_breaker
+    assert api1.circuit_breaker.state == CircuitBreaker.OPEN
+    assert api1.circuit_breaker.rejections == 1
+
+    with pytest.raises(CircuitOpenError):
+        api2.get_events(now, now)
+
+
+def test__CybozuGaroonApi__raises_RequestError_for_soap_fault_with_server_error_status(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_soap_error(monkeypatch, 500)
+    calls = patch_requests_post_to_fail_transiently(monkeypatch, 0)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    now = DateTime.get_utc_now()
+    with pytest.raises(RequestError) as ex:
+        api.get_events(now, now)
+
+    # the reason of the fault is kept, and the request is not retried
+    assert 'Cannot log in.' in str(ex.value)
+    assert len(calls) == 1
+    assert api.retry_policy.retries == 0
+    assert api.circuit_breaker.failures == 0
+
+
+def test__CybozuGaroonApi__client_errors_do_not_open_circuit_shared_with_other_users(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_events_in_range(monkeypatch, [])
+    original = requests.post
+
+    def my_request_post(url, data, *args, **kwargs):
+        if b'wrong-password' in data:
+            return create_response_mock(b'Unauthorized', 401)
+
+        return original(url, data, *args, **kwargs)
+
+    monkeypatch.setattr('requests.post', my_request_post)
+
+    params = dict(VALID_API_PARAMS, circuit_failure_threshold=2)
+    invalid_api = CybozuGaroonApi(dict(params, password='wrong-password'))
+    valid_api = CybozuGaroonApi(params)
+    now = DateTime.get_utc_now()
+
+    for x in range(3):
+        with pytest.raises(RequestError):
+            invalid_api.get_events(now, now)
+
+    assert valid_api.get_events(now, now) == ()
+    assert valid_api.circuit_breaker.state == CircuitBreaker.CLOSED
+    assert valid_api.circuit_breaker.failures == 0
+
+
+def test__CybozuGaroonApi__retries_read_request_which_failed_with_server_error_status(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_to_cause_network_error(monkeypatch, 'post')
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, retry_max_attempts=2))
+    now = DateTime.get_utc_now()
+
+    with pytest.raises(NetworkError) as ex:
+        api.get_events(now, now)
+
+    assert 'HTTP status: 503' in str(ex.value)
+    assert api.retry_policy.retries == 1
+    assert api.circuit_breaker.failures == 2
+
+
+def test__CybozuGaroonApi__circuit_breaker_is_configured_by_instance_which_specifies_options():
+    api1 = CybozuGaroonApi(VALID_API_PARAMS)
+    api2 = CybozuGaroonApi(dict(VALID_API_PARAMS, circuit_failure_threshold=2))
+    api3 = CybozuGaroonApi(dict(VALID_API_PARAMS, user='baz'))
+
+    assert api1.circuit_breaker is api2.circuit_breaker is api3.circuit_breaker
+    assert api1.circuit_breaker.failure_threshold == 2
+    assert api1.circuit_breaker.reset_timeout == 30.0
+
+
+@pytest.mark.parametrize('options', [
+    dict(circuit_failure_threshold=3), dict(circuit_reset_timeout=10),
+    dict(circuit_failure_threshold=5, circuit_reset_timeout=30.0)])
+def test__CybozuGaroonApi__init__raises_ValueError_if_circuit_breaker_is_configured_differently(
+        options):
+
+    CybozuGaroonApi(dict(VALID_API_PARAMS, circuit_failure_threshold=2))
+
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, **options))
+
+
+def test__CybozuGaroonApi__circuit_breaker_can_be_disabled(monkeypatch):
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, circuit_failure_threshold=None))
+    assert api.circuit_breaker is None
+
+
+@pytest.mark.parametrize('key,value', [
+    ('retry_max_attempts', 1.5), ('retry_base_delay', '1'), ('retry_max_delay', True),
+    ('circuit_failure_threshold', '5'), ('circuit_reset_timeout', object())])
+def test__CybozuGaroonApi__init__raises_ArgumentTypeError_if_invalid_retry_option_is_specified(
+        key, value):
+
+    with raises_argument_type_error('params[{0}]'.format(key)):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, **{key: value}))
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (throttle)
+###
+
+def test__CybozuGaroonApi__throttle_does_not_limit_requests_by_default():
+    throttle = CybozuGaroonApi(VALID_API_PARAMS).throttle
+    assert throttle.max_concurrency is None
+    assert throttle.rate is None
+
+
+def test__CybozuGaroonApi__throttle_is_shared_by_instances_for_same_url():
+    params = dict(VALID_API_PARAMS, max_concurrent_requests=2, max_requests_per_second=5)
+    api1 = CybozuGaroonApi(params)
+    api2 = CybozuGaroonApi(dict(params, user='baz'))
+    api3 = CybozuGaroonApi(dict(params, url='http://example.org/grn.cgi'))
+
+    assert api1.throttle is api2.throttle
+    assert api1.throttle is not api3.throttle
+
+
+def test__CybozuGaroonApi__throttle_limits_instances_which_do_not_specify_limits():
+    api1 = CybozuGaroonApi(VALID_API_PARAMS)
+    api2 = CybozuGaroonApi(dict(VALID_API_PARAMS, max_concurrent_requests=2))
+    api3 = CybozuGaroonApi(dict(VALID_API_PARAMS, user='baz'))
+
+    assert api1.throttle is api2.throttle is api3.throttle
+    assert api1.throttle.max_concurrency == 2
+    assert api1.throttle.rate is None
+
+
+@pytest.mark.parametrize('limits', [
+    dict(max_concurrent_requests=3), dict(max_requests_per_second=5),
+    dict(max_concurrent_requests=2, max_requests_per_second=5)])
+def test__CybozuGaroonApi__init__raises_ValueError_if_throttle_is_configured_differently(limits):
+    CybozuGaroonApi(dict(VALID_API_PARAMS, max_concurrent_requests=2))
+
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, **limits))
+
+
+@pytest.mark.parametrize('key,value', [
+    ('max_concurrent_requests', 0), ('max_requests_per_second', -1)])
+def test__CybozuGaroonApi__init__raises_ValueError_if_non_positive_throttle_option_is_specified(
+        key, value):
+
+    with pytest.raises(ValueError):
+        CybozuGaroonApi(dict(VALID_API_PARAMS, **{key: value}))
+
+
+def test__CybozuGaroonApi__throttle_slot_is_released_after_streamed_response_is_read(
+        monkeypatch):
+
+    fix_current_datetime(monkeypatch)
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_correct_soap_response(monkeypatch)
+
+    # a leaked slot blocks the second request forever
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, max_concurrent_requests=1))
+    start = DateTime.get(2014, 1, 2, tzinfo='UTC')
+    end = DateTime.get(2014, 1, 7, tzinfo='UTC')
+
+    for _ in range(2):
+        assert len(api.get_events(start, end)) == 1
+
+    assert api.throttle.active == 0
+    assert api.throttle.acquisitions == 3
+
+
+def test__CybozuGaroonApi__throttle_slot_is_released_after_each_failed_attempt(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    calls = patch_requests_post_to_fail_transiently(monkeypatch, 100)
+
+    api = CybozuGaroonApi(dict(VALID_API_PARAMS, max_concurrent_requests=1))
+    with pytest.raises(NetworkError):
+        api.get_events(DateTime.get_utc_now(), DateTime.get_utc_now())
+
+    assert len(calls) == 3
+    assert api.throttle.active == 0
+    assert api.throttle.acquisitions == 4
+
+
+def test__CybozuGaroonApi__throttle_limits_requests_of_parallel_retrieval(monkeypatch):
+    targets = [('user', i) for i in range(8)]
+
+    lock = threading.Lock()
+    active = []
+    peak = []
+    original = requests.post
+
+    def my_request_post(*args, **kwargs):
+        with lock:
+            active.append(None)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.pop()
+
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr('requests.post', my_request_post)
+
+    with GaroonServer() as server:
+        api = CybozuGaroonApi(dict(VALID_API_PARAMS, url=server.url, max_concurrent_requests=2))
+        api.get_events_by_targets(TARGETS_START, TARGETS_END, targets, max_workers=8)
+
+    assert max(peak) == 2
+    assert api.throttle.active == 0
+    assert api.throttle.waits > 0
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi.execute_soap_request
+###
+
+@pytest.mark.parametrize('name', ['service', 'action', 'action_params'])
+def test__CybouzGaroonApi__execute_soap_request__raises_ArgumentNullError_if_None_is_specified(name):
+    kwargs = dict(service='foo', action='bar', action_params=dict())
+    kwargs[name] = None
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    with raises_argument_null_error(name):
+        api.execute_soap_request(**kwargs)
+
+
+@pytest.mark.parametrize('name', ['service', 'action', 'action_params'])
+def test__CybouzGaroonApi__execute_soap_request__raises_ArgumentTypeError_if_invalid_value_is_specified(name):
+
+    for value in (1, 1.234, object()):
+        kwargs = dict(service='foo', action='bar', action_params=dict())
+        kwargs[name] = value
+
+        api = CybozuGaroonApi(VALID_API_PARAMS)
+        with raises_argument_type_error(name):
+            api.execute_soap_request(**kwargs)
+
+
+def test__CybouzGaroonApi__execute_soap_request__returns_valid_response(valid_response):
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    # get_events-001
+    params = dict(start=DateTime.get(2014, 1, 1, tzinfo='UTC'), end=DateTime.get(2014, 1, 2, tzinfo='UTC'))
+    response = api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+    expected_response = [r[6] for r in SOAP_REQUEST_RESPONSE_PAIRS if r[0] == 'get_events-001'][0]
+    assert xml_compare(response, expected_response)
+
+
+def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_invalid_service_is_specified(
+        valid_incompleted_wsdl_001, valid_soap_response):
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+
+def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_invalid_service_or_action_name_is_specified(
+        valid_response):
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('FooService', 'ScheduleGetEvents', params)
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('ScheduleService', 'BarAction', params)
+
+
+
+@pytest.mark.parametrize('name', ['start', 'end'])
+def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_required_value_is_missing(
+        valid_response, name):
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    params.pop(name)
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+
+def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_required_value_is_missing(
+        valid_wsdl_001, network_post_error):
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+
+def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_failed_to_parse_soap_response(
+        valid_wsdl_001, invalid_soap_response):
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+
+def test__CybouzGaroonApi__execute_soap_request__raises_Exception_if_soap_error_is_happened(
+        valid_wsdl_001, soap_error):
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+
+    with pytest.raises(Exception):  # TODO
+        api.execute_soap_request('ScheduleService', 'ScheduleGetEvents', params)
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi.execute_streaming_soap_request
+###
+
+def test__CybozuGaroonApi__execute_streaming_soap_request__raises_ArgumentNullError_if_None_is_specified():
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with raises_argument_null_error('tag'):
+        api.execute_streaming_soap_request('ScheduleService', 'ScheduleGetEvents', {}, None)
+
+
+def test__CybozuGaroonApi__execute_streaming_soap_request__raises_ArgumentTypeError_if_invalid_value_is_specified():
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+
+    with raises_argument_type_error('tag'):
+        api.execute_streaming_soap_request('ScheduleService', 'ScheduleGetEvents', {}, 1)
+
+
+def test__CybozuGaroonApi__execute_streaming_soap_request__yields_and_releases_elements(monkeypatch):
+    events = [dict(id=x, detail='event{0}'.format(x)) for x in range(5)]
+    data = render_get_events_response(events)
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    monkeypatch.setattr('requests.post', lambda *args, **kwargs: create_response_mock(data))
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    params = dict(start=DateTime.get_utc_now(), end=DateTime.get_utc_now())
+    nodes = api.execute_streaming_soap_request(
+        'ScheduleService', 'ScheduleGetEvents', params, 'schedule_event')
+
+    ids = []
+    for node in nodes:
+        ids.append(node.attrib['id'])
+        # the preceding (already processed) elements must be released
+        assert not [n for n in node.itersiblings(preceding=True) if n.tag == 'schedule_event']
+
+    assert ids == [str(x) for x in range(5)]
+
+
+def test__CybozuGaroonApi__get_events__raises_RequestError_if_soap_error_is_happened(monkeypatch):
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_return_soap_error(monkeypatch)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    with pytest.raises(RequestError):
+        api.get_events(DateTime.get_utc_now(), DateTime.get_utc_now())
+
+
+def test__CybozuGaroonApi__get_events__raises_ResponseParseError_if_failed_to_parse_soap_response(
+        monkeypatch):
+
+    patch_requests_get_to_return_specified_wsdl(monkeypatch, 'g4s.cbgrn/valid_wsdl_001.xml')
+    patch_requests_post_to_invalid_xml_text(monkeypatch)
+
+    api = CybozuGaroonApi(VALID_API_PARAMS)
+    with pytest.raises(ResponseParseError):
+        api.get_events(DateTime.get_utc_now(), DateTime.get_utc_now())
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import os
+import jinja2
+import lxml.etree
+import pytest
+import g4s.cbgrn.template
+from g4s.cbgrn.template import SoapRequestTemplateRegistry
+from g4s.cbgrn.template import configure_bytecode_cache
+from g4s.cbgrn.template import format_utc_datetime
+from g4s.cbgrn.template import render_soap_envelope
+from g4s.cbgrn.template import render_soap_request
+from g4s.core.date import DateTime
+from .util import raises_argument_null_error
+from .util import raises_argument_type_error
+
+
+###
+### constant values
+###
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(g4s.cbgrn.template.__file__), 'templates')
+
+HEADER_PARAMS = dict(
+    created=DateTime.get(2014, 1, 1, 9, 0, 0, 'Asia/Tokyo'),
+    expires=DateTime.get(2014, 1, 2, 9, 0, 0, 'Asia/Tokyo'),
+    login_name='foo', password='b<a>r&', language='en')
+
+ACTION_PARAMS = dict(
+    start=DateTime.get(2014, 1, 1, tzinfo='UTC'),
+    end=DateTime.get(2014, 1, 2, tzinfo='UTC'))
+
+
+###
+### g4s.cbgrn.template.SoapRequestTemplateRegistry
+###
+
+def test__SoapRequestTemplateRegistry__init__raises_ArgumentNullError_if_None_is_specified():
+    with raises_argument_null_error('template_dir'):
+        SoapRequestTemplateRegistry(None)
+
+
+def test__SoapRequestTemplateRegistry__init__raises_ArgumentTypeError_if_invalid_value_is_specified():
+    with raises_argument_type_error('template_dir'):
+        SoapRequestTemplateRegistry(1)
+
+    with raises_argument_type_error('bytecode_cache_dir'):
+        SoapRequestTemplateRegistry(TEMPLATE_DIR, 1)
+
+
+def test__SoapRequestTemplateRegistry__get_template__compiles_template_only_once():
+    registry = SoapRequestTemplateRegistry(TEMPLATE_DIR)
+    template1 = registry.get_template('ScheduleService', 'ScheduleGetEvents')
+    template2 = registry.get_template('ScheduleService', 'ScheduleGetEvents')
+
+    assert template1 is template2
+
+
+def test__SoapRequestTemplateRegistry__get_template__raises_TemplateNotFound():
+    registry = SoapRequestTemplateRegistry(TEMPLATE_DIR)
+
+    with pytest.raises(jinja2.TemplateNotFound):
+        registry.get_template('FooService', 'BarAction')
+
+
+def test__SoapRequestTemplateRegistry__stores_bytecode_cache(tmpdir):
+    registry = SoapRequestTemplateRegistry(TEMPLATE_DIR, str(tmpdir))
+    registry.render('ScheduleService', 'ScheduleGetEvents', ACTION_PARAMS)
+
+    assert len(os.listdir(str(tmpdir))) == 1
+
+
+###
+### g4s.cbgrn.template functions
+###
+
+def test__format_utc_datetime__converts_date_time_to_utc():
+    dt = DateTime.get(2014, 1, 1, 9, 0, 0, 'Asia/Tokyo')
+    assert format_utc_datetime(dt) == '2014-01-01T00:00:00Z'
+
+
+def test__render_soap_envelope__escapes_header_values():
+    text = render_soap_envelope('ScheduleGetEvents', '<foo/>', **HEADER_PARAMS)
+    root = lxml.etree.fromstring(text.encode('utf-8'))
+
+    nss = dict(soap='http://www.w3.org/2003/05/soap-envelope')
+    assert root.xpath('//Password/text()') == ['b<a>r&']
+    assert root.xpath('//*[local-name()="Created"]/text()') == ['2014-01-01T00:00:00Z']
+    assert root.xpath('//*[local-name()="Expires"]/text()') == ['2014-01-02T00:00:00Z']
+    assert root.xpath('/soap:Envelope/soap:Body/foo', namespaces=nss)
+
+
+def test__render_soap_request__renders_action_body():
+    text = render_soap_request('ScheduleService', 'ScheduleGetEvents', HEADER_PARAMS, ACTION_PARAMS)
+    root = lxml.etree.fromstring(text.encode('utf-8'))
+
+    nss = dict(base='http://wsdl.cybozu.co.jp/base/2008')
+    node, = root.xpath('//base:ScheduleGetEvents/base:parameters', namespaces=nss)
+    assert node.attrib['start'] == '2014-01-01T00:00:00Z'
+    assert node.attrib['end'] == '2014-01-02T00:00:00Z'
+
+
+def test__configure_bytecode_cache__replaces_registry(monkeypatch, tmpdir):
+    monkeypatch.setattr(g4s.cbgrn.template, '_registry', g4s.cbgrn.template._registry)
+    configure_bytecode_cache(str(tmpdir))
+    render_soap_request('ScheduleService', 'ScheduleGetEvents', HEADER_PARAMS, ACTION_PARAMS)
+
+    assert len(os.listdir(str(tmpdir))) == 1
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import jinja2
+import pytest
+import g4s.cbgrn.api
+from g4s.cbgrn.api import CybozuGaroonApi
+from g4s.core.date import DateTime
+from g4s.core.model import Participant
+from .util import parse_xml
+from .util import read
+
+numpy = pytest.importorskip('numpy')
+vectorized = pytest.importorskip('g4s.cbgrn.vectorized')
+
+
+###
+### utilities
+###
+
+def create_repeat_rule(
+        type, day=0, week=0, start_time=(9, 0, 0), end_time=(10, 0, 0), all_day=False,
+        start_only=False, exclusive_datetimes=(), tz_name='Asia/Tokyo',
+        start_date=datetime.date(2014, 1, 1), end_date=datetime.date(2018, 12, 31)):
+
+    return g4s.cbgrn.api._RepeatEventRule(
+        1, 'meeting', None, all_day, start_only, (Participant(1, 'foo'), ), True,
+        DateTime.get(2014, 1, 1, tzinfo=tz_name), tz_name, tz_name, type, day, week,
+        start_date, end_date, start_time, end_time, exclusive_datetimes)
+
+
+def resolve_with_scalar_expander(rule, start, end):
+    g4s.cbgrn.api._occurrence_cache.clear()
+    return [(e.start, e.end, e.is_allday) for e in rule.resolve(start, end)]
+
+
+def resolve_with_vectorized_expander(rule, start, end):
+    return [(e.start, e.end, e.is_allday) for e in vectorized.expand_repeat_event(rule, start, end)]
+
+
+START = DateTime.get(2014, 3, 5, 12, tzinfo='UTC')
+END = DateTime.get(2018, 11, 20, tzinfo='UTC')
+
+
+###
+### fixture
+###
+
+@pytest.fixture(autouse=True)
+def clear_occurrence_cache():
+    g4s.cbgrn.api._occurrence_cache.clear()
+
+
+###
+### g4s.cbgrn.vectorized.expand_repeat_event
+###
+
+@pytest.mark.parametrize('type,day,week', [
+    ('day', 0, 0), ('weekday', 0, 0), ('week', 0, 3), ('1stweek', 0, 0), ('2ndweek', 0, 1),
+    ('3rdweek', 0, 5), ('4thweek', 0, 6), ('lastweek', 0, 2), ('month', 15, 0), ('month', 31, 0),
+    ('month', 0, 0)])
+def test__expand_repeat_event__returns_same_occurrences_as_scalar_expander(type, day, week):
+    rule = create_repeat_rule(type, day, week)
+
+    expected = resolve_with_scalar_expander(rule, START, END)
+    assert resolve_with_vectorized_expander(rule, START, END) == expected
+    assert len(expected) > 0
+
+
+@pytest.mark.parametrize('tz_name', ['America/New_York', 'Europe/London'])
+def test__expand_repeat_event__returns_same_occurrences_across_dst_transitions(tz_name):
+    # 01:30 does not exist or is ambiguous on transition days
+    rule = create_repeat_rule('day', start_time=(1, 30, 0), end_time=(2, 30, 0), tz_name=tz_name)
+    occurrences = vectorized.expand_repeat_event(rule, START, END)
+
+    expected = list(rule.resolve(START, END))
+    assert [(e.start, e.end) for e in occurrences] == [(e.start, e.end) for e in expected]
+    assert occurrences.starts.astype('int64').tolist() == [
+        int(e.start.timestamp()) for e in expected]
+
+
+def test__expand_repeat_event__returns_same_all_day_and_start_only_occurrences():
+    all_day_rule = create_repeat_rule('weekday', start_time=None, end_time=None, all_day=True)
+    start_only_rule = create_repeat_rule('week', week=1, end_time=None, start_only=True)
+
+    for rule in (all_day_rule, start_only_rule):
+        expected = resolve_with_scalar_expander(rule, START, END)
+        assert resolve_with_vectorized_expander(rule, START, END) == expected
+
+    occurrences = vectorized.expand_repeat_event(start_only_rule, START, END)
+    assert numpy.isnat(occurrences.ends).all()
+
+
+def test__expand_repeat_event__skips_exclusive_datetimes():
+    d = lambda month, day: DateTime.get(2014, month, day, tzinfo='Asia/Tokyo')
+    exclusive_datetimes = [(d(3, 10), d(3, 11)), (d(4, 1), d(4, 8)), (d(4, 3), d(4, 10))]
+    rule = create_repeat_rule('day', exclusive_datetimes=exclusive_datetimes)
+    occurrences = vectorized.expand_repeat_event(rule, d(3, 1), d(5, 1))
+
+    expected = resolve_with_scalar_expander(rule, d(3, 1), d(5, 1))
+    assert resolve_with_vectorized_expander(rule, d(3, 1), d(5, 1)) == expected
+    assert len(occurrences) == 61 - 1 - 9
+    assert numpy.datetime64('2014-04-05') not in occurrences.dates
+
+
+def test__expand_repeat_event__creates_events_on_access(monkeypatch):
+    created = []
+    original = g4s.cbgrn.api._RepeatEventRule._create_occurrence
+
+    def my_create_occurrence(self, date):
+        created.append(date)
+        return original(self, date)
+
+    monkeypatch.setattr(
+        'g4s.cbgrn.api._RepeatEventRule._create_occurrence', my_create_occurrence)
+
+    rule = create_repeat_rule('day')
+    occurrences = vectorized.expand_repeat_event(rule, START, END)
+    assert len(occurrences) > 1000
+    assert created == []
+
+    event = occurrences[-1]
+    assert created == [datetime.date(2018, 11, 19)]
+    assert event.start == DateTime.get(2018, 11, 19, 9, tzinfo='Asia/Tokyo')
+
+
+def test__expand_repeat_event__returns_empty_occurrences_out_of_repeat():
+    rule = create_repeat_rule('day', end_date=datetime.date(2014, 1, 31))
+    occurrences = vectorized.expand_repeat_event(rule, START, END)
+
+    assert len(occurrences) == 0
+    assert list(occurrences) == []
+
+
+###
+### g4s.cbgrn.api.CybozuGaroonApi (vectorized expansion)
+###
+
+def test__CybozuGaroonApi__init__accepts_vectorized_repeat_expansion():
+    params = {'url': 'http://example.com/grn.cgi', 'user': 'foo', 'password': 'bar'}
+    api = CybozuGaroonApi(dict(params, repeat_expansion='vectorized'))
+
+    assert api._expand_repeat_event is vectorized.expand_repeat_event
+
+
+def test__CybozuGaroonApi__create_event_parser__expands_repeat_events_with_specified_function():
+    event_info = dict(
+        id=7, event_type='repeat', public_type='public', detail='daily', version=0,
+        timezone='Asia/Tokyo', end_timezone='Asia/Tokyo', allday=False, start_only=False,
+        members=[dict(id=1, name='foo', order=0)],
+        repeat_info=dict(
+            type='weekday', start_date=datetime.date(2014, 1, 1),
+            end_date=datetime.date(2019, 1, 1), start_time='09:00:00', end_time='10:00:00'))
+
+    text = read('g4s.cbgrn', 'get_events-response.xml').decode('utf-8')
+    response = parse_xml(jinja2.Template(text).render(events=[event_info]).encode('utf-8'))
+
+    def parse(expand_repeat_event):
+        g4s.cbgrn.api._occurrence_cache.clear()
+        nodes = response.iter('schedule_event')
+        return [(e.id, e.start, e.end) for e in CybozuGaroonApi._create_event_parser(
+            nodes, START, END, expand_repeat_event)]
+
+    assert parse(vectorized.expand_repeat_event) == parse(None)
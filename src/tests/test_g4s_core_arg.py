@@ -3,6 +3,7 @@
 import pytest
 from g4s.core.arg import ArgumentNullError
 from g4s.core.arg import ArgumentTypeError
+from g4s.core.arg import verify_number
 
 
 ###
@@ -44,3 +45,33 @@ def test__ArgumentTypeError__name_returns_correct_value():
 def test__ArgumentTypeError__type_returns_correct_value():
     error = ArgumentTypeError('foo', int)
     assert error.type == int
+
+
+###
+### g4s.core.arg.verify_number
+###
+
+@pytest.mark.parametrize('value,exclusive', [(1, False), (1.5, True), (0, False)])
+def test__verify_number__accepts_number_in_range(value, exclusive):
+    verify_number('foo', value, (int, float), 0, exclusive)
+
+
+def test__verify_number__raises_ArgumentNullError_if_None_is_specified():
+    with pytest.raises(ArgumentNullError) as excinfo:
+        verify_number('foo', None, int, 1)
+
+    assert excinfo.value.name == 'foo'
+
+
+@pytest.mark.parametrize('value', ['1', 1.0, True])
+def test__verify_number__raises_ArgumentTypeError_if_invalid_value_is_specified(value):
+    with pytest.raises(ArgumentTypeError) as excinfo:
+        verify_number('foo', value, int, 1)
+
+    assert excinfo.value.name == 'foo'
+
+
+@pytest.mark.parametrize('value,minimum,exclusive', [(0, 1, False), (0, 0, True), (-0.5, 0, False)])
+def test__verify_number__raises_ValueError_if_value_is_out_of_range(value, minimum, exclusive):
+    with pytest.raises(ValueError):
+        verify_number('foo', value, (int, float), minimum, exclusive)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import pytest
+from g4s.core.cache import FileCache
+from g4s.core.cache import MemoryCache
+from .util import FakeClock
+from .util import raises_argument_null_error
+from .util import raises_argument_type_error
+
+
+###
+### g4s.core.cache.MemoryCache
+###
+
+@pytest.mark.parametrize('ttl', ['60', object(), True])
+def test__MemoryCache__init__raises_ArgumentTypeError_if_invalid_ttl_is_specified(ttl):
+    with raises_argument_type_error('ttl'):
+        MemoryCache(ttl=ttl)
+
+
+def test__MemoryCache__init__raises_ValueError_if_negative_ttl_is_specified():
+    with pytest.raises(ValueError):
+        MemoryCache(ttl=-1)
+
+
+@pytest.mark.parametrize('max_size', ['10', 1.5, True])
+def test__MemoryCache__init__raises_ArgumentTypeError_if_invalid_max_size_is_specified(max_size):
+    with raises_argument_type_error('max_size'):
+        MemoryCache(max_size=max_size)
+
+
+def test__MemoryCache__init__raises_ValueError_if_non_positive_max_size_is_specified():
+    with pytest.raises(ValueError):
+        MemoryCache(max_size=0)
+
+
+def test__MemoryCache__get__returns_default_value_if_key_is_not_found():
+    cache = MemoryCache()
+    sentinel = object()
+
+    assert cache.get('foo') is None
+    assert cache.get('foo', sentinel) is sentinel
+    assert cache.misses == 2
+    assert cache.hits == 0
+
+
+def test__MemoryCache__get__returns_cached_value():
+    cache = MemoryCache()
+    cache.set('foo', 1)
+
+    assert cache.get('foo') == 1
+    assert len(cache) == 1
+    assert cache.hits == 1
+
+
+def test__MemoryCache__get__does_not_return_expired_value():
+    clock = FakeClock()
+    cache = MemoryCache(ttl=10, clock=clock)
+    cache.set('foo', 1)
+    cache.set('bar', 2, ttl=None)
+
+    clock.now += 9
+    assert cache.get('foo') == 1
+
+    clock.now += 1
+    assert cache.get('foo') is None
+    assert cache.get('bar') == 2
+    assert len(cache) == 1
+
+
+def test__MemoryCache__set__evicts_least_recently_used_entry():
+    cache = MemoryCache(max_size=2)
+    cache.set('foo', 1)
+    cache.set('bar', 2)
+    cache.get('foo')
+    cache.set('baz', 3)
+
+    assert cache.get('bar') is None
+    assert cache.get('foo') == 1
+    assert cache.get('baz') == 3
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+
+def test__MemoryCache__set__does_not_evict_entry_when_existing_key_is_updated():
+    cache = MemoryCache(max_size=2)
+    cache.set('foo', 1)
+    cache.set('bar', 2)
+    cache.set('foo', 3)
+
+    assert cache.get('foo') == 3
+    assert cache.get('bar') == 2
+    assert cache.evictions == 0
+
+
+def test__MemoryCache__invalidate__removes_entry():
+    cache = MemoryCache()
+    cache.set('foo', 1)
+    cache.invalidate('foo')
+    cache.invalidate('bar')
+
+    assert cache.get('foo') is None
+
+
+def test__MemoryCache__invalidate_if__removes_entries_whose_keys_satisfy_predicate():
+    cache = MemoryCache()
+    cache.set(('a', 1), 1)
+    cache.set(('b', 2), 2)
+    cache.set(('a', 3), 3)
+
+    assert cache.invalidate_if(lambda key: key[0] == 'a') == 2
+    assert len(cache) == 1
+    assert cache.get(('b', 2)) == 2
+
+
+def test__MemoryCache__clear__removes_all_entries_and_resets_counters():
+    cache = MemoryCache()
+    cache.set('foo', 1)
+    cache.get('foo')
+    cache.get('bar')
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+
+###
+### g4s.core.cache.FileCache
+###
+
+def test__FileCache__init__raises_ArgumentNullError_if_None_is_specified():
+    with raises_argument_null_error('directory'):
+        FileCache(None)
+
+
+def test__FileCache__init__raises_ArgumentTypeError_if_invalid_directory_is_specified():
+    with raises_argument_type_error('directory'):
+        FileCache(1)
+
+
+def test__FileCache__init__creates_directory_which_only_owner_can_access(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = FileCache(directory)
+    cache.set('foo', 1)
+
+    name, = os.listdir(directory)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(os.path.join(directory, name)).st_mode) == 0o600
+
+
+def test__FileCache__salt__is_shared_by_instances_for_same_directory(tmpdir):
+    cache = FileCache(str(tmpdir.join('foo')))
+    salt = cache.salt
+    cache.set('foo', 1)
+    cache.clear()
+
+    assert len(salt) == 16
+    assert FileCache(str(tmpdir.join('foo'))).salt == salt
+    assert FileCache(str(tmpdir.join('bar'))).salt != salt
+
+
+def test__FileCache__get__returns_value_stored_by_another_instance(tmpdir):
+    FileCache(str(tmpdir)).set('foo', {'bar': 1})
+
+    assert FileCache(str(tmpdir)).get('foo') == {'bar': 1}
+    assert FileCache(str(tmpdir)).get('bar') is None
+
+
+def test__FileCache__get__counts_hits_and_misses(tmpdir):
+    cache = FileCache(str(tmpdir))
+    cache.set('foo', 1)
+    cache.get('foo')
+    cache.get('bar')
+
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test__FileCache__get__does_not_return_expired_value(tmpdir):
+    clock = FakeClock()
+    cache = FileCache(str(tmpdir), ttl=10, clock=clock)
+    cache.set('foo', 1)
+
+    clock.now += 10
+    assert cache.get('foo') is None
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test__FileCache__get__returns_default_value_if_entry_is_corrupted(tmpdir):
+    cache = FileCache(str(tmpdir))
+    cache.set('foo', 1)
+
+    name, = os.listdir(str(tmpdir))
+    with open(os.path.join(str(tmpdir), name), 'wb') as fout:
+        fout.write(b'broken')
+
+    assert cache.get('foo', 2) == 2
+
+
+def test__FileCache__invalidate_and_clear__remove_entries(tmpdir):
+    cache = FileCache(str(tmpdir))
+    cache.set('foo', 1)
+    cache.set('bar', 2)
+    cache.set('baz', 3)
+
+    cache.invalidate('foo')
+    cache.invalidate('qux')
+    assert cache.get('foo') is None
+    assert cache.get('bar') == 2
+
+    cache.clear()
+    assert cache.get('bar') is None
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test__FileCache__invalidate_if__removes_entries_whose_keys_satisfy_predicate(tmpdir):
+    cache = FileCache(str(tmpdir))
+    cache.set(('foo', 1), 1)
+    cache.set(('foo', 2), 2)
+    cache.set(('bar', 1), 3)
+    cache.set('baz', 4)
+
+    assert cache.invalidate_if(lambda key: key[0] == 'foo') == 2
+    assert cache.get(('foo', 1)) is None
+    assert cache.get(('bar', 1)) == 3
+    assert cache.get('baz') == 4
+
+
+def test__FileCache__clear__ignores_entries_removed_by_another_process(tmpdir, monkeypatch):
+    cache = FileCache(str(tmpdir))
+    cache.set('foo', 1)
+    cache.set('bar', 2)
+
+    # another process removes all the entries while they are being listed
+    original = os.listdir
+
+    def my_listdir(path):
+        names = original(path)
+        for name in names:
+            os.remove(os.path.join(path, name))
+        return names
+
+    monkeypatch.setattr('os.listdir', my_listdir)
+    cache.clear()
+    cache.invalidate_if(lambda key: True)
+
+    assert original(str(tmpdir)) == []
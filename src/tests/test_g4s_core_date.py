@@ -2,6 +2,7 @@
 
 import datetime
 import dateutil.tz
+import pickle
 import pytest
 from g4s.core.arg import ArgumentNullError
 from g4s.core.arg import ArgumentTypeError
@@ -297,6 +298,15 @@ def test__TimeZone__get__returns_correct_result(name):
     assert tz.g4s_name == name
 
 
+def test__TimeZone__can_be_pickled():
+    dt = DateTime.get(2014, 1, 2, 3, 4, 5, tzinfo='Asia/Tokyo')
+    restored = pickle.loads(pickle.dumps(dt))
+
+    assert restored == dt
+    assert restored.tzinfo == TimeZone.get('Asia/Tokyo')
+    assert restored.utcoffset() == datetime.timedelta(hours=9)
+
+
 ###
 ### g4s.core.date.TimeZoneNotFoundError
 ###
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import os
+import urllib.request
+import pytest
+import g4s.cbgrn.api
+import g4s.core.sync
+from g4s.core.metrics import MetricsRegistry
+from g4s.core.metrics import get_registry
+from .util import raises_argument_null_error
+from .util import raises_argument_type_error
+
+
+###
+### g4s.core.metrics.Counter
+###
+
+def test__Counter__inc__increases_value_of_labels():
+    counter = MetricsRegistry().counter('foo_total', 'Foo.', ('action', ))
+    counter.inc(action='a')
+    counter.inc(2, action='a')
+    counter.inc(action='b')
+
+    assert counter.get(action='a') == 3
+    assert counter.get(action='b') == 1
+    assert counter.get(action='c') == 0
+
+
+def test__Counter__inc__raises_ValueError_if_amount_is_negative():
+    counter = MetricsRegistry().counter('foo_total', 'Foo.')
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+
+
+@pytest.mark.parametrize('labels', [{}, {'foo': 'a'}, {'action': 'a', 'foo': 'b'}])
+def test__Counter__inc__raises_ValueError_if_labels_do_not_match(labels):
+    counter = MetricsRegistry().counter('foo_total', 'Foo.', ('action', ))
+    with pytest.raises(ValueError):
+        counter.inc(**labels)
+
+
+###
+### g4s.core.metrics.Gauge
+###
+
+def test__Gauge__set__inc__and__dec__update_value():
+    gauge = MetricsRegistry().gauge('foo', 'Foo.')
+    gauge.set(10)
+    gauge.inc(3)
+    gauge.dec(5)
+
+    assert gauge.get() == 8
+
+
+###
+### g4s.core.metrics.Histogram
+###
+
+def test__Histogram__observe__counts_values_in_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('foo_seconds', 'Foo.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.get_count() == 4
+    assert histogram.get_sum() == pytest.approx(5.65)
+    assert registry.render() == (
+        '# HELP foo_seconds Foo.\n'
+        '# TYPE foo_seconds histogram\n'
+        'foo_seconds_bucket{le="0.1"} 2\n'
+        'foo_seconds_bucket{le="1.0"} 3\n'
+        'foo_seconds_bucket{le="+Inf"} 4\n'
+        'foo_seconds_sum 5.65\n'
+        'foo_seconds_count 4\n')
+
+
+def test__Histogram__time__observes_elapsed_time_even_if_exception_is_raised():
+    histogram = MetricsRegistry().histogram('foo_seconds', 'Foo.', ('action', ))
+    with pytest.raises(ZeroDivisionError):
+        with histogram.time(action='a'):
+            1 / 0
+
+    assert histogram.get_count(action='a') == 1
+    assert histogram.get_sum(action='a') >= 0
+
+
+###
+### g4s.core.metrics.MetricsRegistry
+###
+
+def test__MetricsRegistry__counter__returns_same_metric_for_same_name():
+    registry = MetricsRegistry()
+    assert registry.counter('foo_total', 'Foo.') is registry.counter('foo_total', 'Foo.')
+    assert registry.get('foo_total') is registry.counter('foo_total', 'Foo.')
+    assert registry.get('bar_total') is None
+
+
+def test__MetricsRegistry__gauge__raises_ValueError_if_name_is_registered_with_other_type():
+    registry = MetricsRegistry()
+    registry.counter('foo_total', 'Foo.')
+    with pytest.raises(ValueError):
+        registry.gauge('foo_total', 'Foo.')
+    with pytest.raises(ValueError):
+        registry.counter('foo_total', 'Foo.', ('action', ))
+
+
+def test__MetricsRegistry__counter__raises_ArgumentNullError_if_name_is_None():
+    with raises_argument_null_error('name'):
+        MetricsRegistry().counter(None, 'Foo.')
+
+
+def test__MetricsRegistry__counter__raises_ArgumentTypeError_if_name_is_not_str():
+    with raises_argument_type_error('name'):
+        MetricsRegistry().counter(b'foo', 'Foo.')
+
+
+@pytest.mark.parametrize('name,label_names', [
+    ('foo-bar', ()), ('1foo', ()), ('foo', ('le-gt', )), ('foo', ('1a', ))])
+def test__MetricsRegistry__counter__raises_ValueError_if_name_is_invalid(name, label_names):
+    with pytest.raises(ValueError):
+        MetricsRegistry().counter(name, 'Foo.', label_names)
+
+
+def test__MetricsRegistry__render__renders_metrics_in_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.gauge('foo', 'Foo\nbar.').set(1.5)
+    counter = registry.counter('bar_total', 'Bar.', ('action', 'result'))
+    counter.inc(action='b', result='x')
+    counter.inc(3, action='a', result='say "hi"\\\n')
+
+    assert registry.render() == (
+        '# HELP bar_total Bar.\n'
+        '# TYPE bar_total counter\n'
+        'bar_total{action="a",result="say \\"hi\\"\\\\\\n"} 3\n'
+        'bar_total{action="b",result="x"} 1\n'
+        '# HELP foo Foo\\nbar.\n'
+        '# TYPE foo gauge\n'
+        'foo 1.5\n')
+
+
+def test__MetricsRegistry__reset__resets_values():
+    registry = MetricsRegistry()
+    counter = registry.counter('foo_total', 'Foo.')
+    counter.inc()
+    registry.reset()
+
+    assert counter.get() == 0
+    assert registry.get('foo_total') is counter
+
+
+def test__MetricsRegistry__write__writes_metrics_to_file(tmpdir):
+    registry = MetricsRegistry()
+    registry.counter('foo_total', 'Foo.').inc()
+
+    path = str(tmpdir.join('g4s.prom'))
+    registry.write(path)
+    registry.write(path)
+
+    with open(path) as fin:
+        assert fin.read() == registry.render()
+    assert os.listdir(str(tmpdir)) == ['g4s.prom']
+
+
+def test__MetricsRegistry__write__raises_ArgumentTypeError_if_path_is_not_str():
+    with raises_argument_type_error('path'):
+        MetricsRegistry().write(1)
+
+
+def test__MetricsRegistry__serve__serves_metrics_over_http():
+    registry = MetricsRegistry()
+    counter = registry.counter('foo_total', 'Foo.')
+
+    server = registry.serve()
+    try:
+        counter.inc()
+        with urllib.request.urlopen(server.url) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert response.read().decode('utf-8') == registry.render()
+    finally:
+        server.close()
+
+
+def test__get_registry__returns_registry_of_g4s_metrics():
+    registry = get_registry()
+    assert registry is get_registry()
+    assert registry.get('g4s_events_fetched_total') is g4s.cbgrn.api._events_fetched
+    assert registry.get('g4s_events_mapped_total') is g4s.core.sync._events_mapped
+    assert registry.get('g4s_retries_total') is not None
@@ -8,6 +8,7 @@ from g4s.core.date import DateTime
 from g4s.core.model import Event
 from g4s.core.model import InvalidEventDateTimePairError
 from g4s.core.model import Participant
+from g4s.core.model import ParticipantPool
 from .util import raises_argument_null_error
 from .util import raises_argument_type_error
 
@@ -37,6 +38,46 @@ def test__Participant__name__returns_correct_result():
     assert p.name == 'foo'
 
 
+###
+### g4s.core.model.ParticipantPool
+###
+
+def test__ParticipantPool__get__returns_shared_participant():
+    pool = ParticipantPool()
+    participant = pool.get(1, 'foo')
+
+    assert (participant.id, participant.name) == (1, 'foo')
+    assert pool.get(1, 'foo') is participant
+    assert pool.get(1, 'bar') is not participant
+    assert len(pool) == 2
+
+
+def test__ParticipantPool__get__raises_ArgumentNullError_if_None_is_passed_as_name():
+    with raises_argument_null_error('name'):
+        ParticipantPool().get(1, None)
+
+
+def test__ParticipantPool__get_members__returns_shared_tuple():
+    pool = ParticipantPool()
+    members1 = pool.get_members([(1, 'foo'), (2, 'bar')])
+    members2 = pool.get_members(iter([(1, 'foo'), (2, 'bar')]))
+    members3 = pool.get_members([(2, 'bar'), (1, 'foo')])
+
+    assert members2 is members1
+    assert members3 is not members1
+    assert members3[0] is members1[1]
+    assert [p.name for p in members3] == ['bar', 'foo']
+
+
+def test__ParticipantPool__clear__removes_participants():
+    pool = ParticipantPool()
+    participant = pool.get(1, 'foo')
+    pool.clear()
+
+    assert len(pool) == 0
+    assert pool.get(1, 'foo') is not participant
+
+
 ###
 ### g4s.core.model.Event.__init__
 ###
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from g4s.core.api import NetworkError
+from g4s.core.api import RequestError
+from g4s.core.retry import CircuitBreaker
+from g4s.core.retry import CircuitOpenError
+from g4s.core.retry import RetryPolicy
+from .util import FakeClock
+from .util import raises_argument_null_error
+from .util import raises_argument_type_error
+
+
+###
+### utilities
+###
+
+def create_flaky_function(failures, exception=NetworkError):
+    calls = []
+
+    def function(value):
+        calls.append(value)
+        if len(calls) <= failures:
+            raise exception
+
+        return value
+
+    return function, calls
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('time.sleep', sleeps.append)
+    return sleeps
+
+
+###
+### g4s.core.retry.RetryPolicy
+###
+
+@pytest.mark.parametrize('name', ['max_attempts', 'base_delay', 'max_delay'])
+def test__RetryPolicy__init__raises_ArgumentNullError_if_None_is_specified(name):
+    with raises_argument_null_error(name):
+        RetryPolicy(**{name: None})
+
+
+@pytest.mark.parametrize('name', ['max_attempts', 'base_delay', 'max_delay'])
+def test__RetryPolicy__init__raises_ArgumentTypeError_if_invalid_value_is_specified(name):
+    with raises_argument_type_error(name):
+        RetryPolicy(**{name: '1'})
+
+
+@pytest.mark.parametrize('name,value', [('max_attempts', 0), ('base_delay', -1), ('max_delay', -1)])
+def test__RetryPolicy__init__raises_ValueError_if_out_of_range_value_is_specified(name, value):
+    with pytest.raises(ValueError):
+        RetryPolicy(**{name: value})
+
+
+def test__RetryPolicy__get_delay__returns_exponential_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=5, jitter=False)
+    assert [policy.get_delay(r) for r in range(1, 6)] == [1, 2, 4, 5, 5]
+
+
+def test__RetryPolicy__get_delay__returns_jittered_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for retry in range(1, 6):
+        assert 0 <= policy.get_delay(retry) <= min(5, 2 ** (retry - 1))
+
+
+def test__RetryPolicy__call__retries_until_success(no_sleep):
+    function, calls = create_flaky_function(2)
+    policy = RetryPolicy(max_attempts=3, base_delay=1, jitter=False)
+
+    assert policy.call(function, 'foo') == 'foo'
+    assert len(calls) == 3
+    assert no_sleep == [1, 2]
+    assert policy.retries == 2
+    assert policy.failures == 0
+
+
+def test__RetryPolicy__call__raises_error_after_all_attempts_failed():
+    function, calls = create_flaky_function(3)
+    policy = RetryPolicy(max_attempts=3)
+
+    with pytest.raises(NetworkError):
+        policy.call(function, 'foo')
+
+    assert len(calls) == 3
+    assert policy.failures == 1
+
+
+@pytest.mark.parametrize('exception', [RequestError, CircuitOpenError])
+def test__RetryPolicy__call__does_not_retry_non_transient_errors(exception):
+    function, calls = create_flaky_function(1, exception)
+    policy = RetryPolicy(max_attempts=3)
+
+    with pytest.raises(exception):
+        policy.call(function, 'foo')
+
+    assert len(calls) == 1
+    assert policy.retries == 0
+
+
+###
+### g4s.core.retry.CircuitBreaker
+###
+
+@pytest.mark.parametrize('name,value', [('failure_threshold', 0), ('reset_timeout', -1)])
+def test__CircuitBreaker__init__raises_ValueError_if_out_of_range_value_is_specified(name, value):
+    with pytest.raises(ValueError):
+        CircuitBreaker(**{name: value})
+
+
+def test__CircuitBreaker__call__opens_circuit_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=FakeClock())
+    function, calls = create_flaky_function(100)
+
+    for x in range(2):
+        with pytest.raises(NetworkError):
+            breaker.call(function, x)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(function, 2)
+
+    assert len(calls) == 2
+    assert breaker.failures == 2
+    assert breaker.rejections == 1
+    assert breaker.trips == 1
+
+
+def test__CircuitBreaker__call__resets_failure_count_after_success():
+    breaker = CircuitBreaker(failure_threshold=2)
+    function, calls = create_flaky_function(1)
+
+    with pytest.raises(NetworkError):
+        breaker.call(function, 0)
+    breaker.call(function, 1)
+
+    function, calls = create_flaky_function(1)
+    with pytest.raises(NetworkError):
+        breaker.call(function, 2)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test__CircuitBreaker__call__allows_trial_call_after_reset_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    function, calls = create_flaky_function(2)
+
+    with pytest.raises(NetworkError):
+        breaker.call(function, 0)
+
+    # the trial call fails, the circuit is opened again
+    clock.now += 10
+    with pytest.raises(NetworkError):
+        breaker.call(function, 1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # the trial call succeeds, the circuit is closed
+    clock.now += 10
+    assert breaker.call(function, 2) == 2
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.trips == 2
+
+
+def test__CircuitBreaker__before_call__rejects_calls_during_trial_call():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 10
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+@pytest.mark.parametrize('exception', [RequestError, KeyboardInterrupt])
+def test__CircuitBreaker__call__allows_another_trial_call_if_trial_call_is_not_completed(
+        exception):
+
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    function, calls = create_flaky_function(1, exception)
+
+    clock.now += 10
+    with pytest.raises(exception):
+        breaker.call(function, 0)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.call(function, 1) == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test__CircuitBreaker__before_call__returns_whether_call_is_trial_call():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    assert not breaker.before_call()
+
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.before_call()
+
+    breaker.release_trial()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.before_call()
+
+
+def test__CircuitBreaker__configure__changes_thresholds_without_closing_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    breaker.configure(failure_threshold=3, reset_timeout=20)
+    assert breaker.failure_threshold == 3
+    assert breaker.reset_timeout == 20
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
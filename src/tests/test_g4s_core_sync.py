@@ -2,6 +2,7 @@
 
 import mock
 import pytest
+import g4s.core.sync
 from g4s.core.arg import ArgumentNullError
 from g4s.core.arg import ArgumentTypeError
 from g4s.core.date import DateTime
@@ -9,6 +10,8 @@ from g4s.core.model import Event
 from g4s.core.model import Participant
 from g4s.core.sync import EventMappingError
 from g4s.core.sync import perform_event_mapping
+from g4s.core.trace import MemorySpanExporter
+from g4s.core.trace import get_tracer
 from .util import raises_argument_null_error
 
 
@@ -141,6 +144,35 @@ def test__perform_event_mapping__returns_correct_result(
         assert event in c2only
 
 
+def test__perform_event_mapping__records_metrics():
+    mapped = g4s.core.sync._events_mapped
+    counts = dict((r, mapped.get(result=r)) for r in ('common', 'calendar1_only', 'calendar2_only'))
+    durations = g4s.core.sync._mapping_duration.get_count()
+
+    perform_event_mapping([EVENT1, EVENT5], [EVENT2, EVENT4])
+
+    assert mapped.get(result='common') == counts['common'] + 1
+    assert mapped.get(result='calendar1_only') == counts['calendar1_only'] + 1
+    assert mapped.get(result='calendar2_only') == counts['calendar2_only'] + 1
+    assert g4s.core.sync._mapping_duration.get_count() == durations + 1
+
+
+def test__perform_event_mapping__traces_mapping():
+    exporter = MemorySpanExporter()
+    get_tracer().add_exporter(exporter)
+    try:
+        perform_event_mapping([EVENT1, EVENT5], [EVENT2, EVENT4])
+    finally:
+        get_tracer().remove_exporter(exporter)
+
+    span, = exporter.spans
+    assert span.name == 'g4s.perform_event_mapping'
+    assert span.attributes == {
+        'g4s.calendar1_event_count': 2, 'g4s.calendar2_event_count': 2,
+        'g4s.common_event_count': 1, 'g4s.calendar1_only_event_count': 1,
+        'g4s.calendar2_only_event_count': 1}
+
+
 ###
 ### g4s.core.sync.EventMappingError
 ###
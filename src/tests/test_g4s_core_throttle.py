@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+import pytest
+import g4s.core.throttle
+from g4s.core.throttle import Throttle
+from .util import FakeClock
+from .util import raises_argument_type_error
+
+
+###
+### g4s.core.throttle.Throttle
+###
+
+@pytest.mark.parametrize('name', ['max_concurrency', 'rate', 'burst'])
+def test__Throttle__init__raises_ArgumentTypeError_if_invalid_value_is_specified(name):
+    with raises_argument_type_error(name):
+        Throttle(**{name: '1'})
+
+
+@pytest.mark.parametrize('name,value', [('max_concurrency', 0), ('rate', 0), ('burst', -1)])
+def test__Throttle__init__raises_ValueError_if_non_positive_value_is_specified(name, value):
+    with pytest.raises(ValueError):
+        Throttle(**{name: value})
+
+
+def test__Throttle__acquire__does_not_wait_without_limits():
+    throttle = Throttle()
+    for _ in range(100):
+        assert throttle.acquire() == 0
+
+    assert throttle.active == 100
+    assert throttle.acquisitions == 100
+    assert throttle.waits == 0
+
+
+def test__Throttle__acquire__consumes_tokens_refilled_at_specified_rate():
+    clock = FakeClock()
+    throttle = Throttle(rate=2, burst=3, clock=clock)
+
+    # the bucket is full at first, and is refilled while the clock advances
+    for _ in range(3):
+        throttle.acquire()
+        throttle.release()
+
+    assert throttle._try_acquire() == pytest.approx(0.5)
+
+    clock.now += 1.0
+    assert throttle._try_acquire() == 0
+    assert throttle._try_acquire() == 0
+    assert throttle._try_acquire() == pytest.approx(0.5)
+
+
+def test__Throttle__acquire__waits_until_token_is_available():
+    throttle = Throttle(rate=20, burst=1)
+
+    started = time.monotonic()
+    for _ in range(4):
+        with throttle.limit():
+            pass
+
+    assert time.monotonic() - started >= 0.14
+    assert throttle.acquisitions == 4
+    assert throttle.waits == 3
+    assert throttle.total_wait_time >= 0.14
+    assert 0 < throttle.max_wait_time <= throttle.total_wait_time
+
+
+def test__Throttle__acquire__limits_number_of_concurrent_callers():
+    throttle = Throttle(max_concurrency=2)
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def work():
+        with throttle.limit():
+            with lock:
+                active.append(None)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    assert throttle.active == 0
+    assert throttle.acquisitions == 8
+    assert throttle.waits >= 6
+
+
+def test__Throttle__acquire_async__limits_number_of_concurrent_coroutines():
+    throttle = Throttle(max_concurrency=3, rate=1000)
+    active = []
+    peak = []
+
+    async def work():
+        async with throttle.limit_async():
+            active.append(None)
+            peak.append(len(active))
+            await asyncio.sleep(0.02)
+            active.pop()
+
+    async def main():
+        await asyncio.gather(*[work() for _ in range(9)])
+
+    asyncio.run(main())
+
+    assert max(peak) == 3
+    assert throttle.active == 0
+    assert throttle.acquisitions == 9
+    assert throttle.waits >= 6
+
+
+def test__Throttle__acquire__records_metrics_of_waits_and_slots():
+    throttle = Throttle(max_concurrency=1)
+    wait_duration = g4s.core.throttle._wait_duration
+    waiting_requests = g4s.core.throttle._waiting_requests
+    active_requests = g4s.core.throttle._active_requests
+    count, total = wait_duration.get_count(), wait_duration.get_sum()
+    active = active_requests.get()
+
+    def work():
+        with throttle.limit():
+            pass
+
+    throttle.acquire()
+    thread = threading.Thread(target=work)
+    thread.start()
+
+    # the thread waits until the slot is released
+    deadline = time.monotonic() + 5
+    while waiting_requests.get() == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    assert waiting_requests.get() == 1
+    assert active_requests.get() == active + 1
+
+    throttle.release()
+    thread.join()
+
+    assert waiting_requests.get() == 0
+    assert active_requests.get() == active
+    assert wait_duration.get_count() == count + 2
+    assert wait_duration.get_sum() > total
+
+
+def test__Throttle__configure__limits_throttle_in_use():
+    throttle = Throttle()
+    throttle.acquire()
+
+    throttle.configure(max_concurrency=2, rate=5)
+    assert throttle.max_concurrency == 2
+    assert throttle.rate == 5
+
+    throttle.acquire()
+    assert throttle.active == 2
+    assert throttle._try_acquire() is None
+
+
+def test__Throttle__release__raises_ValueError_if_not_acquired():
+    throttle = Throttle(max_concurrency=1)
+    with throttle.limit():
+        pass
+
+    with pytest.raises(ValueError):
+        throttle.release()
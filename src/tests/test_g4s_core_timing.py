@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from g4s.core.timing import RequestTimings
+from .util import FakeClock
+
+
+###
+### g4s.core.timing.RequestTimings
+###
+
+def test__RequestTimings__lap__adds_elapsed_time_to_phase():
+    clock = FakeClock()
+    timings = RequestTimings('ScheduleService', 'ScheduleGetEvents', clock=clock)
+
+    for phase, seconds in [('render', 1), ('send', 2), ('parse', 3), ('send', 4)]:
+        clock.now += seconds
+        timings.lap(phase)
+
+    assert timings.phases == dict(render=1, send=6, receive=0, parse=3, convert=0)
+    assert timings['send'] == 6
+    assert timings.total == 10
+
+
+def test__RequestTimings__move__moves_time_within_source_phase():
+    clock = FakeClock()
+    timings = RequestTimings('ScheduleService', 'ScheduleGetEvents', clock=clock)
+    clock.now += 5
+    timings.lap('send')
+
+    timings.move('send', 'receive', 2)
+    assert (timings['send'], timings['receive']) == (3, 2)
+
+    timings.move('send', 'receive', 10)
+    timings.move('receive', 'send', -1)
+    assert (timings['send'], timings['receive']) == (0, 5)
+    assert timings.total == 5
+
+
+def test__RequestTimings__lap__raises_KeyError_if_unknown_phase_is_specified():
+    timings = RequestTimings('ScheduleService', 'ScheduleGetEvents')
+
+    with pytest.raises(KeyError):
+        timings.lap('foo')
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import threading
+import pytest
+from g4s.core.trace import JsonLinesSpanExporter
+from g4s.core.trace import MemorySpanExporter
+from g4s.core.trace import Tracer
+from g4s.core.trace import get_tracer
+from .util import raises_argument_null_error
+from .util import raises_argument_type_error
+
+
+###
+### fixture
+###
+
+@pytest.fixture
+def exporter():
+    return MemorySpanExporter()
+
+
+@pytest.fixture
+def tracer(exporter):
+    tracer = Tracer()
+    tracer.add_exporter(exporter)
+    return tracer
+
+
+###
+### g4s.core.trace.Tracer
+###
+
+def test__Tracer__start_span__returns_span_which_does_nothing_without_exporters():
+    tracer = Tracer()
+    assert not tracer.enabled
+
+    with tracer.start_span('foo', {'a': 1}) as span:
+        span.set_attribute('b', 2)
+        span.add_event('c')
+        assert not span.is_recording
+        assert not tracer.get_current_span().is_recording
+
+
+def test__Tracer__start_span__creates_child_of_current_span(tracer, exporter):
+    with tracer.start_span('parent') as parent:
+        with tracer.start_span('child', {'a': 1}) as child:
+            assert tracer.get_current_span() is child
+        assert tracer.get_current_span() is parent
+
+    orphan = tracer.start_span('orphan')
+    orphan.end()
+
+    assert [s.name for s in exporter.spans] == ['child', 'parent', 'orphan']
+    assert child.trace_id == parent.trace_id
+    assert child.parent_span_id == parent.span_id
+    assert child.attributes == {'a': 1}
+    assert parent.parent_span_id is None
+    assert orphan.trace_id != parent.trace_id
+    assert len(parent.trace_id) == 32 and len(parent.span_id) == 16
+
+
+def test__Tracer__start_span__records_exception_raised_in_span(tracer, exporter):
+    with pytest.raises(ZeroDivisionError):
+        with tracer.start_span('foo'):
+            1 / 0
+
+    span, = exporter.spans
+    assert span.status == 'ERROR'
+    assert span.status_message.startswith('ZeroDivisionError: ')
+    assert span.events[0]['name'] == 'exception'
+    assert span.events[0]['attributes']['exception.type'] == 'ZeroDivisionError'
+
+
+def test__Tracer__start_span__does_not_make_span_current_unless_it_is_entered(tracer, exporter):
+    span = tracer.start_span('foo')
+    assert not tracer.get_current_span().is_recording
+
+    span.end()
+    span.end()
+    assert exporter.spans == [span]
+    assert span.status == 'OK'
+    assert span.duration >= 0
+
+
+def test__Tracer__bind__propagates_current_span_to_other_threads(tracer, exporter):
+    def work():
+        with tracer.start_span('child'):
+            pass
+
+    with tracer.start_span('parent') as parent:
+        threads = [threading.Thread(target=tracer.bind(work)) for x in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    children = [s for s in exporter.spans if s.name == 'child']
+    assert len(children) == 3
+    assert all(s.parent_span_id == parent.span_id for s in children)
+
+
+def test__Tracer__start_span__separates_spans_of_concurrent_coroutines(tracer, exporter):
+    async def work(name):
+        with tracer.start_span(name):
+            await asyncio.sleep(0.01)
+            with tracer.start_span(name + '.child'):
+                pass
+
+    async def main():
+        await asyncio.gather(work('a'), work('b'))
+
+    asyncio.run(main())
+
+    spans = dict((s.name, s) for s in exporter.spans)
+    assert spans['a.child'].parent_span_id == spans['a'].span_id
+    assert spans['b.child'].parent_span_id == spans['b'].span_id
+
+
+def test__Tracer__add_exporter__raises_ArgumentNullError_if_None_is_specified():
+    with raises_argument_null_error('exporter'):
+        Tracer().add_exporter(None)
+
+
+def test__Tracer__add_exporter__raises_ArgumentTypeError_if_invalid_exporter_is_specified():
+    with raises_argument_type_error('exporter'):
+        Tracer().add_exporter(object())
+
+
+def test__Tracer__remove_exporter__disables_tracing(tracer, exporter):
+    tracer.remove_exporter(exporter)
+
+    assert not tracer.enabled
+    assert not tracer.start_span('foo').is_recording
+
+
+def test__get_tracer__returns_process_wide_tracer():
+    assert get_tracer() is get_tracer()
+
+
+###
+### g4s.core.trace.Span
+###
+
+def test__Span__to_dict__returns_span_in_opentelemetry_shape(tracer):
+    with tracer.start_span('foo', {'g4s.event_count': 3}) as span:
+        span.add_event('g4s.cache_hit', {'a': 1})
+
+    document = span.to_dict()
+    assert document['name'] == 'foo'
+    assert document['trace_id'] == span.trace_id
+    assert document['parent_span_id'] is None
+    assert document['end_time_unix_nano'] >= document['start_time_unix_nano']
+    assert document['attributes'] == {'g4s.event_count': 3}
+    assert document['status'] == {'code': 'OK'}
+    assert [e['name'] for e in document['events']] == ['g4s.cache_hit']
+
+
+###
+### g4s.core.trace.MemorySpanExporter
+###
+
+def test__MemorySpanExporter__to_json__serializes_spans(tracer, exporter):
+    with tracer.start_span('foo'):
+        pass
+
+    assert [s['name'] for s in json.loads(exporter.to_json())] == ['foo']
+
+    exporter.clear()
+    assert exporter.spans == []
+
+
+###
+### g4s.core.trace.JsonLinesSpanExporter
+###
+
+def test__JsonLinesSpanExporter__export__appends_spans_to_file(tmpdir):
+    path = str(tmpdir.join('spans.jsonl'))
+    tracer = Tracer()
+    tracer.add_exporter(JsonLinesSpanExporter(path))
+
+    with tracer.start_span('parent'):
+        with tracer.start_span('child'):
+            pass
+
+    with open(path) as fin:
+        spans = [json.loads(line) for line in fin]
+
+    assert [s['name'] for s in spans] == ['child', 'parent']
+    assert spans[0]['parent_span_id'] == spans[1]['span_id']
+
+
+def test__JsonLinesSpanExporter__init__raises_ArgumentTypeError_if_path_is_not_str():
+    with raises_argument_type_error('path'):
+        JsonLinesSpanExporter(1)
@@ -37,6 +37,39 @@ def check_if_current_datetime_is_correctly_fixed():
     assert now == expected
 
 
+class FakeClock(object):
+    """
+    A clock which returns the time set to ``now``, for code which takes a ``clock`` function.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+###
+### Event data
+###
+
+def create_event_info(id, start, end):
+    """
+    Creates an event dict of ``get_events-response.xml`` with a single member.
+    """
+
+    return dict(
+        id=id, event_type='normal', public_type='public', detail='event{0}'.format(id),
+        version=0, timezone='UTC', end_timezone='UTC', allday=False, start_only=False,
+        members=[dict(id=1, name='foo', order=0)],
+        when=dict(start=start, end=end, has_time=True))
+
+
+def create_event_info_on_day(id, day):
+    return create_event_info(
+        id, datetime.datetime(2014, 1, day, 9), datetime.datetime(2014, 1, day, 10))
+
+
 ###
 ### Exception handling
 ###